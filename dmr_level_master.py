@@ -1,9 +1,19 @@
-import os
-import json
+import heapq
+import numpy as np
 import functions as func
 
 
-def soft_force_new(error_segment, segment_count, rs_codec_value, verbose=True):
+# Maximale Anzahl an Kandidatensequenzen, die pro Segment und Level mit RS geprüft werden (None = unbegrenzt)
+CANDIDATE_BUDGET = 20000
+
+# Ab dieser Länge einer Inkonsistenzkette wird statt der Mustersuche von Level 2 der Trellis Decoder genutzt
+TRELLIS_RUN_LENGTH = 6
+# Maximale Anzahl der besten Pfade des Trellis Decoders, die mit RS geprüft werden
+TRELLIS_K = 64
+
+
+def soft_force_new(error_segment, segment_count, rs_codec_value, verbose=True, candidate_budget=CANDIDATE_BUDGET, first_hit=True, trellis_k=TRELLIS_K,
+                   bounded=False, segment_length=None, memo=True):
     """
     This Method tries to correct DMR Segments in a rather low level approach. Depending on the difference of original
     segment length and known segment length (probably only one I don´t think I'll do more than that) this Method is used
@@ -19,63 +29,130 @@ def soft_force_new(error_segment, segment_count, rs_codec_value, verbose=True):
         error_segment: errourness DNA string
         segment_count: Number of point mutations to be introduced
         verbose: Determine if all results should be displayed.
+        candidate_budget: Maximum number of candidate sequences per level that are checked with RS (see soft_level_0)
+        first_hit: If True each level stops at the first RS decodeable candidate
+        trellis_k: Maximum number of trellis paths that are checked with RS (see soft_level_trellis)
+        bounded: If True only the trellis level is used, so that at most trellis_k candidates are checked per segment and the
+            decode time no longer depends on the error pattern
+        segment_length: Expected number of bases of the segment. Segments of another length are corrected directly with the
+            insertion/deletion trellis of level 3, segments of the expected length reach level 3 after levels 0-2 (balanced insertions
+            and deletions). Default: every length that is not a multiple of 8 bases is treated as indel, level 3 is not used otherwise.
+        memo: If True the result is taken from / stored in the shared correction memo (see func.correction_memo_get)
     Returns:
         validation_list = DMR_translator.validate_list(segment,segment_count)
     """
 
+    # Gleiche fehlerhafte Segmente kommen über Trials hinweg wieder vor, das Ergebnis hängt nur von der Segmentnummer mod 4 ab
+    memo_key = ("soft_force_new", func.correction_memo_fingerprint(), str(error_segment), segment_count % 4, rs_codec_value, candidate_budget, first_hit,
+                trellis_k, bounded, segment_length, TRELLIS_RUN_LENGTH)
+    if memo:
+        cached = func.correction_memo_get(memo_key)
+        if cached is not None:
+            correction, level = cached
+            if correction and verbose:
+                print(f"Segmentcount: {segment_count}, Level: {level}, Memo")
+            return list(correction), level, segment_count
+
+    correction, level = _soft_force_levels(error_segment, segment_count, rs_codec_value, verbose, candidate_budget, first_hit, trellis_k, bounded,
+                                           segment_length)
+
+    if memo:
+        func.correction_memo_put(memo_key, (tuple(correction), level))
+
+    return correction, level, segment_count
+
+
+def _soft_force_levels(error_segment, segment_count, rs_codec_value, verbose, candidate_budget, first_hit, trellis_k, bounded, segment_length):
+    """
+    Runs the correction levels of soft_force_new (see there for the arguments).
+
+    Returns:
+        correction, level
+    """
 
     level = 0
+    candidate_stats = {"candidates": 0}  # Anzahl der mit RS geprüften Kandidaten über alle Level
+
+    # Insertion oder Deletion vorhanden? Gehe gleich zu Level 3
+    if segment_length is None:
+        indel = len(error_segment) % 8 != 0
+    else:
+        indel = len(error_segment) != segment_length
+    if indel:
+        level = 3
+
+    if bounded:
+        # nur der Trellis Level (anstelle von Level 2 bzw. Level 3) mit beschränkter Anzahl an Kandidaten
+        if indel:
+            correction = soft_level_3(error_segment, segment_count, rs_codec_value, segment_length, trellis_k, candidate_budget, first_hit, candidate_stats)
+        else:
+            level = 2
+            correction = soft_level_trellis(error_segment, segment_count, rs_codec_value, trellis_k, candidate_budget, first_hit, candidate_stats)
 
-    # für später ausprobieren --> Insertion oder Deletion vorhanden? Gehe gleich zu Level 5
-    # if len(error_segment) % 8 != 0:
-    # level = 5
+        if correction:
+            if verbose:
+                print(f"Segmentcount: {segment_count}, Level: {level}, Candidates: {candidate_stats['candidates']}")
+            return correction, level
+
+        return correction, 4
 
     if level == 0:
-        correction = soft_level_0(error_segment, segment_count, rs_codec_value)
+        correction = soft_level_0(error_segment, segment_count, rs_codec_value, candidate_budget, first_hit, candidate_stats)
 
         if correction:
             if verbose:
-                print(f"Segmentcount: {segment_count}, Level: {level}")
-            return correction, level, segment_count
+                print(f"Segmentcount: {segment_count}, Level: {level}, Candidates: {candidate_stats['candidates']}")
+            return correction, level
 
         else:
             level += 1
 
     if level == 1:
-        correction = soft_level_1(error_segment, segment_count, rs_codec_value)
+        correction = soft_level_1(error_segment, segment_count, rs_codec_value, candidate_budget, first_hit, candidate_stats)
 
         if correction:
             if verbose:
-                print(f"Segmentcount: {segment_count}, Level: {level}")
-            return correction, level, segment_count
+                print(f"Segmentcount: {segment_count}, Level: {level}, Candidates: {candidate_stats['candidates']}")
+            return correction, level
 
         else:
             level += 1
 
     if level == 2:
-        correction = soft_level_2(error_segment, segment_count, rs_codec_value)
+        # lange Inkonsistenzketten: Maximum Likelihood Pfade über das Trellis statt der exponentiellen Mustersuche
+        neighbouring_inconsistencies_list = func.get_inconsistency_neighbours_new(func.validate_list(error_segment, segment_count))
+        if max([len(items) for items in neighbouring_inconsistencies_list], default=0) >= TRELLIS_RUN_LENGTH:
+            correction = soft_level_trellis(error_segment, segment_count, rs_codec_value, trellis_k, candidate_budget, first_hit, candidate_stats)
+        else:
+            correction = soft_level_2(error_segment, segment_count, rs_codec_value, candidate_budget, first_hit, candidate_stats)
 
         if correction:
             if verbose:
-                print(f"Segmentcount: {segment_count}, Level: {level}")
-            return correction, level, segment_count
+                print(f"Segmentcount: {segment_count}, Level: {level}, Candidates: {candidate_stats['candidates']}")
+            return correction, level
 
         else:
             level += 1
 
     if level == 3:
-        correction = soft_level_3(error_segment, segment_count, rs_codec_value)
+        # bei richtiger (bekannter) Länge nur Pfade mit Insertion und Deletion, reine Substitutionen wurden in Level 0-2 geprüft.
+        # Ohne bekannte Länge erhöhen zusätzliche Kandidaten nur die Gefahr einer RS Fehlkorrektur
+        if indel or segment_length is not None:
+            correction = soft_level_3(error_segment, segment_count, rs_codec_value, segment_length, trellis_k, candidate_budget, first_hit, candidate_stats,
+                                      indels_only=not indel)
+        else:
+            correction = []
 
         if correction:
             if verbose:
-                print(f"Segmentcount: {segment_count}, Level: {level}")
-            return correction, level, segment_count
+                print(f"Segmentcount: {segment_count}, Level: {level}, Candidates: {candidate_stats['candidates']}")
+            return correction, level
 
         else:
             level += 1
 
 
-    return correction, level, segment_count
+    return correction, level
 
 
 """ 
@@ -103,10 +180,19 @@ inconsistencies. In this case, a correction should be made by attempting to corr
 The possibilities are corrected in level 0. If decodeable segments can be found, these are returned. If not, it continues with the next position. If no 
 correctable segments are found with the substitution and level 0, the whole process is repeated with substitutions and a correction in level 1. 
 
+soft_level_trellis
+Es wird davon ausgegangen, dass nur Substitutionen vorhanden sind. Das Mapping Schema wird als Trellis mit den 16 2-meren als Zuständen genutzt und die
+k gültigen DMR Sequenzen mit den wenigsten Substitutionen werden mit dem Viterbi Algorithmus bestimmt (func.dmr_viterbi_decode). Ersetzt Level 2 bei langen
+Inkonsistenzketten, da die Laufzeit nicht von der Anzahl der Inkonsistenzen abhängt.
+
+soft_level_3
+Insertionen und Deletionen: das Trellis wird um den Versatz zwischen beobachteter und erwarteter Position erweitert (gebänderte Editierdistanz), so dass die
+gültigen DMR Sequenzen mit der erwarteten Segmentlänge nach aufsteigender Editierdistanz geprüft werden. Segmente mit falscher Länge beginnen direkt hier.
+
 """
 
 
-def soft_level_0(error_segment, segment_count, rs_codec_value):
+def soft_level_0(error_segment, segment_count, rs_codec_value, candidate_budget=CANDIDATE_BUDGET, first_hit=True, candidate_stats=None):
     """
     It is assumed that only substitutions are present. If inconsistencies are present, the mapping scheme is used to correct these with the available options,
     whereby at least 1 base must match the specified 2-mere. A 2-mere with 2 incorrect bases can only be corrected here with the error pattern 'tmT_nmF',
@@ -118,6 +204,9 @@ def soft_level_0(error_segment, segment_count, rs_codec_value):
         error_segment: Input the errornous segment to correct.
         segment_count: Input the segment number of the segment for the DMR translation scheme.
         rs_codec_value: Input the used codec value for determination of the correct segments.
+        candidate_budget: Maximum number of candidate sequences that are checked with RS. None checks all candidates.
+        first_hit: If True the search stops at the first RS decodeable candidate, otherwise all decodeable candidates are returned.
+        candidate_stats: Optional dictionary, the number of checked candidates is added to the key "candidates".
 
     Returns:
         List with the decoded sequence with were checked using the check_dmr_scheme.determine_correct_segments(possible_sequences, rs_codec_value,
@@ -164,14 +253,10 @@ def soft_level_0(error_segment, segment_count, rs_codec_value):
         #####################
         ### Vorbereitung ####
         #####################
-        root_dir = os.path.abspath(os.curdir)
-        with open(f"{root_dir}\\mapping_table_dmr.json") as f:
-            data = json.load(f)
-        map_library_start_2_mere = data["initial_2mer"]
-        list_of_start_value = list(map_library_start_2_mere.values())
-        map_library = data["map_library"]
-        list_of_key = list(map_library.keys())
-        list_of_value = list(map_library.values())
+        dmr_mapping = func.get_dmr_mapping()
+        list_of_start_value = dmr_mapping.start_2_mere
+        map_library = dmr_mapping.map_library
+        automaton = dmr_mapping.automaton  # Übergänge und Vorgänger mit einem Arrayzugriff prüfen
         trouble_parts = []
 
         for item in neighbouring_inconsistencies_list:
@@ -185,12 +270,9 @@ def soft_level_0(error_segment, segment_count, rs_codec_value):
             # Start: F T
             if item == [0, 1] and validation_list[0: 2] == ['sF', 'tmF_nmT']:
 
-                start_possibilities = list_of_start_value[segment_count % 4]
-                for i, mere in enumerate(list_of_value):
-                    if error_segment[2:4] in mere and error_segment[0] == list_of_key[i][0] and list_of_key[i] in start_possibilities or \
-                            error_segment[2:4] in mere and error_segment[1] == list_of_key[i][1] and list_of_key[
-                        i] in start_possibilities:  # Level 1 diese Zeile wegnehmen
-                        possibilities.append(list_of_key[i] + error_segment[2:4])
+                for key in automaton.predecessors.get(error_segment[2:4], ()):
+                    if automaton.allows_start(segment_count, key) and (error_segment[0] == key[0] or error_segment[1] == key[1]):  # Level 1 diese Zeile wegnehmen
+                        possibilities.append(key + error_segment[2:4])
 
                 if possibilities != []:
                     trouble_parts.append([item, "First 2-mere: F, T", possibilities])
@@ -208,10 +290,9 @@ def soft_level_0(error_segment, segment_count, rs_codec_value):
 
                 # Variationen 2-mere
                 variation_option_2 = []
-                for i, items in enumerate(list_of_value):
-                    if next_2_mere in items:
-                        if list_of_key[i][0] == current_2_mere[0] or list_of_key[i][1] == current_2_mere[1]:  # Level 1 diese Zeile wegnehmen
-                            variation_option_2.append(list_of_key[i])
+                for key in automaton.predecessors.get(next_2_mere, ()):
+                    if key[0] == current_2_mere[0] or key[1] == current_2_mere[1]:  # Level 1 diese Zeile wegnehmen
+                        variation_option_2.append(key)
 
                 # Variation 1 in Variation 2?
                 possibilities = []
@@ -246,10 +327,9 @@ def soft_level_0(error_segment, segment_count, rs_codec_value):
 
                 # Variationen 2-mere
                 variation_option_2 = []
-                for i, items in enumerate(list_of_value):
-                    if third_2_mere in items:
-                        if list_of_key[i][0] == errorneous_part_2[0] or list_of_key[i][1] == errorneous_part_2[1]:  # Level 1 diese Zeile wegnehmen
-                            variation_option_2.append(list_of_key[i])
+                for key in automaton.predecessors.get(third_2_mere, ()):
+                    if key[0] == errorneous_part_2[0] or key[1] == errorneous_part_2[1]:  # Level 1 diese Zeile wegnehmen
+                        variation_option_2.append(key)
 
                 # Variation 1 in Variation 2?
                 possibilities = []
@@ -317,9 +397,8 @@ def soft_level_0(error_segment, segment_count, rs_codec_value):
                     possibilities.append(last_2_mere + variation)
 
                 # last = 'tmT_nmF' --> falsch, current = 'tmF_nmT' --> richtig, danach wieder richtig --> alle möglichkeiten suchen
-                for i, items in enumerate(list_of_value):
-                    if current_2_mere in items:
-                        possibilities.append(list_of_key[i] + current_2_mere)
+                for key in automaton.predecessors.get(current_2_mere, ()):
+                    possibilities.append(key + current_2_mere)
 
                 # item anpassen nötig --> 1 davor falsch
                 if possibilities != []:
@@ -359,10 +438,9 @@ def soft_level_0(error_segment, segment_count, rs_codec_value):
 
                 # Variationen 2-mere
                 variation_option_2 = []
-                for i, items in enumerate(list_of_value):
-                    if third_2_mere in items:
-                        if list_of_key[i][0] == errorneous_part_2[0] or list_of_key[i][1] == errorneous_part_2[1]:  # Level 1 diese Zeile wegnehmen
-                            variation_option_2.append(list_of_key[i])
+                for key in automaton.predecessors.get(third_2_mere, ()):
+                    if key[0] == errorneous_part_2[0] or key[1] == errorneous_part_2[1]:  # Level 1 diese Zeile wegnehmen
+                        variation_option_2.append(key)
 
                 # Variation 1 in Variation 2?
                 possibilities = []
@@ -386,19 +464,15 @@ def soft_level_0(error_segment, segment_count, rs_codec_value):
                 # Möglichkeiten 1. fehlerhaftes 2-mere + passt es zum mittleren
                 variation_option_1 = []  # Variation durchprobieren und schauen ob darauffolgender 2-mere im Schema ist
                 for variation in map_library[first_2_mere]:
-                    if variation[0] == errorneous_part_1[0] and middle_2_mere in map_library[variation] or \
-                            variation[1] == errorneous_part_1[1] and middle_2_mere in map_library[variation]:
+                    if (variation[0] == errorneous_part_1[0] or variation[1] == errorneous_part_1[1]) and automaton.allows(variation, middle_2_mere):
                         variation_option_1.append(variation)
 
                 # Möglichkeiten 2. fehlerhaftes 2-mere + passt es zum mittleren
                 variation_option_2 = []
-                for i, items in enumerate(list_of_value):
-                    if last_2_mere in items:  # welcher key für last 2-mere
-                        if list_of_key[i][0] == errorneous_part_2[0] or list_of_key[i][1] == errorneous_part_2[1]:  # eine Base sollte bei error-mere-2 passen
-                            for j, mid in enumerate(list_of_value):
-                                if list_of_key[i] in mid:  # welcher key für gefundene variation von error-mere-2
-                                    if list_of_key[j] == middle_2_mere:  # muss mit mitte übereinstimmen
-                                        variation_option_2.append(list_of_key[i])
+                for key in automaton.predecessors.get(last_2_mere, ()):  # welcher key für last 2-mere
+                    if key[0] == errorneous_part_2[0] or key[1] == errorneous_part_2[1]:  # eine Base sollte bei error-mere-2 passen
+                        if automaton.allows(middle_2_mere, key):  # gefundene variation von error-mere-2 muss auf die Mitte folgen
+                            variation_option_2.append(key)
 
                 # Variation 1 in Variation 2?
                 possibilities = []
@@ -412,31 +486,13 @@ def soft_level_0(error_segment, segment_count, rs_codec_value):
         ###############################
         ## Sequenzen zusammensetzten ##
         ###############################
-        sequence_parts = []
-        start = 0
         if len(trouble_parts) == 0:
             decoded_sequences = []
         else:
-            for trouble in trouble_parts:
-                sequence_parts.append(error_segment[start:trouble[0][0] * 2])
-                start = trouble[0][-1] * 2 + 2
-            if start != len(error_segment):  # Einfügen des letzten Sequenzabschnittes, wenn nötig
-                sequence_parts.append(error_segment[start:])
-
-            possible_sequences = [sequence_parts[0]]
-            # Fehler mit gefundenen Möglichkeiten ersetzen
-            for i, trouble in enumerate(trouble_parts):  # trouble parts durchgehen + möglichkeiten zu possible_sequences hinzufügen und alte sequenz löschen
-                new = []
-                for seq in possible_sequences:
-                    for items in trouble[2]:
-                        if i + 1 < len(sequence_parts):
-                            new.append(seq + items + sequence_parts[i + 1])
-                        else:
-                            new.append(seq + items)
-                possible_sequences = new
-
-            # Sequenzen übersetzen
-            decoded_sequences = func.determine_correct_segments(possible_sequences, rs_codec_value, segment_count)
+            # Kandidaten werden nach Wahrscheinlichkeit sortiert erzeugt und stückweise übersetzt, statt alle Kombinationen aufzubauen
+            possible_sequences = iterate_candidate_sequences(error_segment, trouble_parts)
+            decoded_sequences = evaluate_candidate_stream(possible_sequences, segment_count, rs_codec_value, candidate_budget=candidate_budget,
+                                                          first_hit=first_hit, candidate_stats=candidate_stats)
 
     else:
         decoded_sequences = []
@@ -444,7 +500,7 @@ def soft_level_0(error_segment, segment_count, rs_codec_value):
     return decoded_sequences
 
 
-def soft_level_1(error_segment, segment_count, rs_codec_value):
+def soft_level_1(error_segment, segment_count, rs_codec_value, candidate_budget=CANDIDATE_BUDGET, first_hit=True, candidate_stats=None):
     """
     It is assumed that only substitutions are present. If inconsistencies are present, the mapping scheme is used to correct these with the available options.
     The correction is based on that of level 0, but without the restriction on the matching base required per 2-mere. In addition, the correction of 5
@@ -454,6 +510,9 @@ def soft_level_1(error_segment, segment_count, rs_codec_value):
         error_segment: Input the errornous segment to correct.
         segment_count: Input the segment number of the segment for the DMR translation scheme.
         rs_codec_value: Input the used codec value for determination of the correct segments.
+        candidate_budget: Maximum number of candidate sequences that are checked with RS. None checks all candidates.
+        first_hit: If True the search stops at the first RS decodeable candidate, otherwise all decodeable candidates are returned.
+        candidate_stats: Optional dictionary, the number of checked candidates is added to the key "candidates".
 
     Returns:
         List with the decoded sequence with were checked using the check_dmr_scheme.determine_correct_segments(possible_sequences, rs_codec_value,
@@ -498,14 +557,10 @@ def soft_level_1(error_segment, segment_count, rs_codec_value):
         #####################
         ### Vorbereitung ####
         #####################
-        root_dir = os.path.abspath(os.curdir)
-        with open(f"{root_dir}\\mapping_table_dmr.json") as f:
-            data = json.load(f)
-        map_library_start_2_mere = data["initial_2mer"]
-        list_of_start_value = list(map_library_start_2_mere.values())
-        map_library = data["map_library"]
-        list_of_key = list(map_library.keys())
-        list_of_value = list(map_library.values())
+        dmr_mapping = func.get_dmr_mapping()
+        list_of_start_value = dmr_mapping.start_2_mere
+        map_library = dmr_mapping.map_library
+        automaton = dmr_mapping.automaton  # Übergänge und Vorgänger mit einem Arrayzugriff prüfen
         trouble_parts = []
 
         # X
@@ -520,11 +575,9 @@ def soft_level_1(error_segment, segment_count, rs_codec_value):
             # Start: F T
             if item == [0, 1] and validation_list[0: 2] == ['sF', 'tmF_nmT']:
 
-                start_possibilities = list_of_start_value[segment_count % 4]
-                for i, mere in enumerate(list_of_value):
-                    if error_segment[2:4] in mere and list_of_key[i] in start_possibilities or \
-                            error_segment[2:4] in mere and list_of_key[i] in start_possibilities:
-                        possibilities.append(list_of_key[i] + error_segment[2:4])
+                for key in automaton.predecessors.get(error_segment[2:4], ()):
+                    if automaton.allows_start(segment_count, key):
+                        possibilities.append(key + error_segment[2:4])
 
                 if possibilities != []:
                     trouble_parts.append([item, "First 2-mere: F, T", possibilities])
@@ -541,9 +594,8 @@ def soft_level_1(error_segment, segment_count, rs_codec_value):
 
                 # Variationen 2-mere
                 variation_option_2 = []
-                for i, items in enumerate(list_of_value):
-                    if next_2_mere in items:
-                        variation_option_2.append(list_of_key[i])
+                for key in automaton.predecessors.get(next_2_mere, ()):
+                    variation_option_2.append(key)
 
                 # Variation 1 in Variation 2?
                 possibilities = []
@@ -576,9 +628,8 @@ def soft_level_1(error_segment, segment_count, rs_codec_value):
 
                 # Variationen 2-mere
                 variation_option_2 = []
-                for i, items in enumerate(list_of_value):
-                    if third_2_mere in items:
-                        variation_option_2.append(list_of_key[i])
+                for key in automaton.predecessors.get(third_2_mere, ()):
+                    variation_option_2.append(key)
 
                 # Variation 1 in Variation 2?
                 possibilities = []
@@ -634,9 +685,8 @@ def soft_level_1(error_segment, segment_count, rs_codec_value):
                     possibilities.append(last_2_mere + variation)
 
                 # last = 'tmT_nmF' --> falsch, current = 'tmF_nmT' --> richtig, danach wieder richtig --> alle möglichkeiten suchen
-                for i, items in enumerate(list_of_value):
-                    if current_2_mere in items:
-                        possibilities.append(list_of_key[i] + current_2_mere)
+                for key in automaton.predecessors.get(current_2_mere, ()):
+                    possibilities.append(key + current_2_mere)
 
                 # item anpassen nötig --> 1 davor falsch
                 if possibilities != []:
@@ -673,9 +723,8 @@ def soft_level_1(error_segment, segment_count, rs_codec_value):
 
                 # Variationen 2-mere
                 variation_option_2 = []
-                for i, items in enumerate(list_of_value):
-                    if third_2_mere in items:
-                        variation_option_2.append(list_of_key[i])
+                for key in automaton.predecessors.get(third_2_mere, ()):
+                    variation_option_2.append(key)
 
                 # Variation 1 in Variation 2?
                 possibilities = []
@@ -700,9 +749,8 @@ def soft_level_1(error_segment, segment_count, rs_codec_value):
 
                 # Möglichkeiten 3. fehlerhaftes 2-mere
                 variation_option_2 = []
-                for i, items in enumerate(list_of_value):
-                    if last_2_mere in items:  # welcher key für last 2-mere
-                        variation_option_2.append(list_of_key[i])
+                for key in automaton.predecessors.get(last_2_mere, ()):  # welcher key für last 2-mere
+                    variation_option_2.append(key)
 
                 # Möglichkeiten 2. fehlerhaftes 2-mere
                 possibilities = []
@@ -718,32 +766,13 @@ def soft_level_1(error_segment, segment_count, rs_codec_value):
         ###############################
         ## Sequenzen zusammensetzten ##
         ###############################
-        sequence_parts = []
-        start = 0
         if len(trouble_parts) == 0:
             decoded_sequences = []
         else:
-            for trouble in trouble_parts:
-                sequence_parts.append(error_segment[start:trouble[0][0] * 2])
-                start = trouble[0][-1] * 2 + 2
-            if start != len(error_segment):  # Einfügen des letzten Sequenzabschnittes, wenn nötig
-                sequence_parts.append(error_segment[start:])
-
-            possible_sequences = [sequence_parts[0]]
-            # Fehler mit gefundenen Möglichkeiten ersetzen
-            for i, trouble in enumerate(
-                    trouble_parts):  # trouble parts durchgehen und die möglichkeiten zu possible_sequences hinzufügen und alte sequenz löschen
-                new = []
-                for seq in possible_sequences:
-                    for items in trouble[2]:
-                        if i + 1 < len(sequence_parts):
-                            new.append(seq + items + sequence_parts[i + 1])
-                        else:
-                            new.append(seq + items)
-                possible_sequences = new
-
-            # Sequenzen übersetzen
-            decoded_sequences = func.determine_correct_segments(possible_sequences, rs_codec_value, segment_count)
+            # Kandidaten werden nach Wahrscheinlichkeit sortiert erzeugt und stückweise übersetzt, statt alle Kombinationen aufzubauen
+            possible_sequences = iterate_candidate_sequences(error_segment, trouble_parts)
+            decoded_sequences = evaluate_candidate_stream(possible_sequences, segment_count, rs_codec_value, candidate_budget=candidate_budget,
+                                                          first_hit=first_hit, candidate_stats=candidate_stats)
 
     else:
         decoded_sequences = []
@@ -751,7 +780,7 @@ def soft_level_1(error_segment, segment_count, rs_codec_value):
     return decoded_sequences
 
 
-def soft_level_2(error_segment, segment_count, rs_codec_value):
+def soft_level_2(error_segment, segment_count, rs_codec_value, candidate_budget=CANDIDATE_BUDGET, first_hit=True, candidate_stats=None):
     """
     It is assumed that only substitutions are present and that no correction with level 0 and 1 has worked. Here, the locations of the inconsistencies are
     first determined without separating them as in levels 0 and 1. Due to substitutions, errors could occur that fit into the mapping scheme and thus output
@@ -765,6 +794,9 @@ def soft_level_2(error_segment, segment_count, rs_codec_value):
         error_segment: Input the errornous segment to correct.
         segment_count: Input the segment number of the segment for the DMR translation scheme.
         rs_codec_value: Input the used codec value for determination of the correct segments.
+        candidate_budget: Maximum number of candidate sequences that are checked with RS. None checks all candidates.
+        first_hit: If True the search stops at the first RS decodeable candidate, otherwise all decodeable candidates are returned.
+        candidate_stats: Optional dictionary, the number of checked candidates is added to the key "candidates".
 
     Returns:
         List with the decoded sequence with were checked using the check_dmr_scheme.determine_correct_segments(possible_sequences, rs_codec_value,
@@ -790,7 +822,7 @@ def soft_level_2(error_segment, segment_count, rs_codec_value):
                 func.single_substitution_correction(error_segment, neighbouring_inconsistencies_list[index_neighbour][0] + place)[0]
 
             for option in option_list:
-                decoded_sequences = soft_level_0(option, segment_count, rs_codec_value)
+                decoded_sequences = soft_level_0(option, segment_count, rs_codec_value, candidate_budget, first_hit, candidate_stats)
                 if decoded_sequences != []:
                     return decoded_sequences
 
@@ -800,31 +832,200 @@ def soft_level_2(error_segment, segment_count, rs_codec_value):
                 func.single_substitution_correction(error_segment, neighbouring_inconsistencies_list[index_neighbour][0] + place)[0]
 
             for option in option_list:
-                decoded_sequences = soft_level_1(option, segment_count, rs_codec_value)
+                decoded_sequences = soft_level_1(option, segment_count, rs_codec_value, candidate_budget, first_hit, candidate_stats)
                 if decoded_sequences != []:
                     return decoded_sequences
 
     return decoded_sequences
 
 
-def soft_level_3(error_segment, segment_count, rs_codec_value):
+def soft_level_trellis(error_segment, segment_count, rs_codec_value, k=TRELLIS_K, candidate_budget=CANDIDATE_BUDGET, first_hit=True, candidate_stats=None):
     """
-    TO DO
+    It is assumed that only substitutions are present. The mapping scheme is used as a trellis with the 16 2-meres as states and the valid DMR sequences
+    are taken lazily in increasing number of substitutions from func.iterate_viterbi_paths. Each path is translated straight to RS bytes and checked until
+    one decodes or k paths were checked. In contrast to the pattern search of level 0 to 2 the work is bounded by k and does not depend on the number and
+    length of the inconsistencies.
 
     Args:
         error_segment: Input the errornous segment to correct.
         segment_count: Input the segment number of the segment for the DMR translation scheme.
         rs_codec_value: Input the used codec value for determination of the correct segments.
+        k: Maximum number of trellis paths that are checked.
+        candidate_budget: Maximum number of candidate sequences that are checked with RS. None checks all candidates.
+        first_hit: If True the search stops at the first RS decodeable candidate, otherwise all decodeable candidates are returned.
+        candidate_stats: Optional dictionary, the number of checked candidates is added to the key "candidates".
 
     Returns:
         List with the decoded sequence with were checked using the check_dmr_scheme.determine_correct_segments(possible_sequences, rs_codec_value,
         segment_count) function.
     """
 
-    decoded_sequences = []
+    if len(error_segment) % 2 != 0:  # Insertion/Deletion vorhanden
+        return []
+
+    # Pfade werden erst erzeugt, wenn sie geprüft werden
+    possible_codes = (codes for codes, _ in func.iterate_viterbi_paths(error_segment, segment_count))
+    if candidate_budget is not None:
+        k = min(k, candidate_budget)
+    decoded_sequences = evaluate_candidate_stream(possible_codes, segment_count, rs_codec_value, candidate_budget=k, first_hit=first_hit,
+                                                  candidate_stats=candidate_stats)
+
+    return decoded_sequences
+
+
+def soft_level_3(error_segment, segment_count, rs_codec_value, segment_length=None, k=TRELLIS_K, candidate_budget=CANDIDATE_BUDGET, first_hit=True,
+                 candidate_stats=None, indels_only=False):
+    """
+    Correction of segments with insertions and deletions (and substitutions). The DMR trellis is extended by the offset between the observed and the
+    expected base position (func.iterate_indel_paths), so that the valid DMR sequences of the expected segment length are taken lazily in increasing
+    edit distance to the erroneous segment. Each path is translated straight to RS bytes and checked until one decodes or k paths were checked.
+
+    Args:
+        error_segment: Input the errornous segment to correct.
+        segment_count: Input the segment number of the segment for the DMR translation scheme.
+        rs_codec_value: Input the used codec value for determination of the correct segments.
+        segment_length: Expected number of bases of the segment. Default is the next multiple of 8 bases.
+        k: Maximum number of trellis paths that are checked.
+        candidate_budget: Maximum number of candidate sequences that are checked with RS. None checks all candidates.
+        first_hit: If True the search stops at the first RS decodeable candidate, otherwise all decodeable candidates are returned.
+        candidate_stats: Optional dictionary, the number of checked candidates is added to the key "candidates".
+        indels_only: If True only paths that need insertions and deletions are checked (segment of the expected length with balanced indels),
+            paths whose edit distance equals the number of substituted bases are skipped.
+
+    Returns:
+        List with the decoded sequence with were checked using the check_dmr_scheme.determine_correct_segments(possible_sequences, rs_codec_value,
+        segment_count) function.
+    """
+
+    if segment_length is None:
+        segment_length = max(8, int(round(len(error_segment) / 8)) * 8)
+
+    # Pfade werden erst erzeugt, wenn sie geprüft werden
+    possible_codes = (codes for codes, _ in func.iterate_indel_paths(error_segment, segment_count, segment_length))
+    if indels_only and len(error_segment) == segment_length:
+        observed = func.dna_to_dmr_code_array([str(error_segment)])[0]
+        possible_codes = (codes for codes, cost in func.iterate_indel_paths(error_segment, segment_count, segment_length)
+                          if cost < np.count_nonzero((codes >> 2) != (observed >> 2)) + np.count_nonzero((codes & 3) != (observed & 3)))
+    if candidate_budget is not None:
+        k = min(k, candidate_budget)
+    decoded_sequences = evaluate_candidate_stream(possible_codes, segment_count, rs_codec_value, candidate_budget=k, first_hit=first_hit,
+                                                  candidate_stats=candidate_stats)
+
     return decoded_sequences
 
 
+############################
+#### Kandidaten-Stream #####
+############################
+
+
+def iterate_candidate_sequences(error_segment, trouble_parts):
+    """
+    Generator for the candidate sequences of soft_level_0 and soft_level_1. Instead of building the full cross product of all trouble part options,
+    the candidates are yielded one by one in likelihood order: the options of each trouble part are sorted by their Hamming distance to the erroneous
+    part and the combinations are enumerated by increasing total distance (fewest assumed substitutions first). Every combination is yielded exactly
+    once, so exhausting the generator gives the same candidates as the full cross product.
+
+    Args:
+        error_segment: Input the errornous segment to correct.
+        trouble_parts: List of [item, description, possibilities] as created in soft_level_0 / soft_level_1.
+
+    Yields:
+        Candidate DNA sequences
+    """
+    # Zwischenstücke ohne Inkonsistenzen wie beim Zusammensetzen der Sequenzen bestimmen
+    sequence_parts = []
+    start = 0
+    for trouble in trouble_parts:
+        sequence_parts.append(error_segment[start:trouble[0][0] * 2])
+        start = trouble[0][-1] * 2 + 2
+    if start != len(error_segment):  # Einfügen des letzten Sequenzabschnittes, wenn nötig
+        sequence_parts.append(error_segment[start:])
+
+    # Möglichkeiten pro Fehlerstelle nach Anzahl der angenommenen Substitutionen sortieren
+    sorted_options = []
+    for trouble in trouble_parts:
+        erroneous_part = error_segment[trouble[0][0] * 2:trouble[0][-1] * 2 + 2]
+        costs = [sum(base != error_base for base, error_base in zip(option, erroneous_part)) + abs(len(option) - len(erroneous_part))
+                 for option in trouble[2]]
+        order = sorted(range(len(trouble[2])), key=lambda position: costs[position])
+        sorted_options.append(([trouble[2][position] for position in order], [costs[position] for position in order]))
+
+    if any(len(options) == 0 for options, _ in sorted_options):
+        return
+
+    # Best-first Aufzählung des Kreuzprodukts über einen Heap (Summe der Kosten, Indizes)
+    first = tuple([0] * len(sorted_options))
+    heap = [(sum(costs[0] for _, costs in sorted_options), first)]
+    seen = {first}
+
+    while heap:
+        _, indices = heapq.heappop(heap)
+
+        sequence = sequence_parts[0]
+        for i, option_index in enumerate(indices):
+            sequence += sorted_options[i][0][option_index]
+            if i + 1 < len(sequence_parts):
+                sequence += sequence_parts[i + 1]
+        yield sequence
+
+        for i, option_index in enumerate(indices):
+            if option_index + 1 < len(sorted_options[i][0]):
+                successor = indices[:i] + (option_index + 1,) + indices[i + 1:]
+                if successor not in seen:
+                    seen.add(successor)
+                    cost = sum(sorted_options[j][1][successor[j]] for j in range(len(successor)))
+                    heapq.heappush(heap, (cost, successor))
+
+
+def evaluate_candidate_stream(candidates, segment_count, rs_codec_value, candidate_budget=CANDIDATE_BUDGET, first_hit=True, candidate_stats=None):
+    """
+    Checks candidate sequences from a generator with func.determine_correct_segments. The candidates are taken in growing batches, so that an early
+    hit only needs a few RS checks while long streams are still translated in larger batches.
+
+    Args:
+        candidates: Iterable of candidate DNA sequences (see iterate_candidate_sequences) or of uint8 arrays of 2-mere codes (see
+            func.iterate_viterbi_paths), which are translated straight to RS bytes
+        segment_count: Input the segment number of the segment for the DMR translation scheme.
+        rs_codec_value: Input the used codec value for determination of the correct segments.
+        candidate_budget: Maximum number of candidates that are checked. None checks all candidates.
+        first_hit: If True only the first RS decodeable candidate is returned and the stream is not read further.
+        candidate_stats: Optional dictionary, the number of checked candidates is added to the key "candidates".
+
+    Returns:
+        List of (candidate, decoded DNA sequence, candidate number) like func.determine_correct_segments
+    """
+    decoded_sequences = []
+    evaluated = 0
+    batch_size = 16
+
+    candidates = iter(candidates)
+    while candidate_budget is None or evaluated < candidate_budget:
+        if candidate_budget is not None:
+            batch_size = min(batch_size, candidate_budget - evaluated)
+
+        batch = []
+        for candidate in candidates:
+            batch.append(candidate)
+            if len(batch) == batch_size:
+                break
+        if not batch:
+            break
+
+        if isinstance(batch[0], str):
+            hits = func.determine_correct_segments(batch, rs_codec_value, segment_count)
+        else:
+            hits = func.determine_correct_code_segments(np.stack(batch), rs_codec_value, segment_count)
+        decoded_sequences += [(candidate, decoded, evaluated + i) for candidate, decoded, i in hits]
+        evaluated += len(batch)
+
+        if first_hit and decoded_sequences:
+            decoded_sequences = decoded_sequences[:1]
+            break
 
+        batch_size = min(batch_size * 2, 1024)
 
+    if candidate_stats is not None:
+        candidate_stats["candidates"] = candidate_stats.get("candidates", 0) + evaluated
 
+    return decoded_sequences
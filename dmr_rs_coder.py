@@ -1,9 +1,11 @@
 import os
-import json
 import math
+import random
+import logging
 import warnings
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 import functions as func
-from reedsolo import RSCodec
 import dmr_level_master
 
 
@@ -33,13 +35,10 @@ class DMR_RS_Coder:
 
     def __init__(self, rs_codec_value: int, min_codec_value: int = 0, min_segment_length: int = 0):
 
-        # Lade die JSON-Datei in ein Dictionary
-        root_dir = os.path.abspath(os.curdir)
-        with open(f"{root_dir}\\mapping_table_dmr.json") as f:
-            data = json.load(f)
-        # Zugriff auf den jeweiligen Teil des Dictionaries
-        map_library = data["map_library"]
-        map_library_start_2_mere = data["initial_2mer"]
+        # Gemeinsame kompilierte Mapping Tabelle
+        dmr_mapping = func.get_dmr_mapping()
+        map_library = dmr_mapping.map_library
+        map_library_start_2_mere = dmr_mapping.initial_2mer
 
         self.rs_codec_value = rs_codec_value  # Beschreibt den normalen Codec Value bevor er auf die verkleinerten Segment angepasst wird (Bsp. RS-CODEC 32)
         self.min_codec_value = min_codec_value  # Beschreibt den eingestellen runtergerechneten Codec Value der die verkleinerten Segmente angepasst wurde
@@ -137,7 +136,7 @@ class DMR_RS_Coder:
         """
         new_codec_size, payload_size = self.recalculate_codec()  # Hier wird die neue Codec Größe in der Funktion recalculate_codec eingestellt und zusätzlich
         # werden der neue Codec und Segmentlänge zurückgegeben
-        rs_coder = RSCodec(new_codec_size)
+        rs_coder = func.get_rs_codec(new_codec_size)
 
         payload_segments = func.segment_string(data, payload_size)  # Segmentation der DNA
 
@@ -146,113 +145,253 @@ class DMR_RS_Coder:
         return rsm_segments, new_codec_size, payload_size
 
 
-    def initial_scan_correction(self, sequence_list, index=None):
+    def initial_scan_correction(self, sequence_list, index=None, memo=True):
         """
         This Function attempts correction of the given DMR Segmented Fragments by Reed-Solomon only. This serves as a first scan to minimize DNA segments that
         need to be corrected by DMR
 
         Args:
-                sequence_list: Segmented DNA list of DMR-RSM encoded segments
+                sequence_list: Segmented DNA list of DMR-RSM encoded segments or func.PackedDNA. Segments of a PackedDNA are checked as 2-mere
+                               code matrix, the decodeable ones are returned as PackedDNA views and only the erroneous ones as strings
                 index: If given all entries of the sequence list are attempted to be corrected with the given index DMR Start Two-mere rule
+                memo: If True already scanned segments (same DNA, index mod 4 and RS codec size) are taken from the shared correction memo
+                      (see func.correction_memo_get)
 
         Returns:
                  erroneous_segment_list, decoded_segment_list
         """
-        rs_coder = RSCodec(self.RS_new_codec_size)
+        rs_coder = func.get_rs_codec(self.RS_new_codec_size)
 
         decoded_segment_list = []
 
         erroneous_segment_list = []
 
-        for i, segment in enumerate(sequence_list):
-            if index == None:
-                index_choice = i
-            else:
-                index_choice = index
-
-            validation_list = func.validate_list(segment, index_choice)
-            validation_list_check = func.check_validation(validation_list)
-            # Validation List is initialized to check for inconsistencies in the DMR scheme
-
-            if validation_list_check:
-                rs_segment = func.translate_dna_to_rs_singular(segment, index_choice)
-                # If the segment passes the validation list test (no inconsistencies in segment) it is attempted to be RS decoded
-                try:
-                    _, rs_string_decoded, errata_pos = rs_coder.decode(rs_segment)
+        packed_sequence = sequence_list if isinstance(sequence_list, func.PackedDNA) else None
+        if packed_sequence is not None:
+            sequence_list = list(packed_sequence.segments())
+
+        index_list = list(range(len(sequence_list))) if index == None else [index] * len(sequence_list)
+
+        # Segments that were already scanned are taken from the memo, only the remaining ones are checked
+        decodeable = set()
+        if memo:
+            fingerprint = func.correction_memo_fingerprint()
+            memo_keys = [("initial_scan", fingerprint, func.correction_memo_dna_key(segment), index_list[i] % 4, self.RS_new_codec_size)
+                         for i, segment in enumerate(sequence_list)]
+            scan_positions = []
+            for i, memo_key in enumerate(memo_keys):
+                cached = func.correction_memo_get(memo_key)
+                if cached is None:
+                    scan_positions.append(i)
+                elif cached:
+                    decodeable.add(i)
+        else:
+            scan_positions = list(range(len(sequence_list)))
 
-                    if rs_coder.check(rs_string_decoded):
-                        decoded_segment_list += [(segment, index_choice)]
+        # All segments are checked against the DMR scheme and translated to bytes at once
+        scan_segments = [sequence_list[i] for i in scan_positions]
+        if packed_sequence is not None and len(scan_positions) == len(sequence_list):
+            scan_segments = packed_sequence
+        byte_segments, validation_checks = func.translate_dna_segments_to_bytes(scan_segments, [index_list[i] for i in scan_positions])
 
-                    else:
-                        erroneous_segment_list += [(segment, index_choice)]
+        # Only segments that pass the validation list test (no inconsistencies in segment) are attempted to be RS decoded.
+        # The syndrome pre-check skips the full decode for error free and certainly uncorrectable segments
+        valid_positions = [position for position in range(len(scan_positions)) if validation_checks[position]]
+        rs_decoded = func.rs_decode_prechecked(rs_coder, [byte_segments[position] for position in valid_positions])
+        scanned = set(scan_positions[position] for position, rs_string_decoded in zip(valid_positions, rs_decoded) if rs_string_decoded is not None)
+        decodeable |= scanned
 
-                except:
-                    erroneous_segment_list += [(segment, index_choice)]
+        if memo:
+            for i in scan_positions:
+                func.correction_memo_put(memo_keys[i], i in scanned)
 
-            else:
-                erroneous_segment_list += [(segment, index_choice)]
+        for i, segment in enumerate(sequence_list):
             # All segments that were decodeable get added to a decodeable segment list
             # All segments that were not decodeable get added to an erroneous segment list
+            if i in decodeable:
+                decoded_segment_list += [(segment, index_list[i])]
+            else:
+                erroneous_segment_list += [(str(segment), index_list[i])]
+
         return erroneous_segment_list, decoded_segment_list
 
 
-    def after_scan_correction_try_Jess(self, correction_list, verbose=True):
+    def after_scan_correction_try_Jess(self, correction_list, verbose=True, workers=None, chunksize=None, segment_lengths=None):
         """
         This Function attempts correction of the given DMR Segmented Fragments with the DMR Scheme.
+        The segments are independent of each other, so they can optionally be corrected in a process pool. The results are
+        reassembled in the order of the correction list and are identical to the serial correction.
         Args:
             correction_list: Segmented DNA list of DMR-RSM encoded segments
             verbose: Determine if all results should be displayed.
+            workers: Number of worker processes. None or 1 corrects the segments serially, 0 uses all CPU cores.
+            chunksize: Number of segments sent to a worker at once. Default is an even split into 4 chunks per worker.
+            segment_lengths: Optional dictionary segment number --> expected number of bases (see expected_segment_length). Segments with a known
+                             length are also checked for insertions and deletions that keep the length.
         Returns:
             errornous_sequences, corrected_sequences
         """
         corrected_sequences = []
         errornous_sequences = []
 
-        for sequence_sub_list in correction_list:
-            error_sequence, sequence_count = sequence_sub_list
-            sequence_list, level, segment_count = dmr_level_master.soft_force_new(error_sequence, sequence_count, self.RS_new_codec_size, verbose=verbose)
-            # Diese Funktion nimmt eine Sequenz und die bekannten Parameter (Segment_Index, Codec) und versucht diese durch DMR zu korrigieren
-
-            # Liste mit Möglichkeiten aller korrigierbarer Sequenzen --> oft gleich --> wenn nicht gleich dann oft false positiv.
-            # Er geht alle Level bis etwas korrigierbares gefunden wurde durch und schaut dann die Ergebnisse an
-            corrected_sequence_option_list = []
-            for liste in sequence_list:
-                corrected_sequence_option_list += [(liste[1], segment_count)]
-
-            switch = True
-            # Switch: Wenn alle Sequenzen gleich sind, dann war die Sequenz erfolgreich dekodierbar.
-            # Wenn eine Sequenz unterschiedlich ist, dann kommt das in die nicht dekodierbare Liste.
-            for entry in corrected_sequence_option_list:
-                if corrected_sequence_option_list[0][0] != entry[0]:
-                    switch = False
-
-            # Ausprobieren: versuchen aus den gefundenen Sequenzen die richtige zu finden!
-            if switch == False:
-
-                individual_sequences = list(set(corrected_sequence_option_list))
-                individual_sequences_count = [corrected_sequence_option_list.count(entry) for entry in individual_sequences]
-                max_seq = max(individual_sequences_count)
-                max_count = individual_sequences_count.count(max_seq)
-
-                # Mehrheitsentscheid gleicher Sequenzen
-                if max_count == 1:
-                    corrected_sequence_option_list = [individual_sequences[individual_sequences_count.index(max_seq)]]
-                    switch = True
-
-                # Auswahl nach Editdistanz
-                else:
-                    edit_distance = [(func.score_pairs_fast([(error_sequence, item[0], "DNA")], as_percent=True), item) for item in individual_sequences]
-                    max_edit, max_edit_sequence = max(edit_distance)
-                    corrected_sequence_option_list = [max_edit_sequence]
-                    switch = True
+        segment_lengths = segment_lengths or {}
+        jobs = [(error_sequence, sequence_count, self.RS_new_codec_size, verbose, segment_lengths.get(sequence_count))
+                for error_sequence, sequence_count in correction_list]
 
-                # Mehrheitsentscheid gleicher Sequenzabschnitte --> Erstellung einer Sequenz daraus und überprüfen, ob in Liste vorhanden.
+        if workers is None or workers == 1 or len(jobs) <= 1:
+            results = map(_correct_segment_job, jobs)
 
-            if switch == False or len(sequence_list) == 0:
-                errornous_sequences += [(error_sequence, sequence_count)]
-            elif switch and len(corrected_sequence_option_list) > 0:
-                corrected_sequences += [corrected_sequence_option_list[0]]
-            else:
-                corrected_sequences += corrected_sequence_option_list[0]
+        else:
+            workers = workers if workers > 0 else os.cpu_count()
+            if chunksize is None:
+                chunksize = max(1, math.ceil(len(jobs) / (workers * 4)))
+
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                # executor.map gibt die Ergebnisse in der Reihenfolge der Segmente zurück
+                results = []
+                for result, memo_entries in executor.map(_correct_segment_memo_job, jobs, chunksize=chunksize):
+                    # neue Korrekturergebnisse der Worker in das Memo dieses Prozesses übernehmen
+                    func.merge_correction_memo(memo_entries)
+                    results.append(result)
+
+        for segment_errornous, segment_corrected in results:
+            errornous_sequences += segment_errornous
+            corrected_sequences += segment_corrected
 
         return errornous_sequences, corrected_sequences
+
+
+def correct_segment_dmr(error_sequence, sequence_count, rs_new_codec_size, verbose=True, segment_length=None):
+    """
+    Corrects a single erroneous DMR segment with dmr_level_master.soft_force_new. Each level stops at the first RS decodeable candidate, so
+    at most one corrected sequence is found.
+    Args:
+        error_sequence: Erroneous DNA segment
+        sequence_count: Segment number of the segment
+        rs_new_codec_size: Used RS codec size of the segments
+        verbose: Determine if all results should be displayed.
+        segment_length: Expected number of bases of the segment (see expected_segment_length), None if unknown
+    Returns:
+        errornous_sequences, corrected_sequences of this segment (lists with at most one entry)
+    """
+    corrected_sequences = []
+    errornous_sequences = []
+
+    sequence_list, level, segment_count = dmr_level_master.soft_force_new(error_sequence, sequence_count, rs_new_codec_size, verbose=verbose,
+                                                                          segment_length=segment_length)
+    # Diese Funktion nimmt eine Sequenz und die bekannten Parameter (Segment_Index, Codec) und versucht diese durch DMR zu korrigieren
+    # Er geht alle Level bis etwas korrigierbares gefunden wurde durch, jedes Level liefert höchstens eine Sequenz (first_hit)
+    if len(sequence_list) == 0:
+        errornous_sequences += [(error_sequence, sequence_count)]
+    else:
+        corrected_sequences += [(sequence_list[0][1], segment_count)]
+
+    return errornous_sequences, corrected_sequences
+
+
+def _correct_segment_job(job):
+    # Einstiegspunkt für die Worker-Prozesse (muss auf Modulebene liegen, damit er gepickelt werden kann)
+    return correct_segment_dmr(*job)
+
+
+def _correct_segment_memo_job(job):
+    # Worker-Prozess: die neuen Memo Einträge werden mit dem Ergebnis zurückgegeben
+    func.start_correction_memo_journal()
+    return correct_segment_dmr(*job), func.take_correction_memo_journal()
+
+
+def expected_segment_length(sequence_count, rs_new_codec_size, payload_size, data_size=None, segment_number=None):
+    """
+    Number of bases of an error free DMR segment: (RS codec size + payload size) * 8. The last segment only holds the rest of the data, so its
+    length is only known if the number of encoded bytes is given.
+    Args:
+        sequence_count: Segment number of the segment
+        rs_new_codec_size: Used RS codec size of the segments
+        payload_size: Number of payload bytes per segment
+        data_size: Number of encoded data bytes (e.g. the packed picture without compression), None if unknown
+        segment_number: Number of segments, only used if data_size is None to recognise the last segment
+    Returns:
+        Expected number of bases or None if unknown (last segment without data_size)
+    """
+    if data_size is not None:
+        segment_number = math.ceil(data_size / payload_size)
+    if segment_number is None or sequence_count >= segment_number:
+        return None
+
+    if sequence_count < segment_number - 1:
+        return (rs_new_codec_size + payload_size) * 8
+    if data_size is None:
+        return None
+
+    return (rs_new_codec_size + data_size - (segment_number - 1) * payload_size) * 8
+
+
+def decode_segment_dmr(segment, sequence_count, rs_new_codec_size, payload_size, verbose=False, mask=None, segment_length=None):
+    """
+    Decodes a single DMR segment to its payload bytes like the DMR mode of main_functions.picture_decode: RS scan, DMR correction of erroneous
+    segments (correct_segment_dmr), translation to bytes and removal of the RS symbols. Used by the streaming decoder, which decodes the segments
+    one by one as they are read.
+    Args:
+        segment: DNA segment
+        sequence_count: Segment number of the segment
+        rs_new_codec_size: Used RS codec size of the segments
+        payload_size: Number of payload bytes per segment
+        verbose: Determine if all results of the DMR correction should be displayed.
+        mask: Optional (seed, mask mode) of a single stream mask. The payload is then unmasked with the mask values of the segment position
+              (sequence_count * payload_size), which only needs the counter mode to be fast (see functions.mask_values_at).
+        segment_length: Expected number of bases of the segment for the DMR correction (see expected_segment_length), None if unknown
+    Returns:
+        List with payload_size bytes
+    """
+    rs_coder = func.get_rs_codec(rs_new_codec_size)
+    segment_bytes = (rs_new_codec_size + payload_size)
+
+    # Initial Scan: nur Segmente ohne Inkonsistenzen werden mit RS geprüft, die übrigen mit DMR korrigiert
+    byte_segments, validation_checks = func.translate_dna_segments_to_bytes([segment], [sequence_count])
+    if not (validation_checks[0] and func.rs_decode_prechecked(rs_coder, [byte_segments[0]])[0] is not None):
+        errornous_sequences, corrected_sequences = correct_segment_dmr(segment, sequence_count, rs_new_codec_size, verbose, segment_length)
+        if corrected_sequences:
+            segment = corrected_sequences[0][0]
+            byte_segments, validation_checks = func.translate_dna_segments_to_bytes([segment], [sequence_count])
+        else:
+            logging.error("Segment %s cannot be decoded by DMR:\n%s" % (sequence_count, segment))
+
+    if validation_checks[0] and len(segment) == segment_bytes * 8:
+        bytes_obj = byte_segments[0].tolist()
+    else:
+        # erweiterte Übersetzung, zu kurze oder zu lange Segmente wie in picture_decode anpassen
+        item = func.enhanced_translate_dna_to_binary_singular(segment, sequence_count)
+        if len(item) > segment_bytes * 8:
+            logging.error("Segment size inaccurate. %s bases too many." % abs(len(item) - segment_bytes * 8))
+            item = item[0: segment_bytes * 8]
+        if len(item) < segment_bytes * 8:
+            logging.error("Segment size inaccurate. %s bases too few." % abs(len(item) - segment_bytes * 8))
+            while len(item) < segment_bytes * 8:
+                item += str(random.randint(0, 1))
+        bytes_obj = func.bits_to_bytes(8, item)[0]
+
+    # RS Symbole entfernen
+    try:
+        decoded = list(rs_coder.decode(bytes_obj)[0])
+    except:
+        decoded = func.rs_force_uncorrect(rs_new_codec_size, 8, bytes_obj)[0]
+        logging.error("Too many errors for RS to correct, removing the appropriate number of symbols forcefully.\nByte sequence without RS Codes "
+                      "(first %s elements out of %s):%s" % (10, len(decoded), decoded[0:10]))
+
+    if len(decoded) > payload_size:
+        logging.error("Length of decoded list inaccurate. %s bases too many." % len(decoded[payload_size:]))
+        del decoded[payload_size:]
+    while len(decoded) < payload_size:
+        logging.error("Length of decoded list inaccurate. %s bases too few." % (payload_size - len(decoded)))
+        decoded.append(random.randint(0, 255))
+
+    if mask is not None:
+        mask_seed, mask_mode = mask
+        decoded = ((np.array(decoded, dtype=np.int64) - func.mask_values_at(mask_seed, sequence_count * payload_size, payload_size, 8, mask_mode)) % 256).tolist()
+
+    return decoded
+
+
+def _decode_segment_job(job):
+    # Einstiegspunkt für die Worker-Prozesse des Streaming-Decoders
+    return decode_segment_dmr(*job)
@@ -1,13 +1,19 @@
+import io
 import os
 import json
 import math
+import heapq
+import base64
+import hashlib
 import random
 import cv2 as cv
 import Levenshtein
 import numpy as np
 from PIL import Image
-import scipy.stats as stats
 from reedsolo import RSCodec
+from types import MappingProxyType
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 
 ##############################
@@ -15,31 +21,53 @@ from reedsolo import RSCodec
 ##############################
 
 
+def load_image(fp):
+    """
+    Reads an image from a file path or from memory, so written images don't have to be read from the disk again.
+    :param fp: File path, PNG/image file content (bytes, bytearray, memoryview or io.BytesIO) or an image array
+    (BGR or grayscale, e.g. the array returned by binary_to_1bit_image).
+    :return: The image as numpy array.
+    """
+
+    if isinstance(fp, np.ndarray):
+        return fp
+    if hasattr(fp, "getvalue"):   # io.BytesIO
+        fp = fp.getvalue()
+    if isinstance(fp, (bytes, bytearray, memoryview)):
+        image = cv.imdecode(np.frombuffer(fp, dtype=np.uint8), cv.IMREAD_COLOR)
+    else:
+        image = cv.imread(fp)
+
+    if image is None:
+        raise ValueError("The image could not be read. Please check the path or the image data.")
+    return image
+
+
 def read_1bit_image(fp, show_image=True):
     """
     This function converts an image to a black and white image containing only one bit for color coding.
-    In addition, the image is compressed with packbits.
-    :param fp: Sets the file path where the image was placed. The selected image must be an RGB image.
+    :param fp: Sets the file path where the image was placed. The selected image must be an RGB image. Images in memory
+    can be used as well (see load_image).
     :param show_image: Decide whether the image should be displayed.
-    :return: This function outputs a list of the values of the generated black and white image from the source image,
-    which were compressed using packbits.
+    :return: This function outputs a list of the values of the generated black and white image from the source image.
     """
 
-    """1. Vorbereiten des Bildes: Umwandeln in Schwarz-Weiß und Hinzufügen in Liste."""
-    thresh = thresh_image(fp, show_image)             # Wird in schwarz-weiß Bild umgewandelt
-    image_np_array = np.array(thresh)     # converts PIL images into NumPy arrays
-    image_list = image_np_array.tolist()  # NumPy Liste zu normaler Liste
-    image_1_bit_list = []
+    return read_1bit_image_array(fp, show_image).tolist()
 
-    """2. Umwandeln des Schwarz Weiß Bildes in 1 Bit Image."""
-    for row in image_list:
-        for value in row:
-            if value != 0:   # Wenn Value nicht gleich 0 dann = 1
-                image_1_bit_list += [value // 255]  # // = floor division: rounds the result down to the nearest whole
-            else:                                      # number [255//255] = 1, Restliche Werte = 0
-                image_1_bit_list += [value]   # Value = 0 --> übernehmen
 
-    return image_1_bit_list
+def read_1bit_image_array(fp, show_image=True, packed=False):
+    """
+    Array version of read_1bit_image: threshold --> uint8 bit array (row-major) --> optionally packbits.
+    :param fp: File path, image in memory or image array (see load_image).
+    :param show_image: Decide whether the image should be displayed.
+    :param packed: If True the bits are packed with np.packbits (8 pixels per byte).
+    :return: uint8 array with one bit per pixel or the packed bytes.
+    """
+
+    thresh = thresh_image(fp, show_image)             # Wird in schwarz-weiß Bild umgewandelt
+    bits = (np.asarray(thresh).ravel() != 0).astype(np.uint8)   # 255 --> 1, 0 --> 0
+
+    return np.packbits(bits) if packed else bits
 
 
 def thresh_image(fp, show_image=True):
@@ -47,16 +75,17 @@ def thresh_image(fp, show_image=True):
     This function converts a color image to a grayscale image and then to a black and white image.
     The conversion to a black and white image is done with a threshold. Pixel values below a certain threshold are
     set to 0 and the rest to 255. The optimal threshold for the image is determined by the Otsu-algorithm.
-    :param fp: Sets the file path where the image was placed. The selected image must be an RGB image.
+    :param fp: Sets the file path where the image was placed. The selected image must be an RGB image. Images in memory
+    can be used as well (see load_image).
     :param show_image: Decide whether the image should be displayed.
     :return: The function returns the black and white version of the input image.
     """
 
     """ 1. Read the image. """
-    image = cv.imread(fp)
+    image = load_image(fp)
 
     """ 2. Convert an image from BGR to grayscale mode. """
-    gray_image = cv.cvtColor(image, cv.COLOR_BGR2GRAY)
+    gray_image = cv.cvtColor(image, cv.COLOR_BGR2GRAY) if image.ndim == 3 else image.astype(np.uint8, copy=False)
 
     """ 3. Convert a grayscale image to black and white using binary thresholding. """
     (thresh, BnW_image) = cv.threshold(gray_image, 20, 255, cv.THRESH_BINARY | cv.THRESH_OTSU)
@@ -84,40 +113,253 @@ def binary_to_1bit_image(binary_list: list, width: int, height: int, filepath: s
     Returns: Returns the created Numpy_Array.
     """
 
-    image_1_bit_list = []
-    if len(binary_list) == 0:
+    return write_1bit_image_array(binary_list, width, height, f"{filepath}\\{filename}.png")
+
+
+def write_1bit_image_array(bits, width: int, height: int, fp=None, packed=False):
+    """
+    Array version of binary_to_1bit_image: (packed) bit array --> 0/255 image array --> PNG. Bits that are too much
+    are ignored, missing pixels are filled with random bits of the random module.
+    :param bits: Bits as list or uint8 array (one pixel per value) or packed bytes.
+    :param width: Defines the image width.
+    :param height: Defines the image height.
+    :param fp: File path or file object (e.g. io.BytesIO) for the PNG. None only returns the array.
+    :param packed: If True bits contains 8 pixels per byte (np.packbits).
+    :return: uint8 image array with the shape (height, width) and the values 0 and 255.
+    """
+
+    bits = np.asarray(bits, dtype=np.uint8).ravel()
+    if packed:
+        bits = np.unpackbits(bits)
+    if len(bits) == 0:
         raise ValueError("The binary list entered does not contain any entries. Please change the entry.")
 
     # Prüfen, ob die Bildgröße passt. Falls zu groß soll der Überhang entfernt werden.
     pixel = width * height
-
     if pixel == 0:
         raise ValueError("The entered image size corresponds to 0x0 pixels. Please enter the correct dimensions.")
 
-    if pixel < len(binary_list):
-        data = binary_list[0: pixel]
-    elif pixel > len(binary_list):
-        data = binary_list
-        for add in range(pixel-len(binary_list)):
-            data.append(random.choice([0, 1]))
-    else:
-        data = binary_list
+    if pixel > len(bits):
+        bits = np.concatenate((bits, random_bit_array(pixel - len(bits))))
 
     # 0 und 1 in Graustufen (0 und 255) wiedergeben
-    image_1_bit_list = [255 if element != 0 else 0 for element in data]
+    image_np_array = np.where(bits[:pixel] != 0, 255, 0).astype(np.uint8).reshape(height, width)
 
-    # Liste mit Arrays der Bildgrößen erstellen
-    picture_list = lambda image_1bit_list, wide: [image_1_bit_list[i:i + wide] for i in range(0, len(image_1_bit_list), wide)]
-    final_picture_list = picture_list(image_1_bit_list, width)
+    # Bild speichern
+    if fp is not None:
+        Image.fromarray(image_np_array, mode='L').save(fp, format="PNG")
 
-    # in Numpy Array umwandeln
-    image_np_array = np.array(final_picture_list)
+    return image_np_array
 
-    # Bild einlesen und speichern
-    picture = Image.fromarray(image_np_array.astype('uint8'), mode='L')
-    picture.save(f"{filepath}\\{filename}.png")
 
-    return image_np_array
+def pgm_memmap(fp):
+    """
+    Maps the pixels of a binary 8-bit PGM file (e.g. written by write_1bit_image_stream) with numpy.memmap, so the image
+    rows are only read from the disk when they are used.
+    :param fp: File path of the image.
+    :return: Read-only uint8 numpy.memmap with the shape (height, width) or None if the file is not a binary 8-bit PGM.
+    """
+
+    with open(fp, "rb") as infile:
+        header = infile.read(1024)
+    if not header.startswith(b"P5"):
+        return None
+
+    # Kopf: P5 Breite Höhe Maximalwert, getrennt durch Leerzeichen, Kommentare mit #
+    fields = []
+    position = 2
+    while len(fields) < 3:
+        while header[position:position + 1].isspace():
+            position += 1
+        if header[position:position + 1] == b"#":
+            position = header.find(b"\n", position)
+            if position == -1:
+                return None
+            continue
+        end = position
+        while header[end:end + 1].isdigit():
+            end += 1
+        if end == position:
+            return None
+        fields.append(int(header[position:end]))
+        position = end
+
+    width, height, max_value = fields
+    if max_value > 255 or not header[position:position + 1].isspace():
+        return None
+    return np.memmap(fp, dtype=np.uint8, mode="r", offset=position + 1, shape=(height, width))
+
+
+def load_image_tiles_source(fp):
+    """
+    Opens a file path or an image in memory for the tile iterators with as little memory as possible. Binary PGM files
+    are mapped with numpy.memmap (see pgm_memmap) and read band by band, grayscale and 1-bit images are decoded directly
+    to grayscale (one byte per pixel). Only color images are decoded completely as BGR image like in load_image.
+    :param fp: File path or image in memory (see load_image).
+    :return: numpy.memmap or image array (grayscale or BGR).
+    """
+
+    if hasattr(fp, "getvalue"):   # io.BytesIO
+        fp = fp.getvalue()
+    in_memory = isinstance(fp, (bytes, bytearray, memoryview))
+
+    if not in_memory:
+        image = pgm_memmap(fp)
+        if image is not None:
+            return image
+
+    # PIL liest nur den Kopf, das Bild wird noch nicht dekodiert
+    try:
+        with Image.open(io.BytesIO(bytes(fp)) if in_memory else fp) as pil_image:
+            grayscale = pil_image.mode in ("1", "L")
+    except (OSError, ValueError):
+        grayscale = False
+    if not grayscale:
+        return load_image(fp)
+
+    if in_memory:
+        image = cv.imdecode(np.frombuffer(fp, dtype=np.uint8), cv.IMREAD_GRAYSCALE)
+    else:
+        image = cv.imread(fp, cv.IMREAD_GRAYSCALE)
+    if image is None:
+        raise ValueError("The image could not be read. Please check the path or the image data.")
+    return image
+
+
+def random_bit_array(bit_number: int):
+    """
+    Random bits of the random module for missing pixels (random.randbytes --> np.unpackbits).
+    :param bit_number: Number of bits.
+    :return: uint8 array with bit_number values of 0 and 1.
+    """
+
+    return np.unpackbits(np.frombuffer(random.randbytes(math.ceil(bit_number / 8)), dtype=np.uint8))[:bit_number]
+
+
+def iter_image_tiles(image, tile_rows=256):
+    """
+    Generator over the rows of an image in tiles of tile_rows rows, converted to grayscale like in thresh_image. Only one
+    tile is converted at a time, so a numpy.memmap of a large raw scan is never loaded completely. File paths and images
+    in memory are opened with load_image_tiles_source: only binary PGM files are read band by band, other formats are
+    decoded completely (grayscale images with one byte per pixel, color images as BGR image).
+    :param image: File path or image in memory (see load_image), image array / numpy.memmap (BGR or grayscale) or an iterable of such tiles.
+    :param tile_rows: Number of image rows per tile (only used for file paths and arrays).
+    :return: Yields uint8 grayscale arrays with the shape (rows, width).
+    """
+
+    if isinstance(image, (str, bytes, bytearray, memoryview)) or hasattr(image, "getvalue"):
+        image = load_image_tiles_source(image)
+
+    if isinstance(image, np.ndarray):
+        if tile_rows < 1:
+            raise ValueError("tile_rows must be at least 1.")
+        tiles = (image[row:row + tile_rows] for row in range(0, image.shape[0], tile_rows))
+    else:
+        tiles = image
+
+    for tile in tiles:
+        tile = np.ascontiguousarray(tile)
+        if tile.ndim == 3:
+            tile = cv.cvtColor(tile, cv.COLOR_BGR2GRAY)
+        yield tile.astype(np.uint8, copy=False)
+
+
+def otsu_threshold_from_histogram(histogram):
+    """
+    Determines the Otsu threshold from a 256 bin grayscale histogram. Gives the same threshold as cv.threshold with
+    cv.THRESH_OTSU, but the histogram can be summed up tile by tile, so the image doesn't have to be in memory.
+    :param histogram: 256 bin histogram of the grayscale values.
+    :return: Threshold value, pixels with a greater value are white (1).
+    """
+
+    histogram = np.asarray(histogram, dtype=np.float64)
+    total = histogram.sum()
+    if total == 0:
+        return 0
+
+    mu = float(np.dot(np.arange(256), histogram)) / total
+    q1 = mu1 = max_sigma = 0.0
+    max_value = 0
+    epsilon = float(np.finfo(np.float32).eps)
+
+    # gleiche Schleife wie in OpenCV (getThreshVal_Otsu_8u)
+    for i in range(256):
+        p_i = histogram[i] / total
+        mu1 *= q1
+        q1 += p_i
+        q2 = 1.0 - q1
+
+        if min(q1, q2) < epsilon or max(q1, q2) > 1.0 - epsilon:
+            continue
+
+        mu1 = (mu1 + i * p_i) / q1
+        mu2 = (mu - q1 * mu1) / q2
+        sigma = q1 * q2 * (mu1 - mu2) * (mu1 - mu2)
+        if sigma > max_sigma:
+            max_sigma = sigma
+            max_value = i
+
+    return max_value
+
+
+def iter_1bit_image_tiles(image, tile_rows=256, threshold=None):
+    """
+    Streaming version of read_1bit_image: yields the 1-bit values of the image tile by tile (row-major like
+    read_1bit_image). Without a given threshold the Otsu threshold is determined in a first pass over the tiles, so the
+    image source must be readable twice (file path or array). The memory stays bounded for numpy.memmap, binary PGM
+    files and tile iterables, other image files are decoded completely (see load_image_tiles_source).
+    :param image: File path, image array / numpy.memmap or an iterable of tiles (see iter_image_tiles).
+    :param tile_rows: Number of image rows per tile.
+    :param threshold: Fixed threshold (pixel > threshold --> 1). None uses the Otsu threshold like thresh_image.
+    :return: Yields uint8 arrays with the shape (rows, width) containing 0 and 1.
+    """
+
+    if isinstance(image, (str, bytes, bytearray, memoryview)) or hasattr(image, "getvalue"):
+        image = load_image_tiles_source(image)
+
+    if threshold is None:
+        if not isinstance(image, np.ndarray):
+            raise ValueError("The Otsu threshold needs two passes over the image. Please enter a file path or an array, or set the threshold.")
+        histogram = np.zeros(256, dtype=np.int64)
+        for tile in iter_image_tiles(image, tile_rows):
+            histogram += np.bincount(tile.ravel(), minlength=256)
+        threshold = otsu_threshold_from_histogram(histogram)
+
+    for tile in iter_image_tiles(image, tile_rows):
+        yield (tile > threshold).astype(np.uint8)
+
+
+def write_1bit_image_stream(rows, width: int, height: int, fp):
+    """
+    Writes the rows of a 1-bit image from a generator (e.g. main_functions.picture_decode_stream) one after another to a
+    binary PGM file (0 and 255 like binary_to_1bit_image), so the image doesn't have to be in memory. Missing rows are
+    filled with random pixels like in binary_to_1bit_image, rows that are too much are ignored.
+    :param rows: Iterable of rows with 0 and 1 values.
+    :param width: Defines the image width.
+    :param height: Defines the image height.
+    :param fp: File path of the PGM file (can be read with cv.imread or PIL).
+    :return: Number of rows taken from the generator.
+    """
+
+    if width * height == 0:
+        raise ValueError("The entered image size corresponds to 0x0 pixels. Please enter the correct dimensions.")
+
+    written = 0
+    with open(fp, "wb") as outfile:
+        outfile.write(b"P5\n%d %d\n255\n" % (width, height))
+        for row in rows:
+            if written == height:
+                break
+            row = np.asarray(row, dtype=np.uint8)[:width]
+            if len(row) < width:
+                row = np.concatenate((row, random_bit_array(width - len(row))))
+            outfile.write(((row != 0) * 255).astype(np.uint8).tobytes())
+            written += 1
+
+        for _ in range(height - written):
+            outfile.write((random_bit_array(width) * 255).tobytes())
+
+    return written
 
 
 
@@ -126,6 +368,71 @@ def binary_to_1bit_image(binary_list: list, width: int, height: int, filepath: s
 ###########################
 
 
+def values_to_bit_array(values, bit_number: int = 8):
+    """
+    Converts integer values (bytes or larger symbols like 10 or 16 bit) to a uint8 array of bits, most significant bit
+    first. For 8 bit np.unpackbits is used, for other bit numbers the bits are extracted by shift and mask.
+
+    Args:
+        values: Values as list, bytes or array (uint8, uint16, ...). Every value must be smaller than 2**bit_number.
+        bit_number: Number of bits per value.
+
+    Returns:
+        uint8 array with len(values) * bit_number bits
+    """
+    values = np.asarray(values).ravel()
+
+    if bit_number == 8:
+        return np.unpackbits(values.astype(np.uint8, copy=False))
+
+    shifts = np.arange(bit_number - 1, -1, -1, dtype=np.uint64)
+    return ((values.astype(np.uint64)[:, None] >> shifts) & 1).astype(np.uint8).ravel()
+
+
+def bit_array_to_values(bits, bit_number: int = 8):
+    """
+    Converts a bit array (most significant bit first) to integer values with bit_number bits. Like bits_to_bytes a
+    shorter last group is read as a number with fewer bits (e.g. the bits 101 give 5) and not filled with zeros.
+
+    Args:
+        bits: Bits as list or array of 0 and 1.
+        bit_number: Number of bits per value.
+
+    Returns:
+        Array with the values (uint8 up to 8 bits, uint16 up to 16 bits, otherwise uint64)
+    """
+    bits = np.asarray(bits, dtype=np.uint8).ravel()
+    dtype = np.uint8 if bit_number <= 8 else np.uint16 if bit_number <= 16 else np.uint64
+
+    full_length = len(bits) - len(bits) % bit_number
+    if bit_number == 8:
+        values = np.packbits(bits[:full_length])
+    else:
+        weights = np.left_shift(np.uint64(1), np.arange(bit_number - 1, -1, -1, dtype=np.uint64))
+        values = (bits[:full_length].reshape(-1, bit_number).astype(np.uint64) * weights).sum(axis=1, dtype=np.uint64).astype(dtype)
+
+    if full_length != len(bits):   # kürzeres letztes Stück wie int(..., 2)
+        tail = bits[full_length:]
+        tail_value = int((tail.astype(np.uint64) << np.arange(len(tail) - 1, -1, -1, dtype=np.uint64)).sum())
+        values = np.append(values, np.array([tail_value], dtype=dtype))
+
+    return values
+
+
+def bit_string_to_array(bit_string: str):
+    """
+    Converts a string of 1's and 0's to a uint8 bit array.
+    """
+    return np.frombuffer(bit_string.encode("ascii"), dtype=np.uint8) - ord("0")
+
+
+def bit_array_to_string(bits):
+    """
+    Converts a bit array to a string of 1's and 0's.
+    """
+    return (np.asarray(bits, dtype=np.uint8) + ord("0")).tobytes().decode("ascii")
+
+
 def bytes_to_bits(bit_number: int, *args: list):
     """
     Converts byte objects to bits in string form (string of 1's and 0's)
@@ -138,7 +445,14 @@ def bytes_to_bits(bit_number: int, *args: list):
         For each object entered in *bytes_objects, the object as a string of 1's and 0's corresponding to the sequence
         of bits.
     """
-    bits_list = [''.join([bin(item).replace("0b", "").zfill(bit_number) for item in arg]) for arg in args]
+    bits_list = []
+    for arg in args:
+        values = np.asarray(arg if isinstance(arg, np.ndarray) else list(arg), dtype=np.int64)
+        if len(values) and (values.min() < 0 or values.max() >= 2 ** bit_number):
+            # Werte außerhalb des Bitbereichs wie bisher mit bin() formatieren
+            bits_list.append(''.join([bin(item).replace("0b", "").zfill(bit_number) for item in arg]))
+        else:
+            bits_list.append(bit_array_to_string(values_to_bit_array(values, bit_number)))
 
     return tuple(bits_list)
 
@@ -154,7 +468,7 @@ def bits_to_bytes(bit_number: int, *args: str):
     Returns:
         For each string entered in *bits_strings, the string as a bytes object
     """
-    bytes_list = [[int(arg[i:i + bit_number], 2) for i in range(0, len(arg), bit_number)] for arg in args]
+    bytes_list = [bit_array_to_values(bit_string_to_array(arg), bit_number).tolist() for arg in args]
 
     return tuple(bytes_list)
 
@@ -164,7 +478,123 @@ def bits_to_bytes(bit_number: int, *args: str):
 ###########################
 
 
-def random_mask(value_array, seed, bitlen=8):
+MASK_MODES = ("legacy", "generator", "counter")   # legacy: wie random.seed(seed) + random.randint, generator: numpy Generator, counter: Philox
+
+
+class MaskKeystream:
+    """
+    Keystream of random mask values for random_mask and remove_mask. The values are generated in vectorized chunks and
+    the global state of the random module is not touched, so masks can be created in parallel threads and processes.
+
+    Modes:
+        legacy: Bit-exact the values of random.seed(seed) followed by random.randint(0, 2**bitlen-1) per value. The
+                Mersenne Twister state of random.Random(seed) is copied to numpy's MT19937 and the rejection sampling of
+                randint (getrandbits(bitlen+1) until the value is smaller than 2**bitlen) is done on whole arrays.
+        generator: Values of numpy.random.default_rng(seed). Faster, but not compatible with masks of the legacy mode.
+        counter: Counter-based Philox keystream keyed by the seed. The value at position p is the upper bitlen bits of
+                 the p-th 64 bit word, so seek jumps to any position in O(1) and a range of values can be produced
+                 without generating the values before it (see mask_values_at).
+
+    Args:
+        seed: Seed of the mask.
+        bitlen: Number of bits of the masked values.
+        mode: One of MASK_MODES.
+    """
+
+    def __init__(self, seed, bitlen=8, mode="legacy"):
+        if mode not in MASK_MODES:
+            raise ValueError(f"Unknown mask mode {mode}. Please choose one of {MASK_MODES}.")
+
+        self.seed = seed
+        self.bitlen = bitlen
+        self.mode = mode
+        self.position = 0
+        self._pending = np.zeros(0, dtype=np.int64)   # bereits erzeugte, noch nicht ausgegebene Werte
+        self._bit_generator = None
+
+        if mode == "legacy":
+            self._random = random.Random(seed)
+            if bitlen < 32:
+                # getrandbits(k <= 32) nutzt genau ein 32-Bit Wort des Mersenne Twisters
+                state = self._random.getstate()[1]
+                self._bit_generator = np.random.MT19937()
+                self._bit_generator.state = {"bit_generator": "MT19937", "state": {"key": np.array(state[:624], dtype=np.uint32), "pos": state[624]}}
+        elif mode == "generator":
+            self._generator = np.random.default_rng(seed)
+        else:
+            if not 0 < bitlen < 64:
+                raise ValueError("The counter mode supports values with 1 to 63 bits.")
+            self._bit_generator = np.random.Philox(key=seed % 2**128)
+
+    def seek(self, position: int):
+        """
+        Sets the keystream to the given value position. The counter mode jumps directly to the Philox block of the
+        position, the other modes have to generate (or regenerate) all values before it.
+        """
+        position = int(position)
+        if self.mode == "counter":
+            # 4 Wörter pro Philox Block
+            self._bit_generator = np.random.Philox(key=self.seed % 2**128, counter=position // 4)
+            self._bit_generator.random_raw(position % 4)
+            self.position = position
+            return
+
+        if position < self.position:
+            self.__init__(self.seed, self.bitlen, self.mode)
+        self.take(position - self.position)
+
+    def take(self, count: int):
+        """
+        Returns the next count mask values as int64 array.
+        """
+        count = int(count)
+        if self.mode == "generator":
+            values = self._generator.integers(0, 2 ** self.bitlen, size=count, dtype=np.int64)
+        elif self.mode == "counter":
+            values = (self._bit_generator.random_raw(count) >> np.uint64(64 - self.bitlen)).astype(np.int64)
+        elif self._bit_generator is None:
+            values = np.array([self._random.randint(0, 2 ** self.bitlen - 1) for _ in range(count)], dtype=np.int64)
+        else:
+            parts = [self._pending]
+            available = len(self._pending)
+            while available < count:
+                # etwa die Hälfte der Wörter wird bei randint verworfen
+                words = self._bit_generator.random_raw(2 * (count - available) + 64)
+                candidates = (words >> np.uint64(31 - self.bitlen)).astype(np.int64)
+                accepted = candidates[candidates < 2 ** self.bitlen]
+                parts.append(accepted)
+                available += len(accepted)
+            stream = np.concatenate(parts)
+            values, self._pending = stream[:count], stream[count:]
+
+        self.position += count
+        return values
+
+
+def mask_values_at(seed, start: int, count: int, bitlen=8, mode="counter"):
+    """
+    Returns the mask values of the positions start to start + count - 1, e.g. the mask of one segment of a single
+    stream mask with start = segment index * payload size. In the counter mode the effort only depends on count, so
+    segments can be unmasked independently of each other and in any order.
+
+    Args:
+        seed: Seed of the mask.
+        start: Position of the first value in the keystream.
+        count: Number of values.
+        bitlen: Number of bits of the masked values.
+        mode: Mask mode (see MaskKeystream). The legacy and generator modes have to generate all values before start.
+
+    Returns:
+        Array with the mask values
+    """
+
+    keystream = MaskKeystream(seed, bitlen, mode)
+    keystream.seek(start)
+
+    return keystream.take(count)
+
+
+def random_mask(value_array, seed, bitlen=8, mode="legacy"):
     """
     This function creates a random mask over an input array of values. This mask is used to vary the pixel values of
     a uniform image. Without this variation the image could not be stored in DNA, because no successful synthesis
@@ -174,23 +604,19 @@ def random_mask(value_array, seed, bitlen=8):
         value_array: Defines the values to be randomized. These must be entered as an array and can for example come from an image.
         seed: Defines the seed to be used by the random generator.
         bitlen: A positive integer that expresses the number of bits in a bit string.
+        mode: Mask mode (see MaskKeystream). The default legacy mode gives the same masks as before.
 
     Returns:
         The function returns a list of randomized values.
     """
 
-    random_gridded_value_list = []
-    random.seed(seed)
-
-    for value in value_array:
-        random_gridded_value_list += [(value + random.randint(0, 2**bitlen-1)) % 2**bitlen]
+    values = np.asarray(value_array, dtype=np.int64).ravel()
+    keystream = MaskKeystream(seed, bitlen, mode).take(len(values))
 
-    random.seed()
+    return ((values + keystream) % 2**bitlen).tolist()
 
-    return random_gridded_value_list
 
-
-def remove_mask(decoded_list: list, seed: int, bitlen=8):
+def remove_mask(decoded_list: list, seed: int, bitlen=8, mode="legacy"):
     """
     This function removes the random mask, which was used to vary the pixel values of a uniform image. Without this variation the image could not be stored in
     DNA, because no successful synthesis could take place.
@@ -199,22 +625,72 @@ def remove_mask(decoded_list: list, seed: int, bitlen=8):
         decoded_list: A list with the corrected byte values.
         seed: Defines the seed to be used by the random generator.
         bitlen: A positive integer that expresses the number of bits in a bit string.
+        mode: Mask mode that was used in random_mask (see MaskKeystream).
 
     Returns:
         The function returns a list with the unmasked values.
     """
 
-    unmasked_value = []
-    random.seed(seed)
-    for value in decoded_list:
-        fixed = value - random.randint(0, 2**bitlen-1)
-        if fixed >= 0:
-            unmasked_value.append(fixed)
-        else:
-            unmasked_value.append(fixed+2**bitlen)
-    random.seed()
+    values = np.asarray(decoded_list, dtype=np.int64).ravel()
+    fixed = values - MaskKeystream(seed, bitlen, mode).take(len(values))
+    fixed[fixed < 0] += 2**bitlen
 
-    return unmasked_value
+    return fixed.tolist()
+
+
+class XorKeystream:
+    """
+    Byte keystream of the XOR whitening (see xor_whitening).
+
+    Modes:
+        legacy: Bit-exact the xor string of random.seed(seed) followed by random.randint(0, 1) per bit, packed into
+                bytes (first bit in the highest bit of the byte) like in encoding_picture before.
+        generator, counter: One value of MaskKeystream(seed, 8, mode) per byte.
+
+    Args:
+        seed: Seed of the xor string.
+        mode: One of MASK_MODES.
+    """
+
+    def __init__(self, seed, mode="legacy"):
+        self.mode = mode
+        self._keystream = MaskKeystream(seed, 1 if mode == "legacy" else 8, mode)
+
+    def seek(self, position: int):
+        """
+        Sets the keystream to the given byte position.
+        """
+        self._keystream.seek(8 * position if self.mode == "legacy" else position)
+
+    def take(self, count: int):
+        """
+        Returns the next count key bytes as uint8 array.
+        """
+        if self.mode == "legacy":
+            return np.packbits(self._keystream.take(8 * count).astype(np.uint8))
+        return self._keystream.take(count).astype(np.uint8)
+
+
+def xor_whitening(values, seed, mode="legacy"):
+    """
+    XORs the bytes with a random byte keystream, so that long runs of equal bits (e.g. white image areas) are broken up.
+    Applying the function a second time with the same seed removes the xor string again.
+
+    Args:
+        values: Bytes as list or uint8 array.
+        seed: Seed of the xor string or an XorKeystream, which is continued from its current position (e.g. for the
+              segments of a stream).
+        mode: Keystream mode (see XorKeystream), ignored if seed is an XorKeystream. The default legacy mode gives the
+              same result as before.
+
+    Returns:
+        uint8 array with the xored bytes
+    """
+
+    values = np.asarray(values, dtype=np.uint8).ravel()
+    keystream = seed if isinstance(seed, XorKeystream) else XorKeystream(seed, mode)
+
+    return np.bitwise_xor(values, keystream.take(len(values)))
 
 
 ###########################
@@ -243,6 +719,636 @@ def segment_string(message, segment_size):
     return segment_list
 
 
+#########################
+###### Packed DNA #######
+#########################
+
+PACKED_DNA_BASES = "ACGT"   # Codes 0-3, gleiche Reihenfolge wie DMR_BASES
+
+
+class PackedDNA:
+    """
+    DNA sequence with 2 bits per base (4 bases per byte, first base in the highest bits). Instead of spacer characters
+    (XXXXXX) the segment boundaries are stored as offsets, so the segments don't have to be split and joined as strings.
+    Slices and segments are views on the same packed buffer (zero-copy), only the small offset array is adjusted.
+    The 2-mere codes (4 * first base + second base) are the same codes as in DMR_Mapping_Table. They are the two halves of
+    the packed bytes and are split once per buffer on the first request; all views share this array, so two_mere_codes and
+    segment_code_matrix return views as well.
+
+    Args:
+        data: Packed uint8 array
+        length: Number of bases
+        offsets: Segment boundaries (start of every segment and the end of the last one), relative to start. Default is one segment.
+        start: First base of the view in data
+    """
+
+    __slots__ = ("_data", "_start", "_length", "_offsets", "_two_meres")
+
+    def __init__(self, data, length: int, offsets=None, start: int = 0):
+        self._data = np.asarray(data, dtype=np.uint8)
+        self._start = int(start)
+        self._length = int(length)
+        if self._start + self._length > len(self._data) * 4:
+            raise ValueError("The packed data is shorter than the given length.")
+        if offsets is None:
+            offsets = (0, self._length)
+        self._offsets = np.asarray(offsets, dtype=np.int64)
+        self._two_meres = [None]   # 2-mere Codes des ganzen Puffers, wird mit allen Views geteilt
+
+    def __reduce__(self):
+        # ohne die 2-mere Codes, der Empfänger teilt sie bei Bedarf neu auf
+        return PackedDNA, (self._data, self._length, self._offsets, self._start)
+
+    def _view(self, length: int, offsets, start: int):
+        """View on the same buffer, which shares the 2-mere codes."""
+        view = PackedDNA(self._data, length, offsets, start)
+        view._two_meres = self._two_meres
+        return view
+
+    @classmethod
+    def from_codes(cls, codes, segment_lengths=None):
+        """
+        Packs an array of base codes (A = 0, C = 1, G = 2, T = 3).
+        :param codes: Array of base codes
+        :param segment_lengths: Lengths of the segments. Default is one segment.
+        :return: PackedDNA
+        """
+        codes = np.asarray(codes, dtype=np.uint8)
+        length = len(codes)
+        padded = np.zeros(-(-length // 4) * 4, dtype=np.uint8)
+        padded[:length] = codes & 3
+        padded = padded.reshape(-1, 4)
+        data = (padded[:, 0] << 6) | (padded[:, 1] << 4) | (padded[:, 2] << 2) | padded[:, 3]
+
+        offsets = None
+        if segment_lengths is not None:
+            offsets = np.concatenate([[0], np.cumsum(segment_lengths, dtype=np.int64)])
+            if offsets[-1] != length:
+                raise ValueError("The segment lengths don't match the number of bases.")
+
+        return cls(data, length, offsets)
+
+    @classmethod
+    def from_two_mere_codes(cls, code_array, segment_lengths=None):
+        """
+        Packs 2-mere codes (see DMR_Mapping_Table), e.g. the output of translate_dibits_to_dmr_batch, without a detour over
+        single bases or strings. Two codes give one byte.
+        :param code_array: uint8 array of 2-mere codes (0 - 15). A 2-D array (segments, 2-meres) gives one segment per row.
+        :param segment_lengths: Lengths of the segments in bases. Default is one segment per row of a 2-D array and one
+        segment for a 1-D array.
+        :return: PackedDNA
+        """
+        code_array = np.asarray(code_array, dtype=np.uint8)
+        if segment_lengths is None and code_array.ndim == 2:
+            segment_lengths = [code_array.shape[1] * 2] * code_array.shape[0]
+        codes = code_array.ravel()
+        length = len(codes) * 2
+        if len(codes) % 2 != 0:
+            codes = np.append(codes, np.uint8(0))
+        data = (codes[0::2] << 4) | (codes[1::2] & 15)
+
+        offsets = None
+        if segment_lengths is not None:
+            offsets = np.concatenate([[0], np.cumsum(segment_lengths, dtype=np.int64)])
+            if offsets[-1] != length:
+                raise ValueError("The segment lengths don't match the number of 2-meres.")
+
+        return cls(data, length, offsets)
+
+    @classmethod
+    def from_segments(cls, segments):
+        """
+        Packs a list of DNA strings, every string becomes one segment.
+        :param segments: List of DNA strings (only A, C, G and T)
+        :return: PackedDNA
+        """
+        segments = list(segments)
+        return cls.from_codes(_bases_to_codes("".join(segments)), [len(segment) for segment in segments])
+
+    @classmethod
+    def from_string(cls, sequence: str, spacer: str = "X"):
+        """
+        Packs a DNA string with spacers (e.g. segments joined with XXXXXX). The spacers are removed and stored as segment
+        boundaries, empty parts are dropped like in dna.split("X").
+        :param sequence: DNA string
+        :param spacer: Spacer character
+        :return: PackedDNA
+        """
+        return cls.from_segments([segment for segment in sequence.split(spacer) if segment != ""])
+
+    def __len__(self):
+        return self._length
+
+    @property
+    def nbytes(self):
+        """Number of bytes of the packed buffer used by this view."""
+        return -(-(self._start + self._length) // 4) - self._start // 4
+
+    @property
+    def segment_offsets(self):
+        """Segment boundaries relative to the start of the view (read only)."""
+        offsets = self._offsets.view()
+        offsets.flags.writeable = False
+        return offsets
+
+    @property
+    def num_segments(self):
+        return len(self._offsets) - 1
+
+    def segment_lengths(self):
+        return np.diff(self._offsets)
+
+    def segment_range(self, start: int, stop: int):
+        """
+        Returns the segments start to stop - 1 as one view.
+        :param start: Number of the first segment
+        :param stop: Number of the segment after the last one
+        :return: PackedDNA with stop - start segments
+        """
+        start, stop, _ = slice(start, stop).indices(self.num_segments)
+        stop = max(start, stop)
+        offsets = self._offsets[start:stop + 1] - self._offsets[start]
+        return self._view(int(offsets[-1]), offsets, self._start + int(self._offsets[start]))
+
+    def drop_empty_segments(self):
+        """
+        Returns a view without the empty segments (like the empty parts after dna.split("X")).
+        :return: PackedDNA
+        """
+        return self._view(self._length, np.unique(self._offsets), self._start)
+
+    def segment(self, index: int):
+        """
+        Returns a segment as view.
+        :param index: Number of the segment
+        :return: PackedDNA with one segment
+        """
+        if index < 0:
+            index += self.num_segments
+        if not 0 <= index < self.num_segments:
+            raise IndexError("segment index out of range")
+        start, stop = int(self._offsets[index]), int(self._offsets[index + 1])
+        return self._view(stop - start, None, self._start + start)
+
+    def segments(self):
+        """Iterates over all segments (views)."""
+        for index in range(self.num_segments):
+            yield self.segment(index)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            start, stop, step = item.indices(self._length)
+            if step != 1:
+                return PackedDNA.from_codes(self.codes()[item])
+            stop = max(start, stop)
+            # Segmentgrenzen auf den Ausschnitt begrenzen, der Puffer wird nicht kopiert
+            offsets = np.unique(np.clip(self._offsets - start, 0, stop - start))
+            if len(offsets) == 1:
+                offsets = np.array([0, 0], dtype=np.int64)
+            return self._view(stop - start, offsets, self._start + start)
+
+        index = int(item)
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("base index out of range")
+        position = self._start + index
+        return PACKED_DNA_BASES[(self._data[position // 4] >> (6 - 2 * (position % 4))) & 3]
+
+    def codes(self):
+        """
+        Unpacks the view into base codes.
+        :return: uint8 array with one code (0-3) per base
+        """
+        first_byte = self._start // 4
+        last_byte = -(-(self._start + self._length) // 4)
+        packed = self._data[first_byte:last_byte]
+        unpacked = np.empty((len(packed), 4), dtype=np.uint8)
+        for i in range(4):
+            unpacked[:, i] = (packed >> (6 - 2 * i)) & 3
+        offset = self._start - first_byte * 4
+        return unpacked.ravel()[offset:offset + self._length]
+
+    def _two_mere_buffer(self):
+        """
+        2-mere codes of the whole packed buffer (the two halves of every byte), read only. They are split on the first call
+        and shared by all views of the buffer.
+        """
+        if self._two_meres[0] is None:
+            two_meres = np.empty((len(self._data), 2), dtype=np.uint8)
+            two_meres[:, 0] = self._data >> 4
+            two_meres[:, 1] = self._data & 15
+            two_meres = two_meres.ravel()
+            two_meres.flags.writeable = False
+            self._two_meres[0] = two_meres
+        return self._two_meres[0]
+
+    def two_mere_codes(self):
+        """
+        2-mere codes of the view (4 * first base + second base), an incomplete last 2-mere is dropped. If the view starts on a
+        2-mere boundary, the result is a read only view on the shared 2-mere codes of the buffer (zero-copy).
+        :return: uint8 array with length // 2 codes
+        """
+        number = self._length // 2
+        if self._start % 2 == 0:
+            return self._two_mere_buffer()[self._start // 2:self._start // 2 + number]
+
+        codes = self.codes()
+        return (codes[0:number * 2:2] << 2) | codes[1:number * 2:2]
+
+    def segment_code_matrix(self):
+        """
+        2-mere codes of all segments as matrix, for the batch functions (see dna_to_dmr_code_array). All segments need the same
+        length, an incomplete last 2-mere gets the code 16. Segments of even length starting on a 2-mere boundary are returned
+        as read only view on the shared 2-mere codes (zero-copy).
+        :return: uint8 array with the shape (segments, ceil(length / 2))
+        """
+        lengths = self.segment_lengths()
+        if len(lengths) and (lengths != lengths[0]).any():
+            raise ValueError("All DNA segments of a batch need the same length.")
+        segment_length = int(lengths[0]) if len(lengths) else 0
+
+        first = self._start + int(self._offsets[0])
+        if segment_length % 2 == 0 and first % 2 == 0:
+            two_meres = self._two_mere_buffer()[first // 2:first // 2 + len(lengths) * segment_length // 2]
+            return two_meres.reshape(len(lengths), segment_length // 2)
+
+        codes = self.codes()[self._offsets[0]:self._offsets[-1]].reshape(len(lengths), segment_length)
+        matrix = np.full((len(lengths), -(-segment_length // 2)), 16, dtype=np.uint8)
+        matrix[:, 0:segment_length // 2] = (codes[:, 0:segment_length // 2 * 2:2] << 2) | codes[:, 1:segment_length // 2 * 2:2]
+        return matrix
+
+    def packed_bytes(self):
+        """
+        Packed bases of the view as bytes (first base in the highest bits of the first byte, unused bits of the last byte are 0).
+        A view on a byte boundary with a length divisible by 4 is copied from the buffer without unpacking.
+        """
+        if self._start % 4 == 0 and self._length % 4 == 0:
+            return self._data[self._start // 4:(self._start + self._length) // 4].tobytes()
+        return PackedDNA.from_codes(self.codes())._data.tobytes()
+
+    def __str__(self):
+        return _codes_to_bases(self.codes())
+
+    def to_strings(self):
+        """Returns the segments as list of DNA strings."""
+        sequence = str(self)
+        return [sequence[self._offsets[i]:self._offsets[i + 1]] for i in range(self.num_segments)]
+
+    def to_spacer_string(self, spacer: str = "XXXXXX"):
+        """Returns the DNA as one string with the spacer between the segments (like "XXXXXX".join(segments))."""
+        return spacer.join(self.to_strings())
+
+    def __eq__(self, other):
+        if not isinstance(other, PackedDNA):
+            return NotImplemented
+        return self._length == other._length and np.array_equal(self._offsets, other._offsets) and np.array_equal(self.codes(), other.codes())
+
+    def __repr__(self):
+        preview = str(self[0:20]) + ("..." if self._length > 20 else "")
+        return f"PackedDNA('{preview}', length={self._length}, segments={self.num_segments})"
+
+
+def _bases_to_codes(sequence):
+    """
+    Translates a DNA string (or uint8 array of ASCII characters) into base codes (A = 0, C = 1, G = 2, T = 3).
+    """
+    lookup = np.full(256, 255, dtype=np.uint8)
+    lookup[np.frombuffer(PACKED_DNA_BASES.encode("ascii"), dtype=np.uint8)] = np.arange(4, dtype=np.uint8)
+    if isinstance(sequence, str):
+        sequence = np.frombuffer(sequence.encode("latin1", errors="replace"), dtype=np.uint8)
+    codes = lookup[sequence]
+    if (codes == 255).any():
+        raise ValueError("PackedDNA can only hold the bases A, C, G and T.")
+    return codes
+
+
+def _codes_to_bases(codes):
+    """
+    Translates base codes into a DNA string.
+    """
+    return np.frombuffer(PACKED_DNA_BASES.encode("ascii"), dtype=np.uint8)[codes].tobytes().decode("ascii")
+
+
+#########################
+### DMR Mapping Table ###
+#########################
+
+
+DMR_BASES = "ACGT"
+DMR_DIBITS = ("00", "01", "10", "11")
+
+
+class DMR_Mapping_Table:
+    """
+    Compiled and immutable version of the DMR mapping table (mapping_table_dmr.json). The table is loaded once per
+    process with get_dmr_mapping() and shared by all translation, validation and correction functions, so that the json
+    file is no longer opened for every segment. Besides the original dictionaries, the 2-meres are compiled into codes
+    (A=0, C=1, G=2, T=3, code = 4 * first base + second base) so that lookup arrays can be used.
+
+    Args:
+        data: Dictionary of the loaded mapping table with the keys "initial_2mer" and "map_library".
+
+    Attributes:
+        map_library: Forward table. 2-mere --> tuple of the 4 following 2-meres for the dibits 00, 01, 10, 11.
+        initial_2mer: Start table as in the json file. Segment number mod 4 as string --> tuple of the 4 start 2-meres.
+        start_2_mere: Start table as tuple indexed by segment number mod 4.
+        inverse_map_library: Inverse table. Last 2-mere --> {current 2-mere: dibit}.
+        inverse_start_2_mere: Inverse start table as tuple indexed by segment number mod 4. {start 2-mere: dibit}
+        map_library_sets: Membership sets of the forward table. 2-mere --> frozenset of the following 2-meres.
+        initial_2mer_sets: Membership sets of the start table. Segment number mod 4 as string --> frozenset of the start 2-meres.
+        start_2_mere_sets: Membership sets of the start table indexed by segment number mod 4.
+        list_of_key, list_of_value: Keys and values of the forward table in the order of the json file.
+        two_meres: The 16 2-meres ordered by their code.
+        two_mere_codes: 2-mere --> code.
+        transition_table: uint8 array [16, 4]. (code of last 2-mere, dibit) --> code of next 2-mere.
+        start_table: uint8 array [4, 4]. (segment number mod 4, dibit) --> code of start 2-mere.
+        inverse_table: int8 array [16, 16]. (code of last 2-mere, code of current 2-mere) --> dibit, -1 if not allowed.
+        inverse_start_table: int8 array [4, 16]. (segment number mod 4, code of start 2-mere) --> dibit, -1 if not allowed.
+        transition_offsets: uint8 array [4, 2]. dibit --> shift (mod 4) of the first and second base, if the table shifts every
+            2-mere by the same amount per dibit. Otherwise None.
+        automaton: DMR_Automaton compiled from this table (validation with one array index per transition).
+        fingerprint: Hash of the forward and start table (in the order of the json file), identifies the table e.g. in the correction memo.
+    """
+
+    __slots__ = ("map_library", "initial_2mer", "start_2_mere", "inverse_map_library", "inverse_start_2_mere", "map_library_sets",
+                 "initial_2mer_sets", "start_2_mere_sets", "list_of_key", "list_of_value", "two_meres", "two_mere_codes", "transition_table", "start_table",
+                 "inverse_table", "inverse_start_table", "transition_offsets", "automaton", "fingerprint")
+
+    def __init__(self, data: dict):
+
+        map_library = {key: tuple(value) for key, value in data["map_library"].items()}
+        initial_2mer = {str(key): tuple(value) for key, value in data["initial_2mer"].items()}
+        start_2_mere = tuple(initial_2mer[str(mod)] for mod in range(4))
+
+        two_meres = tuple(first + second for first in DMR_BASES for second in DMR_BASES)
+        two_mere_codes = {two_mere: code for code, two_mere in enumerate(two_meres)}
+
+        # Lookup Arrays: Vorwärts- und Rückwärtsübersetzung über die Codes der 2-mere
+        transition_table = np.zeros((16, 4), dtype=np.uint8)
+        inverse_table = np.full((16, 16), -1, dtype=np.int8)
+        for last_2_mere, rule in map_library.items():
+            for dibit, two_mere in enumerate(rule):
+                transition_table[two_mere_codes[last_2_mere], dibit] = two_mere_codes[two_mere]
+                inverse_table[two_mere_codes[last_2_mere], two_mere_codes[two_mere]] = dibit
+
+        start_table = np.zeros((4, 4), dtype=np.uint8)
+        inverse_start_table = np.full((4, 16), -1, dtype=np.int8)
+        for mod, rule in enumerate(start_2_mere):
+            for dibit, two_mere in enumerate(rule):
+                start_table[mod, dibit] = two_mere_codes[two_mere]
+                inverse_start_table[mod, two_mere_codes[two_mere]] = dibit
+
+        # Verschiebung der beiden Basen pro Dibit (mod 4). Ist sie für alle 2-mere gleich, kann eine ganze Sequenz mit einer
+        # kumulativen Summe übersetzt werden (gilt für mapping_table_dmr.json, nicht zwingend für alternative Tabellen).
+        codes = np.arange(16)
+        first_offsets = ((transition_table >> 2).astype(np.int16) - (codes[:, None] >> 2)) % 4
+        second_offsets = ((transition_table & 3).astype(np.int16) - (codes[:, None] & 3)) % 4
+        if (first_offsets == first_offsets[0]).all() and (second_offsets == second_offsets[0]).all():
+            transition_offsets = np.stack([first_offsets[0], second_offsets[0]], axis=1).astype(np.uint8)
+        else:
+            transition_offsets = None
+
+        for array in (transition_table, inverse_table, start_table, inverse_start_table, transition_offsets):
+            if array is not None:
+                array.flags.writeable = False
+
+        values = {
+            "map_library": MappingProxyType(map_library),
+            "initial_2mer": MappingProxyType(initial_2mer),
+            "start_2_mere": start_2_mere,
+            "inverse_map_library": MappingProxyType({last_2_mere: MappingProxyType({two_mere: DMR_DIBITS[dibit] for dibit, two_mere in enumerate(rule)})
+                                                     for last_2_mere, rule in map_library.items()}),
+            "inverse_start_2_mere": tuple(MappingProxyType({two_mere: DMR_DIBITS[dibit] for dibit, two_mere in enumerate(rule)})
+                                          for rule in start_2_mere),
+            "map_library_sets": MappingProxyType({key: frozenset(value) for key, value in map_library.items()}),
+            "initial_2mer_sets": MappingProxyType({key: frozenset(value) for key, value in initial_2mer.items()}),
+            "start_2_mere_sets": tuple(frozenset(rule) for rule in start_2_mere),
+            "list_of_key": tuple(map_library.keys()),
+            "list_of_value": tuple(map_library.values()),
+            "two_meres": two_meres,
+            "two_mere_codes": MappingProxyType(two_mere_codes),
+            "transition_table": transition_table,
+            "start_table": start_table,
+            "inverse_table": inverse_table,
+            "inverse_start_table": inverse_start_table,
+            "transition_offsets": transition_offsets,
+            "fingerprint": hashlib.sha1(repr((tuple(map_library.items()), start_2_mere)).encode("ascii")).hexdigest(),
+        }
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+        object.__setattr__(self, "automaton", DMR_Automaton(self))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("The DMR mapping table is immutable. Use reload_dmr_mapping() to load another table.")
+
+    def __delattr__(self, name):
+        raise AttributeError("The DMR mapping table is immutable. Use reload_dmr_mapping() to load another table.")
+
+
+class DMR_Automaton:
+    """
+    Finite-state validator of the DMR scheme. The states are the 2-mere codes (see DMR_Mapping_Table) plus the state 16 for
+    2-meres with other characters than A, C, G and T or an incomplete last 2-mere, which fits to no other state. The mapping
+    table is compiled into a 16 bit successor mask per state and a start mask per segment number mod 4, so that every
+    transition of a DNA segment is checked with one array index instead of a dictionary and set lookup.
+    The automaton is built together with the mapping table and can be taken from get_dmr_automaton().
+
+    Args:
+        dmr_mapping: The compiled DMR_Mapping_Table.
+
+    Attributes:
+        two_mere_codes: 2-mere --> code, all other strings get the state 16.
+        successor_masks: uint16 array [17]. State --> bitmask of the allowed following states.
+        start_masks: uint16 array [4]. Segment number mod 4 --> bitmask of the allowed start states.
+        transition_allowed: bool array [17, 17]. (last state, current state) --> transition allowed.
+        start_allowed: bool array [4, 17]. (segment number mod 4, start state) --> start allowed.
+        successor_counts: uint8 array [17]. State --> number of allowed following states.
+        predecessors: 2-mere --> tuple of the 2-meres which may precede it (in the order of the mapping table).
+    """
+
+    __slots__ = ("two_mere_codes", "successor_masks", "start_masks", "transition_allowed", "start_allowed", "successor_counts", "predecessors",
+                 "_transition_flat", "_start_rows")
+
+    def __init__(self, dmr_mapping):
+
+        allowed = np.zeros((17, 17), dtype=bool)
+        allowed[0:16, 0:16] = dmr_mapping.inverse_table >= 0
+        start_allowed = np.zeros((4, 17), dtype=bool)
+        start_allowed[:, 0:16] = dmr_mapping.inverse_start_table >= 0
+
+        # Bitmasken: Bit j gesetzt --> Zustand j darf folgen
+        bit_values = (1 << np.arange(17, dtype=np.uint32))
+        successor_masks = (allowed * bit_values).sum(axis=1).astype(np.uint16)
+        start_masks = (start_allowed * bit_values).sum(axis=1).astype(np.uint16)
+        successor_counts = allowed.sum(axis=1).astype(np.uint8)
+
+        # Vorgänger in der Reihenfolge der Mapping Tabelle (wie die Suche über list_of_key/list_of_value)
+        predecessors = {two_mere: tuple(key for key, rule in dmr_mapping.map_library.items() if two_mere in rule)
+                        for two_mere in dmr_mapping.two_meres}
+
+        for array in (allowed, start_allowed, successor_masks, start_masks, successor_counts):
+            array.flags.writeable = False
+
+        values = {
+            "two_mere_codes": dmr_mapping.two_mere_codes,
+            "successor_masks": successor_masks,
+            "start_masks": start_masks,
+            "transition_allowed": allowed,
+            "start_allowed": start_allowed,
+            "successor_counts": successor_counts,
+            "predecessors": MappingProxyType(predecessors),
+            # Python Tupel für einzelne Sequenzen, da hier der Zugriff schneller ist als auf numpy Arrays
+            "_transition_flat": tuple(allowed.ravel().tolist()),
+            "_start_rows": tuple(tuple(row) for row in start_allowed.tolist()),
+        }
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("The DMR automaton is immutable. Use reload_dmr_mapping() to load another table.")
+
+    def __delattr__(self, name):
+        raise AttributeError("The DMR automaton is immutable. Use reload_dmr_mapping() to load another table.")
+
+    def code(self, two_mere: str):
+        """
+        Returns the state of a 2-mere (16 for no valid 2-mere).
+        """
+
+        return self.two_mere_codes.get(two_mere, 16)
+
+    def state_sequence(self, segment):
+        """
+        Converts a DNA segment into its list of states.
+        :param segment: DNA string, PackedDNA with one segment or array of 2-mere codes.
+        :return: List of states, one per 2-mere.
+        """
+
+        if isinstance(segment, np.ndarray):
+            return segment.tolist()
+        if isinstance(segment, PackedDNA):
+            # unvollständiges letztes 2-mere wie bei Strings als Zustand 16
+            return segment.two_mere_codes().tolist() + [16] * (len(segment) % 2)
+        codes = self.two_mere_codes
+
+        return [codes.get(segment[i: i + 2], 16) for i in range(0, len(segment), 2)]
+
+    def allows(self, last_2_mere: str, two_mere: str):
+        """
+        Checks whether two_mere may follow last_2_mere in the DMR scheme.
+        """
+
+        codes = self.two_mere_codes
+        return self._transition_flat[codes.get(last_2_mere, 16) * 17 + codes.get(two_mere, 16)]
+
+    def allows_start(self, segment_count: int, two_mere: str):
+        """
+        Checks whether two_mere is an allowed start 2-mere of the segment with the number segment_count.
+        """
+
+        return self._start_rows[segment_count % 4][self.two_mere_codes.get(two_mere, 16)]
+
+    def transition_flags(self, segment, segment_count=0, start=True):
+        """
+        Runs the automaton over a DNA segment.
+        :param segment: DNA string, PackedDNA with one segment or array of 2-mere codes.
+        :param segment_count: Segment number, defines the allowed start 2-meres.
+        :param start: If True the first flag is the check of the start 2-mere, otherwise it is left out.
+        :return: List of booleans. Entry i (i >= 1) is True, if 2-mere i may follow 2-mere i-1.
+        """
+
+        states = self.state_sequence(segment)
+        flat = self._transition_flat
+        flags = [flat[last * 17 + current] for last, current in zip(states, states[1:])]
+        if start:
+            flags.insert(0, self._start_rows[segment_count % 4][states[0]] if states else False)
+
+        return flags
+
+    def accepts(self, segment, segment_count=0):
+        """
+        Checks whether a whole DNA segment could have been encoded with the DMR scheme.
+        :return: True if the start 2-mere and all transitions are allowed.
+        """
+
+        return all(self.transition_flags(segment, segment_count))
+
+    def successor_count_list(self, segment):
+        """
+        Reports for each position of a DNA segment how many states may follow the state at this position.
+        :param segment: DNA string, PackedDNA with one segment or array of 2-mere codes.
+        :return: uint8 array with one entry per 2-mere (0 for positions without a valid 2-mere).
+        """
+
+        return self.successor_counts[np.asarray(self.state_sequence(segment), dtype=np.intp)]
+
+    def transition_array(self, codes, segment_indices):
+        """
+        Array version of transition_flags for a batch of segments.
+        :param codes: uint8 array of 2-mere codes with the shape (segments, 2-meres), see dna_to_dmr_code_array.
+        :param segment_indices: Segment numbers of the segments (array or list).
+        :return: Boolean array with the shape of codes, column 0 is the start check.
+        """
+
+        segment_mod = np.asarray(segment_indices, dtype=np.int64) % 4
+        flags = np.empty(codes.shape, dtype=bool)
+        flags[:, 0] = self.start_allowed[segment_mod, codes[:, 0]]
+        # ein Zugriff pro Übergang auf die flache Tabelle
+        flags[:, 1:] = self.transition_allowed.ravel()[codes[:, :-1].astype(np.uint16) * 17 + codes[:, 1:]]
+
+        return flags
+
+
+_dmr_mapping = None
+
+
+def get_dmr_mapping():
+    """
+    Returns the compiled DMR mapping table of the process. The table is read from mapping_table_dmr.json in the project
+    directory with the first call only, all further calls share the same object.
+    :return: The compiled DMR_Mapping_Table.
+    """
+
+    if _dmr_mapping is None:
+        reload_dmr_mapping()
+
+    return _dmr_mapping
+
+
+def get_dmr_automaton():
+    """
+    Returns the DMR_Automaton of the shared DMR mapping table.
+    :return: The compiled DMR_Automaton.
+    """
+
+    return get_dmr_mapping().automaton
+
+
+def reload_dmr_mapping(fp=None):
+    """
+    Reloads the shared DMR mapping table, e.g. to use an alternative mapping table. All functions using get_dmr_mapping()
+    work with the new table afterwards.
+    :param fp: File path of the mapping table (json). Default is mapping_table_dmr.json in the project directory.
+    :return: The newly compiled DMR_Mapping_Table.
+    """
+
+    global _dmr_mapping
+
+    if fp is None:
+        root_dir = os.path.abspath(os.curdir)
+        fp = os.path.join(root_dir, "mapping_table_dmr.json")
+
+    with open(fp) as f:
+        data = json.load(f)
+
+    _dmr_mapping = DMR_Mapping_Table(data)
+    # Korrekturergebnisse der alten Tabelle sind nicht mehr gültig
+    clear_correction_memo(reset_stats=False)
+
+    return _dmr_mapping
+
+
 #########################
 ###### Encode DMR #######
 #########################
@@ -259,13 +1365,9 @@ def translate_binary_to_dmr_singular(segment, segment_index):
     """
 
     """1. Aufrufen der Map Libraries und Vorbereitung """
-    # Lade die JSON-Datei in ein Dictionary
-    root_dir = os.path.abspath(os.curdir)
-    with open(f"{root_dir}\\mapping_table_dmr.json") as f:
-        data = json.load(f)
-
-    map_library = data["map_library"]
-    map_library_start_2_mere = data["initial_2mer"]
+    dmr_mapping = get_dmr_mapping()
+    map_library = dmr_mapping.map_library
+    map_library_start_2_mere = dmr_mapping.initial_2mer
 
     # Variablen
     dmr_rs_dna_message = ""
@@ -340,6 +1442,116 @@ def translate_binary_to_dmr_singular(segment, segment_index):
     return dmr_rs_dna_message
 
 
+def translate_dibits_to_dmr_batch(dibit_array, segment_indices):
+    """
+    This function translates a whole batch of segments to DNA with the DMR scheme at once. Instead of translating every
+    segment 2 bits at a time, the DMR state-transition table of the shared mapping table is used as lookup array.
+    :param dibit_array: 2-D uint8 array of dibits (0-3) with the shape (segments, positions). All segments need the same length.
+    :param segment_indices: Segment numbers of the rows (array or list), which define the start 2-mere.
+    :return: 2-D uint8 array with the codes of the translated 2-meres (see DMR_Mapping_Table) in the shape of dibit_array.
+    """
+
+    dmr_mapping = get_dmr_mapping()
+    dibits = np.asarray(dibit_array, dtype=np.uint8)
+    if dibits.ndim != 2:
+        raise ValueError("The dibit array has to be 2-dimensional (segments x positions).")
+
+    segment_mod = np.asarray(segment_indices, dtype=np.int64) % 4
+    codes = np.empty(dibits.shape, dtype=np.uint8)
+    if dibits.shape[1] == 0:
+        return codes
+
+    # Start 2-mere nach Mapping Tabelle 1 und Segment mod 4
+    codes[:, 0] = dmr_mapping.start_table[segment_mod, dibits[:, 0]]
+
+    if dmr_mapping.transition_offsets is not None:
+        # Jede Base wird pro Dibit um einen festen Wert verschoben --> kumulative Summe über das ganze Segment
+        offsets = dmr_mapping.transition_offsets[dibits[:, 1:]]
+        first_base = (codes[:, :1] >> 2) + np.cumsum(offsets[:, :, 0], axis=1, dtype=np.uint8)
+        second_base = (codes[:, :1] & 3) + np.cumsum(offsets[:, :, 1], axis=1, dtype=np.uint8)
+        codes[:, 1:] = ((first_base & 3) << 2) | (second_base & 3)
+    else:
+        # Allgemeine Tabelle: Spaltenweise über alle Segmente gleichzeitig
+        for j in range(1, dibits.shape[1]):
+            codes[:, j] = dmr_mapping.transition_table[codes[:, j - 1], dibits[:, j]]
+
+    return codes
+
+
+def dmr_codes_to_dna(code_array):
+    """
+    Converts 2-mere codes (see DMR_Mapping_Table) back into DNA strings.
+    :param code_array: 2-D uint8 array of 2-mere codes with the shape (segments, positions).
+    :return: List with one DNA string per row.
+    """
+
+    codes = np.asarray(code_array, dtype=np.uint8)
+    bases = np.frombuffer(DMR_BASES.encode("ascii"), dtype=np.uint8)
+    dna_array = np.empty((codes.shape[0], codes.shape[1] * 2), dtype=np.uint8)
+    dna_array[:, 0::2] = bases[codes >> 2]
+    dna_array[:, 1::2] = bases[codes & 3]
+    dna_length = dna_array.shape[1]
+    dna_string = dna_array.tobytes().decode("ascii")
+
+    return [dna_string[i * dna_length: (i + 1) * dna_length] for i in range(codes.shape[0])]
+
+
+def bytes_to_dibits(byte_array):
+    """
+    Splits bytes into dibits (most significant bits first), in the same order as the bits are read by
+    translate_binary_to_dmr_singular.
+    :param byte_array: uint8 array with the shape (segments, bytes).
+    :return: uint8 array with the shape (segments, 4 * bytes) containing values from 0 to 3.
+    """
+
+    data = np.asarray(byte_array, dtype=np.uint8)
+    dibits = (data[..., None] >> np.array([6, 4, 2, 0], dtype=np.uint8)) & 3
+
+    return dibits.reshape(*data.shape[:-1], data.shape[-1] * 4)
+
+
+def translate_byte_segments_to_dmr(byte_segments, segment_indices=None, packed=False):
+    """
+    Translates a list of byte segments (e.g. the RS encoded segments of DMR_RS_Coder.encode_rsm) into DNA with the DMR
+    scheme. Segments of equal length are translated together with translate_dibits_to_dmr_batch, so that segments with
+    a different length (e.g. the last segment) can be part of the list.
+    :param byte_segments: List of byte segments (bytes, bytearray, list or uint8 array).
+    :param segment_indices: Segment numbers of the segments. Default is the position in the list.
+    :param packed: If True the 2-mere codes are packed directly into a PackedDNA (one segment per byte segment), no DNA
+    strings are built.
+    :return: List with the translated DNA segments in the order of byte_segments or PackedDNA.
+    """
+
+    if segment_indices is None:
+        segment_indices = range(len(byte_segments))
+    segment_indices = np.asarray(list(segment_indices), dtype=np.int64)
+
+    # Segmente gleicher Länge gemeinsam übersetzen
+    length_groups = {}
+    for position, segment in enumerate(byte_segments):
+        length_groups.setdefault(len(segment), []).append(position)
+
+    dna_segments = [""] * len(byte_segments)
+    code_rows = [None] * len(byte_segments)
+    for length, positions in length_groups.items():
+        byte_array = np.array([np.frombuffer(bytes(byte_segments[position]), dtype=np.uint8) for position in positions],
+                              dtype=np.uint8).reshape(len(positions), length)
+        codes = translate_dibits_to_dmr_batch(bytes_to_dibits(byte_array), segment_indices[positions])
+        if packed:
+            for position, code_row in zip(positions, codes):
+                code_rows[position] = code_row
+            continue
+        for position, dna in zip(positions, dmr_codes_to_dna(codes)):
+            dna_segments[position] = dna
+
+    if packed:
+        # 4 2-meres pro Byte
+        code_array = np.concatenate(code_rows) if code_rows else np.zeros(0, dtype=np.uint8)
+        return PackedDNA.from_two_mere_codes(code_array, [len(code_row) * 2 for code_row in code_rows])
+
+    return dna_segments
+
+
 #########################
 ###### Decode DMR #######
 #########################
@@ -367,13 +1579,10 @@ def translate_dna_to_binary_singular(segment, index):
     else:
         segment_count = "3"
 
-    # Lade die JSON-Datei in ein Dictionary
-    root_dir = os.path.abspath(os.curdir)
-    with open(f"{root_dir}\\mapping_table_dmr.json") as f:
-        data = json.load(f)
-    # Zugriff auf den jeweiligen Teil des Dictionaries
-    map_library = data["map_library"]
-    map_library_start_2_mere = data["initial_2mer"]
+    # Gemeinsame kompilierte Mapping Tabelle
+    dmr_mapping = get_dmr_mapping()
+    map_library = dmr_mapping.map_library
+    map_library_start_2_mere = dmr_mapping.initial_2mer
 
     binary_segment = ""
     start_2_mere = segment[0:2]  # Beschreibt das erste 2-mere des Segments
@@ -464,13 +1673,10 @@ def enhanced_translate_dna_to_binary_singular(segment, index, verbose=True):
     else:
         segment_count = "3"
 
-    # Lade die JSON-Datei in ein Dictionary
-    root_dir = os.path.abspath(os.curdir)
-    with open(f"{root_dir}\\mapping_table_dmr.json") as f:
-        data = json.load(f)
-    # Zugriff auf den jeweiligen Teil des Dictionaries
-    map_library = data["map_library"]
-    map_library_start_2_mere = data["initial_2mer"]
+    # Gemeinsame kompilierte Mapping Tabelle
+    dmr_mapping = get_dmr_mapping()
+    map_library = dmr_mapping.map_library
+    map_library_start_2_mere = dmr_mapping.initial_2mer
 
     binary_segment = ""
     start_2_mere = segment[0:2]  # Beschreibt das erste 2-mere des Segments
@@ -622,27 +1828,8 @@ def enhanced_translate_dna_to_binary_singular(segment, index, verbose=True):
 
 
 def trans_map_lib_one_2_mere(last_2_mere: str, current_2_mere: str):
-    # Lade die JSON-Datei in ein Dictionary
-    root_dir = os.path.abspath(os.curdir)
-    with open(f"{root_dir}\\mapping_table_dmr.json") as f:
-        data = json.load(f)
-    # Zugriff auf den jeweiligen Teil des Dictionaries
-    map_library = data["map_library"]
-
-    for j, rule_2_mere in enumerate(map_library[last_2_mere]):
-        if rule_2_mere == current_2_mere:
-            position_in_rule = j
-            break
-
-    # Übersetzen des 2-meres anhand der bestimmten Position
-    if position_in_rule == 0:
-        binary_segment = "00"
-    elif position_in_rule == 1:
-        binary_segment = "01"
-    elif position_in_rule == 2:
-        binary_segment = "10"
-    elif position_in_rule == 3:
-        binary_segment = "11"
+    # Übersetzen des 2-meres anhand der inversen Mapping Tabelle
+    binary_segment = get_dmr_mapping().inverse_map_library[last_2_mere][current_2_mere]
 
     return binary_segment
 
@@ -655,54 +1842,11 @@ def dmr_check_mapping(sequence, segment_number=0, start=True):
     :return:  If the DMR scheme matches, true is returned. Otherwise false.
     """
 
-    # Lade die JSON-Datei in ein Dictionary
-    root_dir = os.path.abspath(os.curdir)
-    with open(f"{root_dir}\\mapping_table_dmr.json") as f:
-        data = json.load(f)
-    # Zugriff auf den jeweiligen Teil des Dictionaries
-    map_library = data["map_library"]
-    start_library = data["initial_2mer"]
-
-    decision_support = []  # Entscheidungshilfe zum Merken, ob die Einträge gleich waren
-
-    if start:
-        counter_2mere = 1  # Zähler welcher 2-mere gerade betrachtet wird
-        """Start 2-mere muss in erster Tabelle vorhanden sein"""
-        for n, rule_2_mere in enumerate(start_library[str(segment_number)]):  # 0. Spacer = 2. Segment
-            if rule_2_mere == sequence[0: 2]:  # geht die Sachen einzeln durch und vergleicht diese. Wenn identisch, dann..
-                decision_support += "T"  # True gemerkt
-                break
-
-        if len(decision_support) != 1:  # wenn noch nicht in die Liste hinzugefügt --> False merken
-            decision_support += "F"
-
-        """Restliche 2-mere nach 2. Tabelle überprüfen"""
-        for o in range(0, len(sequence) - 2, 2):  # restliche Sequenz mit je 2 Basen durchgehen
-            current_2_mere = sequence[o: o + 2]  # 1. 2-mere
-            next_2_mere = sequence[o + 2: o + 4]  # nächste 2-mere
-            counter_2mere += 1  # nächster 2-mere
-            for j, rule_2_mere in enumerate(map_library[current_2_mere]):
-                if rule_2_mere == next_2_mere:
-                    decision_support += "T"
-                    break
-
-            if len(decision_support) != counter_2mere:  # Wenn noch nichts zur Liste hinzugefügt
-                decision_support += "F"  # --> False merken
-
-    else:
-        counter_2mere = 0  # Zähler welcher 2-mere gerade betrachtet wird
-        """Restliche 2-mere nach 2. Tabelle überprüfen"""
-        for o in range(0, len(sequence) - 2, 2):  # restliche Sequenz mit je 2 Basen durchgehen
-            current_2_mere = sequence[o: o + 2]  # 1. 2-mere
-            next_2_mere = sequence[o + 2: o + 4]  # nächste 2-mere
-            counter_2mere += 1  # nächster 2-mere
-            for j, rule_2_mere in enumerate(map_library[current_2_mere]):
-                if rule_2_mere == next_2_mere:
-                    decision_support += "T"
-                    break
+    # Start 2-mere nach erster Tabelle, restliche 2-mere nach 2. Tabelle über den DMR Automaten überprüfen
+    flags = get_dmr_automaton().transition_flags(sequence, int(segment_number), start)
 
-            if len(decision_support) != counter_2mere:  # Wenn noch nichts zur Liste hinzugefügt
-                decision_support += "F"  # --> False merken
+    # Entscheidungshilfe zum Merken, ob die Einträge gleich waren
+    decision_support = ["T" if flag else "F" for flag in flags]
 
     return decision_support
 
@@ -732,9 +1876,159 @@ def translate_dna_to_rs_singular(segment, index):   # Will er nicht ausführen?
     return ascii_latin1_rs_string
 
 
-def translate_decimal_to_dmr_singular(segment, index):
+def dna_to_dmr_code_array(dna_segments):
     """
-    This function is to translate a segment with decimal numbers into DNA according to the DMR scheme.
+    Converts DNA segments of equal length into 2-mere codes (see DMR_Mapping_Table) without splitting the strings.
+    2-meres containing other characters than A, C, G and T and an incomplete last 2-mere (odd length) get the code 16.
+    :param dna_segments: List of DNA strings with the same length or PackedDNA with segments of the same length.
+    :return: uint8 array of 2-mere codes with the shape (segments, ceil(length / 2)).
+    """
+
+    if isinstance(dna_segments, PackedDNA):
+        return dna_segments.segment_code_matrix()
+
+    segment_number = len(dna_segments)
+    segment_length = len(dna_segments[0]) if segment_number else 0
+    raw = np.frombuffer("".join(dna_segments).encode("latin1", errors="replace"), dtype=np.uint8)
+    if len(raw) != segment_number * segment_length:
+        raise ValueError("All DNA segments of a batch need the same length.")
+    raw = raw.reshape(segment_number, segment_length)
+    if segment_length % 2 != 0:
+        raw = np.concatenate([raw, np.zeros((segment_number, 1), dtype=np.uint8)], axis=1)   # unvollständiges 2-mere
+
+    # Je 2 Zeichen als ein 16 bit Wert lesen und in einem Schritt in den Code des 2-meres übersetzen
+    pairs = np.ascontiguousarray(raw).view("<u2")
+
+    return _two_mere_lookup()[pairs]
+
+
+_two_mere_lookup_table = None
+
+
+def _two_mere_lookup():
+    """
+    Lookup table for dna_to_dmr_code_array: 2 ASCII characters read as little endian 16 bit value --> 2-mere code (16 for no
+    valid 2-mere).
+    """
+
+    global _two_mere_lookup_table
+
+    if _two_mere_lookup_table is None:
+        base_lookup = np.full(256, 4, dtype=np.uint16)   # 4 = keine Base
+        base_lookup[np.frombuffer(DMR_BASES.encode("ascii"), dtype=np.uint8)] = np.arange(4, dtype=np.uint16)
+        pair_values = np.arange(65536, dtype=np.uint32)
+        first_base = base_lookup[pair_values & 0xFF]
+        second_base = base_lookup[pair_values >> 8]
+        table = ((first_base << 2) | (second_base & 3)).astype(np.uint8)
+        table[(first_base > 3) | (second_base > 3)] = 16
+        table.flags.writeable = False
+        _two_mere_lookup_table = table
+
+    return _two_mere_lookup_table
+
+
+def dna_to_dmr_codes(dna_segments):
+    """
+    Converts DNA segments of equal length into 2-mere codes (see DMR_Mapping_Table) without splitting the strings.
+    :param dna_segments: List of DNA strings with the same length or PackedDNA with segments of the same length.
+    :return: uint8 array of 2-mere codes with the shape (segments, length // 2) and a boolean array which is False for
+    segments containing other characters than A, C, G and T or an incomplete last 2-mere.
+    """
+
+    code_array = dna_to_dmr_code_array(dna_segments)
+    valid = (code_array < 16).all(axis=1)
+    if isinstance(dna_segments, PackedDNA):
+        # nur A, C, G und T möglich: ohne unvollständiges 2-mere bleibt es ein View
+        segment_length = int(dna_segments.segment_lengths()[0]) if dna_segments.num_segments else 0
+        return code_array[:, 0: segment_length // 2], valid
+    segment_length = len(dna_segments[0]) if len(dna_segments) else 0
+    codes = code_array[:, 0: segment_length // 2] & 15
+
+    return codes, valid
+
+
+def translate_dna_to_bytes_batch(dna_segments, segment_indices):
+    """
+    This function translates a batch of DNA segments of equal length, which were translated with the DMR scheme, directly
+    into bytes. The dibits are determined with the inverse transition table (16 x 16) of the shared mapping table, so that
+    no binary strings have to be built. Incomplete bytes at the end of a segment are dropped as in
+    translate_dna_to_rs_singular.
+    :param dna_segments: List of DNA strings with the same length, PackedDNA with segments of the same length or a uint8
+    array of 2-mere codes (0 - 15) with the shape (segments, 2-meres).
+    :param segment_indices: Segment numbers of the DNA strings (array or list), which define the start 2-mere.
+    :return: uint8 array of bytes with the shape (segments, length // 8) and a boolean array which is True if the whole
+    segment fits into the DMR scheme (equal to check_validation(validate_list(segment, index))).
+    """
+
+    dmr_mapping = get_dmr_mapping()
+    if isinstance(dna_segments, np.ndarray):
+        codes, valid = dna_segments, np.ones(len(dna_segments), dtype=bool)
+    else:
+        codes, valid = dna_to_dmr_codes(dna_segments)
+    segment_mod = np.asarray(segment_indices, dtype=np.int64) % 4
+
+    dibits = np.empty(codes.shape, dtype=np.int8)
+    if codes.shape[1] != 0:
+        dibits[:, 0] = dmr_mapping.inverse_start_table[segment_mod, codes[:, 0]]
+        dibits[:, 1:] = dmr_mapping.inverse_table[codes[:, :-1], codes[:, 1:]]
+    valid &= ~(dibits < 0).any(axis=1)
+
+    # 4 Dibits ergeben ein Byte
+    byte_length = codes.shape[1] // 4
+    dibits = (dibits[:, 0: byte_length * 4] & 3).astype(np.uint8).reshape(len(codes), byte_length, 4)
+    byte_array = (dibits[:, :, 0] << 6) | (dibits[:, :, 1] << 4) | (dibits[:, :, 2] << 2) | dibits[:, :, 3]
+
+    return byte_array, valid
+
+
+def translate_dna_segments_to_bytes(dna_segments, segment_indices=None):
+    """
+    Translates a list of DNA segments with different lengths into bytes with translate_dna_to_bytes_batch. Segments of equal
+    length are translated together.
+    :param dna_segments: List of DNA strings or PackedDNA views (can be mixed) or PackedDNA.
+    :param segment_indices: Segment numbers of the DNA strings. Default is the position in the list.
+    :return: List with one uint8 array per segment and a boolean array which is True for segments fitting into the DMR scheme.
+    """
+
+    segment_number = dna_segments.num_segments if isinstance(dna_segments, PackedDNA) else len(dna_segments)
+    if segment_indices is None:
+        segment_indices = range(segment_number)
+    segment_indices = np.asarray(list(segment_indices), dtype=np.int64)
+
+    byte_segments = [None] * segment_number
+    valid = np.zeros(segment_number, dtype=bool)
+
+    if isinstance(dna_segments, PackedDNA):
+        # aufeinanderfolgende Segmente gleicher Länge als eine Code Matrix (View) übersetzen
+        lengths = dna_segments.segment_lengths()
+        run_starts = np.flatnonzero(np.diff(lengths, prepend=-1)).tolist() + [segment_number]
+        for start, stop in zip(run_starts, run_starts[1:]):
+            byte_array, valid[start:stop] = translate_dna_to_bytes_batch(dna_segments.segment_range(start, stop), segment_indices[start:stop])
+            byte_segments[start:stop] = list(byte_array)
+        return byte_segments, valid
+
+    # gepackte Segmente über ihre 2-mere Codes, Strings wie bisher
+    length_groups = {}
+    for position, segment in enumerate(dna_segments):
+        packed = isinstance(segment, PackedDNA) and len(segment) % 2 == 0
+        length_groups.setdefault((len(segment), packed), []).append(position)
+
+    for (length, packed), positions in length_groups.items():
+        if packed:
+            batch = np.stack([dna_segments[position].two_mere_codes() for position in positions])
+        else:
+            batch = [str(dna_segments[position]) for position in positions]
+        byte_array, group_valid = translate_dna_to_bytes_batch(batch, segment_indices[positions])
+        valid[positions] = group_valid
+        for position, byte_row in zip(positions, byte_array):
+            byte_segments[position] = byte_row
+
+    return byte_segments, valid
+
+
+def translate_decimal_to_dmr_singular(segment, index):
+    """
+    This function is to translate a segment with decimal numbers into DNA according to the DMR scheme.
     For this, the segment is first translated into binary numbers and then the DMR scheme is applied.
     :param segment: Input a segment with decimal numbers.
     :param index: Describes in which segment the DNA is and gives the DMR scheme the first coding.
@@ -771,61 +2065,81 @@ def determine_correct_segments(sequence_list, rs_codec_value, segment_count):
     Returns:
          decoded_sequences_list: all possible options of the original DNA strand
     """
-    rs_coder = RSCodec(rs_codec_value)
+    rs_coder = get_rs_codec(rs_codec_value)
+
+    # Alle Sequenzen gleichzeitig validieren und in Bytes übersetzen, nur passende Sequenzen werden mit RS dekodiert
+    byte_segments, validation_checks = translate_dna_segments_to_bytes(sequence_list, [segment_count] * len(sequence_list))
+
+    # Syndrom-Vorprüfung: fehlerfreie Codewörter werden direkt übernommen, hoffnungslose gar nicht erst dekodiert
+    valid_positions = np.flatnonzero(validation_checks)
+    rs_decoded = rs_decode_prechecked(rs_coder, [byte_segments[i] for i in valid_positions])
 
     decoded_sequences_list = []
-    for i, DNA_error_segment in enumerate(sequence_list):
-        validation_list = validate_list(DNA_error_segment, segment_count)
-        validation_list_check = check_validation(validation_list)   # Ausgabe True oder False, wenn falsche vorhanden sind
-        if validation_list_check:
-            rs_segment = translate_dna_to_rs_singular(DNA_error_segment, segment_count)
+    for i, rs_string_decoded in zip(valid_positions, rs_decoded):
+        if rs_string_decoded is not None:
+            dna_decoded_segment = translate_decimal_to_dmr_singular(rs_string_decoded, segment_count)
+            decoded_sequences_list += [(sequence_list[i], dna_decoded_segment, int(i))]
 
-            try:
-                _, rs_string_decoded, errata_pos = rs_coder.decode(rs_segment)
+    return decoded_sequences_list
 
-                if rs_coder.check(rs_string_decoded):
-                    dna_decoded_segment = translate_decimal_to_dmr_singular(rs_string_decoded, segment_count)
-                    decoded_sequences_list += [(DNA_error_segment, dna_decoded_segment, i)]
 
-            except:
-                pass
+def determine_correct_code_segments(code_array, rs_codec_value, segment_count):
+    """
+    Version of determine_correct_segments for candidates given as 2-mere codes (e.g. from iterate_viterbi_paths). The codes
+    are translated straight into RS bytes with the inverse tables, DNA strings are only built for the decodeable candidates.
+
+    Args:
+        code_array: uint8 array of 2-mere codes with the shape (candidates, 2-meres)
+        rs_codec_value: The value of the RSCodec.
+        segment_count: Segment number of the candidates, defines the start 2-mere.
+
+    Returns:
+         decoded_sequences_list: List of (candidate DNA sequence, decoded DNA sequence, candidate number)
+    """
+    rs_coder = get_rs_codec(rs_codec_value)
+
+    byte_array, validation_checks = translate_dna_to_bytes_batch(code_array, [segment_count] * len(code_array))
+    valid_positions = np.flatnonzero(validation_checks)
+    rs_decoded = rs_decode_prechecked(rs_coder, [byte_array[i] for i in valid_positions])
+
+    decoded_sequences_list = []
+    for i, rs_string_decoded in zip(valid_positions, rs_decoded):
+        if rs_string_decoded is not None:
+            dna_decoded_segment = translate_decimal_to_dmr_singular(rs_string_decoded, segment_count)
+            decoded_sequences_list += [(dmr_codes_to_dna(code_array[i: i + 1])[0], dna_decoded_segment, int(i))]
 
     return decoded_sequences_list
 
 
+# Codes der Validierungszustände (validate_batch), Reihenfolge entspricht den Labels von validate_list
+DMR_VALIDATION_LABELS = ("sT_nmT", "sT_nmF", "sF", "tmT_nmT", "tmT_nmF", "tmF_nmT", "tmF_nmF", "lT", "lF")
+DMR_VALIDATION_CODES = {label: code for code, label in enumerate(DMR_VALIDATION_LABELS)}
+DMR_CLEAN_STATES = (DMR_VALIDATION_CODES["sT_nmT"], DMR_VALIDATION_CODES["tmT_nmT"], DMR_VALIDATION_CODES["lT"])
+DMR_INCONSISTENT_LABELS = frozenset(label for code, label in enumerate(DMR_VALIDATION_LABELS) if code not in DMR_CLEAN_STATES)
+
+
 def validate_list(segment, segment_count):
     """
     This function returns an array that has a corresponding label to each status the two-mere on the same index has
     in regard to the encoding rule.
-    :param segment: Input of the segment of a DNA sequence.
+    :param segment: Input of the segment of a DNA sequence (string or PackedDNA).
     :param segment_count: Definition of the segment number of the entered DNA strand.
     :return: The function outputs a validation list. This shows whether a 2-mere matches the previous 2-mere in the
      DMR scheme. It also determines whether the initial 2-mere exists in the scheme.
     """
 
+    if isinstance(segment, PackedDNA):
+        segment = str(segment)
+
     # label:
     # correct does not mean that the two-mere is the same as the corresponding two-mere in the original string
     # it means that it fits into the DMR scheme
 
-    """1. Abrufen der Mapping Libraries und Vorbereitung"""
-    # Lade die JSON-Datei in ein Dictionary
-    root_dir = os.path.abspath(os.curdir)
-
-    with open(f"{root_dir}\\mapping_table_dmr.json") as f:
-        data = json.load(f)
-    map_library = data["map_library"]
-    map_library_start_2_mere = data["initial_2mer"]
-
-
-    # Eingegebene Sequenz wird in je 2 Basen segmentiert
-    segmentated_string = segment_string(segment, 2)
-    # Definieren erstes und letztes 2-mere
-    start_2_mere = segmentated_string[0]
-    last_2_mere = segmentated_string[-1]
+    """1. Durchlaufen des DMR Automaten"""
+    # ok[i] (i >= 1): 2-mere i passt zu 2-mere i-1, ok[0]: Start 2-mere passt zur Segmentnummer
+    ok = get_dmr_automaton().transition_flags(segment, segment_count)
     validation_list = []
 
-    segment_mod = segment_count % 4
-
     """2. Validierung"""
 
     # <editor-fold desc="2.1 Validierung des Start 2-meres.">
@@ -835,12 +2149,8 @@ def validate_list(segment, segment_count):
     # sT_nmF: start-two-mere --> correct | next-two-mere --> false
     # sF: start-two-mere --> false
 
-    if start_2_mere in map_library_start_2_mere[str(segment_mod)]:   # Falls das Start 2-mere in Map. Tab. 1 vorhanden
-
-        if segmentated_string[1] in map_library[start_2_mere]:    # [1] das 2. 2-mere in 2. Mapping Tabelle von 1. mere
-            validation_list += ["sT_nmT"]                         # beides da
-        else:
-            validation_list += ["sT_nmF"]       # erste richtig, zweite falsch
+    if ok[0]:   # Falls das Start 2-mere in Map. Tab. 1 vorhanden
+        validation_list += ["sT_nmT" if ok[1] else "sT_nmF"]
     else:
         validation_list += ["sF"]               # Start falsch
     # </editor-fold>
@@ -855,23 +2165,11 @@ def validate_list(segment, segment_count):
 
     # Bsp.:   AT  TC    GC:    i muss in der Tabelle von i-1 und i+1 in der Tabelle von i sein
     #        i-1   i   i+1
-    for i in range(1, len(segmentated_string) - 1):                              # ohne erste und letzte 2-mere
-
-        if segmentated_string[i] in map_library[segmentated_string[i - 1]]:      # i in Mapping Tabelle i+1
-
-            if segmentated_string[i + 1] in map_library[segmentated_string[i]]:  # i+1 in Mapping Tabelle i
-                validation_list += ["tmT_nmT"]
-
-            else:
-                validation_list += ["tmT_nmF"]                                   # i+1 nicht in Mapping Tabelle i
-
-        else:                                                                    # i nicht in Mapping Tabelle i+1
-
-            if segmentated_string[i + 1] in map_library[segmentated_string[i]]:  # i+1 in Mapping Tabelle i
-                validation_list += ["tmF_nmT"]
-
-            else:                                                                # i+1 nicht in Mapping Tabelle i
-                validation_list += ["tmF_nmF"]
+    for i in range(1, len(ok) - 1):                     # ohne erste und letzte 2-mere
+        if ok[i]:                                       # i in Mapping Tabelle i-1
+            validation_list += ["tmT_nmT" if ok[i + 1] else "tmT_nmF"]
+        else:                                           # i nicht in Mapping Tabelle i-1
+            validation_list += ["tmF_nmT" if ok[i + 1] else "tmF_nmF"]
 
     # </editor-fold>
 
@@ -881,11 +2179,7 @@ def validate_list(segment, segment_count):
     # lT: last-two-mere --> correct
     # lF: last-two-mere --> false
 
-    if last_2_mere in map_library[segmentated_string[-2]]:  # letzter in Mapping Tabelle vorletzter 2-mere
-        validation_list += ["lT"]
-
-    else:
-        validation_list += ["lF"]
+    validation_list += ["lT" if ok[-1] else "lF"]  # letzter in Mapping Tabelle vorletzter 2-mere
     # </editor-fold>
 
     return validation_list
@@ -906,13 +2200,86 @@ def check_validation(validation_list):
     # lT: last-two-mere --> correct
     # lF: last-two-mere --> false
     for entry in validation_list:
-        if entry == "sT_nmF" or entry == "sF" or entry == "tmT_nmF" or entry == "tmF_nmT" or \
-                entry == "tmF_nmF" or entry == "lF":
+        if entry in DMR_INCONSISTENT_LABELS:
             return False
 
     return True
 
 
+def validate_batch(dna_segments, segment_indices):
+    """
+    Array based version of validate_list for a whole batch of DNA segments of equal length. Instead of a list of labels,
+    a compact int8 state code per 2-mere is returned (see DMR_VALIDATION_LABELS, e.g. 0 = "sT_nmT", 6 = "tmF_nmF"). Each
+    transition is checked with one lookup in the transition tables of the shared mapping table.
+    :param dna_segments: List of DNA strings with the same length (at least 2 2-meres), PackedDNA with segments of the same
+    length or a uint8 array of 2-mere codes (see dna_to_dmr_code_array).
+    :param segment_indices: Segment numbers of the DNA strings (array or list), which define the start 2-mere.
+    :return: int8 array of validation states with the shape (segments, 2-meres). The labels can be restored with
+    [DMR_VALIDATION_LABELS[state] for state in states[i]].
+    """
+
+    codes = dna_segments if isinstance(dna_segments, np.ndarray) else dna_to_dmr_code_array(dna_segments)
+    if codes.shape[1] < 2:
+        raise ValueError("The segments need to contain at least 2 2-meres to be validated.")
+
+    # Code 16 (keine gültige Base) passt zu keinem 2-mere
+    flags = get_dmr_automaton().transition_array(codes, segment_indices)
+    start_ok = flags[:, 0]
+    # 2-mere i+1 in Mapping Tabelle von 2-mere i
+    next_ok = flags[:, 1:].view(np.uint8)
+    states = np.empty(codes.shape, dtype=np.int8)
+    # sT_nmT = 0, sT_nmF = 1, sF = 2
+    states[:, 0] = np.where(start_ok, 1 - next_ok[:, 0], 2)
+    # tmT_nmT = 3, tmT_nmF = 4, tmF_nmT = 5, tmF_nmF = 6
+    states[:, 1:-1] = np.uint8(6) - (next_ok[:, :-1] << 1) - next_ok[:, 1:]
+    # lT = 7, lF = 8
+    states[:, -1] = np.uint8(8) - next_ok[:, -1]
+
+    return states
+
+
+def inconsistency_mask(validation_states):
+    """
+    Marks all 2-meres of validate_batch states which do not fit into the DMR scheme (equal to find_inconsistency_indices_new).
+    :param validation_states: int8 array of validation states (validate_batch).
+    :return: Boolean array with the shape of validation_states. True --> inconsistency.
+    """
+
+    inconsistent_states = np.ones(len(DMR_VALIDATION_LABELS), dtype=bool)
+    inconsistent_states[list(DMR_CLEAN_STATES)] = False
+
+    return inconsistent_states[validation_states]
+
+
+def check_validation_batch(validation_states):
+    """
+    Array based version of check_validation.
+    :param validation_states: int8 array of validation states (validate_batch).
+    :return: Boolean array with one entry per segment. True --> the segment fits completely into the DMR scheme.
+    """
+
+    return ~inconsistency_mask(validation_states).any(axis=1)
+
+
+def get_inconsistency_runs(validation_states):
+    """
+    Run-length encodes the consecutive inconsistencies of validate_batch states for all segments at once.
+    :param validation_states: int8 array of validation states (validate_batch).
+    :return: Three int arrays (segment, start, length) with one entry per run of consecutive inconsistent 2-meres.
+    Runs are sorted by segment and start position.
+    """
+
+    mask = inconsistency_mask(np.atleast_2d(validation_states)).astype(np.int8)
+    padded = np.zeros((mask.shape[0], mask.shape[1] + 2), dtype=np.int8)
+    padded[:, 1:-1] = mask
+    change = np.diff(padded, axis=1)
+
+    run_segment, run_start = np.nonzero(change == 1)
+    _, run_end = np.nonzero(change == -1)
+
+    return run_segment, run_start, run_end - run_start
+
+
 def find_inconsistency_indices_new(validation_list):
     """
     This function should detect all discrepancies in the validation list and output the positions which do not match
@@ -927,7 +2294,7 @@ def find_inconsistency_indices_new(validation_list):
     inconsistency_index_array = []
     # Wo befinden sich diese Abkürzungen, welche für fehlerhafte Stellen stehen
     for i, status in enumerate(validation_list):
-        if status == "sF" or status == "sT_nmF" or status == "tmT_nmF" or status == "tmF_nmF" or status == "tmF_nmT" or status == "lF":
+        if status in DMR_INCONSISTENT_LABELS:
             inconsistency_index_array += [i]
 
     return inconsistency_index_array
@@ -948,7 +2315,7 @@ def get_inconsistency_neighbours_new(validation_list):
     switch = False
 
     for i, status in enumerate(validation_list):
-        if status == "sF" or status == "sT_nmF" or status == "tmT_nmF" or status == "tmF_nmF" or status == "tmF_nmT" or status == "lF":
+        if status in DMR_INCONSISTENT_LABELS:
 
             if switch == False:
 
@@ -1039,6 +2406,523 @@ def check_for_neighboring_inconsistency(validation_list, position):
 
 
 
+#########################
+###### DMR Trellis ######
+#########################
+
+
+def dmr_substitution_costs(segment, base_weights=None):
+    """
+    Cost model of the DMR trellis: for every 2-mere of a DNA segment and every of the 16 possible 2-meres the number of
+    bases that would have to be substituted. Characters other than A, C, G and T never match.
+    :param segment: DNA string of even length.
+    :param base_weights: Optional costs per base position (e.g. from base qualities). Default is 1 per substituted base.
+    :return: float array with the shape (2-meres, 16).
+    """
+
+    observed = np.frombuffer(segment.encode("latin1", errors="replace"), dtype=np.uint8)
+    base_lookup = np.full(256, 4, dtype=np.uint8)   # 4 = keine Base
+    base_lookup[np.frombuffer(DMR_BASES.encode("ascii"), dtype=np.uint8)] = np.arange(4, dtype=np.uint8)
+    observed = base_lookup[observed].reshape(-1, 2)
+
+    weights = np.ones(observed.shape, dtype=np.float64) if base_weights is None else np.asarray(base_weights, dtype=np.float64).reshape(-1, 2)
+
+    states = np.arange(16)
+    costs = (observed[:, 0:1] != (states >> 2)) * weights[:, 0:1] + (observed[:, 1:2] != (states & 3)) * weights[:, 1:2]
+
+    return costs
+
+
+def iterate_viterbi_paths(segment, segment_count, base_weights=None):
+    """
+    Lazy k-best decoder of the DMR scheme for substitutions. The mapping table is a trellis with the 16 2-meres as states
+    (start 2-meres defined by the segment number). A backward Viterbi pass determines for every position and state the
+    lowest substitution cost (see dmr_substitution_costs) of the rest of the segment in O(2-meres x 16 x 4). With this
+    exact estimate a best-first search yields the valid DMR sequences one by one in increasing cost, so only as many paths
+    are built as the caller takes from the generator (e.g. until one of them is RS decodeable).
+    :param segment: Erroneous DNA string of even length (substitutions only).
+    :param segment_count: Segment number of the DNA strand, defines the start 2-meres.
+    :param base_weights: Optional costs per base position, see dmr_substitution_costs.
+    :return: Generator of (uint8 array of 2-mere codes, cost) in increasing cost. Every valid path is yielded once.
+    """
+
+    if isinstance(segment, PackedDNA):
+        segment = str(segment)
+    if len(segment) == 0 or len(segment) % 2 != 0:
+        return
+
+    dmr_mapping = get_dmr_mapping()
+    transition_table = dmr_mapping.transition_table.astype(np.intp)
+    costs = dmr_substitution_costs(segment, base_weights)
+    last_position = costs.shape[0] - 1
+
+    # Rückwärts-Viterbi: kleinste Kosten vom Zustand an einer Position bis zum Ende des Segments
+    remaining = np.zeros(costs.shape)
+    for position in range(last_position - 1, -1, -1):
+        remaining[position] = (costs[position + 1] + remaining[position + 1])[transition_table].min(axis=1)
+
+    successors = transition_table.tolist()
+    costs = costs.tolist()
+    remaining = remaining.tolist()
+
+    # Heap: (geschätzte Gesamtkosten, -Position, Zähler, Position, Knoten, bisherige Kosten), Knoten = (Zustand, Vorgängerknoten)
+    heap = []
+    counter = 0
+    for state in np.flatnonzero(dmr_mapping.automaton.start_allowed[segment_count % 4, 0:16]).tolist():
+        heap.append((costs[0][state] + remaining[0][state], 0, counter, 0, (state, None), costs[0][state]))
+        counter += 1
+    heapq.heapify(heap)
+
+    while heap:
+        total, _, _, position, node, cost = heapq.heappop(heap)
+
+        if position == last_position:
+            codes = []
+            while node is not None:
+                codes.append(node[0])
+                node = node[1]
+            yield np.array(codes[::-1], dtype=np.uint8), total
+            continue
+
+        # bei gleichen Kosten zuerst tiefere Knoten erweitern, der beste Pfad wird so ohne Umwege aufgebaut
+        for state in successors[node[0]]:
+            next_cost = cost + costs[position + 1][state]
+            heapq.heappush(heap, (next_cost + remaining[position + 1][state], -position - 1, counter, position + 1, (state, node), next_cost))
+            counter += 1
+
+
+def dmr_viterbi_decode(segment, segment_count, k=1, base_weights=None):
+    """
+    Maximum likelihood decoder of the DMR scheme for substitutions: the k valid DMR sequences with the lowest substitution
+    cost to the erroneous segment (first k paths of iterate_viterbi_paths).
+    :param segment: Erroneous DNA string of even length (substitutions only).
+    :param segment_count: Segment number of the DNA strand, defines the start 2-meres.
+    :param k: Number of paths to be returned.
+    :param base_weights: Optional costs per base position, see dmr_substitution_costs.
+    :return: List of (DNA sequence, cost) of at most k valid DMR sequences, sorted by increasing cost.
+    """
+
+    paths = []
+    for codes, cost in iterate_viterbi_paths(segment, segment_count, base_weights):
+        if len(paths) >= k:
+            break
+        paths.append((dmr_codes_to_dna(codes[None, :])[0], float(cost)))
+
+    return paths
+
+
+
+def iterate_indel_paths(segment, segment_count, segment_length, band=4, max_insertions=2):
+    """
+    Lazy k-best decoder of the DMR scheme for substitutions, insertions and deletions. The trellis of iterate_viterbi_paths
+    is extended by the offset between the observed and the expected base position (banded edit distance): every 2-mere of
+    the expected segment may be aligned to 0 to 2 + max_insertions observed bases with the edit distance as cost. A backward
+    pass over (2-mere, offset, state) gives the exact remaining cost, with which a best-first search yields the valid DMR
+    sequences of the expected length in increasing number of substitutions, insertions and deletions.
+    :param segment: Erroneous DNA string, any length.
+    :param segment_count: Segment number of the DNA strand, defines the start 2-meres.
+    :param segment_length: Expected number of bases of the segment (even).
+    :param band: Maximum offset between observed and expected base position, i.e. the surplus of insertions or deletions.
+    :param max_insertions: Maximum number of inserted bases within one 2-mere.
+    :return: Generator of (uint8 array of 2-mere codes, cost) in increasing cost. Every DMR sequence is yielded once.
+    """
+
+    if isinstance(segment, PackedDNA):
+        segment = str(segment)
+    observed_length = len(segment)
+    mere_number = segment_length // 2
+    if mere_number == 0 or segment_length % 2 != 0 or abs(observed_length - segment_length) > band:
+        return
+
+    dmr_mapping = get_dmr_mapping()
+    two_meres = dmr_mapping.two_meres
+    transition_table = dmr_mapping.transition_table.astype(np.intp)
+    max_span = 2 + max_insertions
+    width = 2 * band + 1
+
+    # Kosten, wenn ein 2-mere an Position j des Segments mit den nächsten l Basen ausgerichtet wird (inf außerhalb des Segments)
+    edit_costs = np.full((observed_length + 1, max_span + 1, 16), np.inf)
+    known_costs = {}
+    for j in range(observed_length + 1):
+        for span in range(0, min(max_span, observed_length - j) + 1):
+            part = segment[j: j + span]
+            if part not in known_costs:
+                known_costs[part] = [Levenshtein.distance(two_mere, part) for two_mere in two_meres]
+            edit_costs[j, span] = known_costs[part]
+
+    # remaining[m, Versatz + band, Zustand]: kleinste Restkosten, wenn m 2-mere mit dem letzten Zustand ausgegeben wurden
+    # (Versatz = Position im Segment - 2 * m). Zusätzliche Spalten mit inf fangen Versätze außerhalb des Bandes ab.
+    remaining = np.full((mere_number + 1, width + max_span, 16), np.inf)
+    remaining[mere_number, observed_length - segment_length + band] = 0
+    offsets = np.arange(width) - band
+    for mere in range(mere_number - 1, 0, -1):
+        positions = 2 * mere + offsets
+        inside = (positions >= 0) & (positions <= observed_length)
+        positions = np.clip(positions, 0, observed_length)
+        best = np.full((width, 16), np.inf)
+        for span in range(max_span + 1):
+            next_columns = np.arange(width) + span - 2
+            valid = inside & (next_columns >= 0)
+            candidates = edit_costs[positions, span] + remaining[mere + 1, np.clip(next_columns, 0, None)]
+            best = np.minimum(best, np.where(valid[:, None], candidates, np.inf))
+        remaining[mere, 0:width] = best[:, transition_table].min(axis=2)
+
+    successors = transition_table.tolist()
+    start_states = np.flatnonzero(dmr_mapping.automaton.start_allowed[segment_count % 4, 0:16]).tolist()
+    edit_costs = edit_costs.tolist()
+    remaining = remaining.tolist()
+
+    # Heap: (geschätzte Gesamtkosten, -2-mere, Zähler, 2-mere, Position im Segment, Knoten, bisherige Kosten), Knoten = (Zustand, Vorgänger)
+    heap = [(0.0, 0, 0, 0, 0, None, 0.0)]
+    counter = 1
+    yielded = set()
+
+    while heap:
+        total, _, _, mere, position, node, cost = heapq.heappop(heap)
+
+        if mere == mere_number:
+            codes = []
+            while node is not None:
+                codes.append(node[0])
+                node = node[1]
+            codes = tuple(codes[::-1])
+            # dieselbe Sequenz kann über verschiedene Ausrichtungen erreicht werden
+            if codes not in yielded:
+                yielded.add(codes)
+                yield np.array(codes, dtype=np.uint8), total
+            continue
+
+        states = start_states if node is None else successors[node[0]]
+        for span in range(min(max_span, observed_length - position) + 1):
+            column = position + span - 2 * (mere + 1) + band
+            if column < 0 or column >= width:
+                continue
+            for state in states:
+                estimate = remaining[mere + 1][column][state]
+                if estimate == np.inf:
+                    continue
+                next_cost = cost + edit_costs[position][span][state]
+                # bei gleichen Kosten zuerst tiefere Knoten erweitern
+                heapq.heappush(heap, (next_cost + estimate, -mere - 1, counter, mere + 1, position + span, (state, node), next_cost))
+                counter += 1
+
+
+
+#########################
+#### RS Codec Pool ######
+#########################
+
+# Gemeinsamer Pool aller RSCodec Instanzen. Beim Erzeugen eines RSCodec werden jedes Mal das Generatorpolynom und die
+# Galois-Tabellen neu berechnet, deshalb werden die Instanzen hier pro Parametersatz einmal erzeugt und wiederverwendet.
+# reedsolo stellt die Galois-Tabellen bei jedem encode/decode aus der Instanz wieder her, Codecs mit unterschiedlichem
+# c_exp können also parallel im Pool liegen.
+RS_CODEC_POOL_SIZE = 64
+_rs_codec_pool = OrderedDict()
+_rs_codec_pool_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def get_rs_codec(nsym: int, c_exp: int = 8, prim: int = 0x11d, fcr: int = 0):
+    """
+    Returns a shared RSCodec instance for the given parameters. The instances are kept in a bounded LRU pool
+    (RS_CODEC_POOL_SIZE entries), so repeated calls with the same parameters don't rebuild the codec.
+
+    Args:
+        nsym: Number of RS symbols
+        c_exp: exponent which defines the size of the Galois field. For example, exp = 12 defines a GF of 4095 (2^12 - 1)
+        prim: primitive polynomial of the Galois field
+        fcr: first consecutive root
+
+    Returns:
+        RSCodec instance
+    """
+    key = (nsym, c_exp, prim, fcr)
+    rs_coder = _rs_codec_pool.get(key)
+
+    if rs_coder is not None:
+        _rs_codec_pool.move_to_end(key)
+        _rs_codec_pool_stats["hits"] += 1
+        return rs_coder
+
+    _rs_codec_pool_stats["misses"] += 1
+    rs_coder = RSCodec(nsym, fcr=fcr, prim=prim, c_exp=c_exp)
+    _rs_codec_pool[key] = rs_coder
+
+    # Am längsten nicht benutzte Codecs entfernen
+    while len(_rs_codec_pool) > RS_CODEC_POOL_SIZE:
+        _rs_codec_pool.popitem(last=False)
+        _rs_codec_pool_stats["evictions"] += 1
+
+    return rs_coder
+
+
+def rs_codec_pool_stats():
+    """
+    Returns the hit/miss/eviction counters and the current size of the RSCodec pool.
+
+    Returns:
+        Dictionary with the keys hits, misses, evictions and size
+    """
+    return dict(_rs_codec_pool_stats, size=len(_rs_codec_pool))
+
+
+def clear_rs_codec_pool(reset_stats=True):
+    """
+    Removes all RSCodec instances from the pool.
+
+    Args:
+        reset_stats: If True the hit/miss/eviction counters are set back to zero
+    """
+    _rs_codec_pool.clear()
+
+    if reset_stats:
+        for key in _rs_codec_pool_stats:
+            _rs_codec_pool_stats[key] = 0
+
+
+#########################
+#### Correction Memo ####
+#########################
+
+# Gemeinsamer Speicher der Korrekturergebnisse (soft_force_new, initial_scan_correction). Nach der Mutation kommen dieselben
+# fehlerhaften Segmente über Trials und Sweeps hinweg immer wieder vor, das Ergebnis hängt nur vom Segment, der Segmentnummer
+# mod 4 (Start 2-mere), der RS Codec Größe, der Mapping Tabelle und den Korrekturparametern ab. Begrenzt als LRU, optional
+# zwischen Läufen als Datei gespeichert.
+CORRECTION_MEMO_SIZE = 100000
+CORRECTION_MEMO_VERSION = 1     # erhöhen, wenn sich die Ergebnisse der Korrektur ändern, alte Memo Dateien werden dann nicht mehr geladen
+_correction_memo = OrderedDict()
+_correction_memo_stats = {"hits": 0, "misses": 0, "evictions": 0}
+_correction_memo_journal = None     # neue Ergebnisse eines Worker-Prozesses, die an den Hauptprozess zurückgegeben werden
+
+
+def correction_memo_get(key, default=None):
+    """
+    Returns a memoized correction result and counts the hit or miss.
+
+    Args:
+        key: Hashable key, e.g. (function name, segment, segment number mod 4, RS codec size, ...)
+        default: Returned if the key is not in the memo
+
+    Returns:
+        Memoized result or default
+    """
+    value = _correction_memo.get(key, _correction_memo)
+
+    if value is _correction_memo:
+        _correction_memo_stats["misses"] += 1
+        return default
+
+    _correction_memo.move_to_end(key)
+    _correction_memo_stats["hits"] += 1
+    return value
+
+
+def correction_memo_put(key, value):
+    """
+    Stores a correction result in the memo. The least recently used results are removed if the memo holds more than
+    CORRECTION_MEMO_SIZE entries.
+
+    Args:
+        key: Hashable key (see correction_memo_get)
+        value: Result to be stored, should be immutable (tuple)
+    """
+    _correction_memo[key] = value
+    _correction_memo.move_to_end(key)
+    if _correction_memo_journal is not None:
+        _correction_memo_journal.append((key, value))
+
+    while len(_correction_memo) > CORRECTION_MEMO_SIZE:
+        _correction_memo.popitem(last=False)
+        _correction_memo_stats["evictions"] += 1
+
+
+def start_correction_memo_journal():
+    """
+    Starts recording the results stored in the correction memo of this process. Used in worker processes, whose memo is lost at the
+    end, so that the new results can be returned with the job results and merged into the memo of the main process.
+    """
+    global _correction_memo_journal
+
+    _correction_memo_journal = []
+
+
+def take_correction_memo_journal():
+    """
+    Returns the results recorded since start_correction_memo_journal or the last call and starts a new record.
+
+    Returns:
+        List of (key, value), empty if nothing is recorded in this process
+    """
+    global _correction_memo_journal
+
+    if _correction_memo_journal is None:
+        return []
+
+    entries = _correction_memo_journal
+    _correction_memo_journal = []
+    return entries
+
+
+def merge_correction_memo(entries):
+    """
+    Stores results of another process (e.g. returned by take_correction_memo_journal in a worker) in the correction memo. Results
+    already in the memo are kept.
+
+    Args:
+        entries: List of (key, value)
+    """
+    for key, value in entries:
+        if key not in _correction_memo:
+            correction_memo_put(key, value)
+
+
+def correction_memo_fingerprint():
+    """
+    Identifies the results in the correction memo: the memo version and the fingerprint of the current DMR mapping table. It is part of
+    every memo key and of the saved memo file.
+
+    Returns:
+        (CORRECTION_MEMO_VERSION, fingerprint of the mapping table)
+    """
+    return CORRECTION_MEMO_VERSION, get_dmr_mapping().fingerprint
+
+
+def correction_memo_dna_key(segment):
+    """
+    Key part of a DNA segment for the correction memo: the length and the packed bases (4 bases per byte), the same for a
+    DNA string and a PackedDNA. Strings with other characters than A, C, G and T are used as they are.
+
+    Args:
+        segment: DNA string or PackedDNA with one segment
+
+    Returns:
+        Hashable key part
+    """
+    if not isinstance(segment, PackedDNA):
+        try:
+            segment = PackedDNA.from_segments([segment])
+        except ValueError:
+            return segment
+
+    return len(segment), segment.packed_bytes()
+
+
+def correction_memo_stats():
+    """
+    Returns the hit/miss/eviction counters, the hit rate and the current size of the correction memo.
+
+    Returns:
+        Dictionary with the keys hits, misses, evictions, hit_rate and size
+    """
+    lookups = _correction_memo_stats["hits"] + _correction_memo_stats["misses"]
+    hit_rate = _correction_memo_stats["hits"] / lookups if lookups else 0.0
+
+    return dict(_correction_memo_stats, hit_rate=hit_rate, size=len(_correction_memo))
+
+
+def clear_correction_memo(reset_stats=True):
+    """
+    Removes all results from the correction memo.
+
+    Args:
+        reset_stats: If True the hit/miss/eviction counters are set back to zero
+    """
+    _correction_memo.clear()
+
+    if reset_stats:
+        for key in _correction_memo_stats:
+            _correction_memo_stats[key] = 0
+
+
+def _memo_to_json(value):
+    """
+    Converts a key or result of the correction memo to JSON values: tuples and bytes are marked, so that they can be restored by
+    _memo_from_json (keys have to be hashable again).
+
+    Args:
+        value: Key or result (None, bool, int, float, str, bytes and tuples / lists of them)
+
+    Returns:
+        JSON serialisable value
+    """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, tuple):
+        return {"tuple": [_memo_to_json(item) for item in value]}
+    if isinstance(value, list):
+        return [_memo_to_json(item) for item in value]
+    if isinstance(value, (bytes, bytearray)):
+        return {"bytes": base64.b64encode(value).decode("ascii")}
+
+    raise TypeError("The correction memo can't save values of the type %s." % type(value).__name__)
+
+
+def _memo_from_json(value):
+    # object_hook von json.load: markierte Tupel und Bytes wiederherstellen
+    if value.keys() == {"tuple"}:
+        return tuple(value["tuple"])
+    if value.keys() == {"bytes"}:
+        return base64.b64decode(value["bytes"])
+    return value
+
+
+def save_correction_memo(fp):
+    """
+    Saves the correction memo to a JSON file together with its fingerprint (see correction_memo_fingerprint), so that it can be
+    loaded again in a later run. JSON is used instead of pickle, so loading a memo file can't execute code. Results with values
+    that can't be saved as JSON are skipped.
+
+    Args:
+        fp: File path of the memo file
+    """
+    items = []
+    for key, value in _correction_memo.items():
+        try:
+            items.append([_memo_to_json(key), _memo_to_json(value)])
+        except TypeError:
+            continue
+    memo = {"fingerprint": _memo_to_json(correction_memo_fingerprint()), "items": items}
+
+    # erst in eine temporäre Datei schreiben, damit ein abgebrochener Lauf die alte Datei nicht zerstört
+    temp_fp = fp + ".tmp"
+    with open(temp_fp, "w", encoding="utf-8") as f:
+        json.dump(memo, f)
+    os.replace(temp_fp, fp)
+
+
+def load_correction_memo(fp):
+    """
+    Loads results saved with save_correction_memo into the correction memo. Results already in the memo are kept, a missing
+    file is ignored. Files of another mapping table or memo version (see correction_memo_fingerprint) are stale and not loaded,
+    as well as files that are no JSON memo files (e.g. pickle files of earlier versions).
+
+    Args:
+        fp: File path of the memo file
+
+    Returns:
+        Number of loaded results
+    """
+    if not os.path.exists(fp):
+        return 0
+
+    try:
+        with open(fp, "r", encoding="utf-8") as f:
+            memo = json.load(f, object_hook=_memo_from_json)
+    except ValueError:
+        return 0
+
+    if not isinstance(memo, dict) or memo.get("fingerprint") != correction_memo_fingerprint():
+        return 0
+
+    items = memo["items"]
+    for key, value in items:
+        if key not in _correction_memo:
+            correction_memo_put(key, value)
+
+    return len(items)
+
+
 ######################
 ##### Encode RS ######
 ######################
@@ -1062,7 +2946,7 @@ def rs_encode_with_symbol_number(data: list, symbol_number: int, exp: int):
     # Determine which RS Codec to use for each based on the percent error
 
     encoded = []
-    rsc = RSCodec(symbol_number, c_exp=exp)  # adding a defined number of RS symbols
+    rsc = get_rs_codec(symbol_number, c_exp=exp)  # adding a defined number of RS symbols
 
     for segment in data:
         if len(data) == 1:
@@ -1126,6 +3010,185 @@ def rs_force_uncorrect(codec_size: int, exp: int, *args):
     return tuple(decoded)
 
 
+# Klassen der Syndrom-Vorprüfung (classify_rs_candidates)
+RS_SYNDROME_ZERO = 0         # Codewort ohne Fehler, decode würde die Nachricht unverändert zurückgeben
+RS_SYNDROME_CORRECTABLE = 1  # Möglicherweise korrigierbar, muss vollständig dekodiert werden
+RS_SYNDROME_HOPELESS = 2     # Sicher nicht korrigierbar, decode würde einen Fehler werfen
+
+_gf_tables = {}
+
+
+def gf_log_exp_tables(prim: int = 0x11d, generator: int = 2, c_exp: int = 8):
+    """
+    Returns the log and antilog tables of the Galois field GF(2^c_exp) as NumPy arrays, in the same form as reedsolo
+    builds them. The exp table has double length so that sums of two logarithms don't need a modulo.
+
+    Args:
+        prim: primitive polynomial of the Galois field
+        generator: generator of the Galois field
+        c_exp: exponent which defines the size of the Galois field
+
+    Returns:
+        gf_log, gf_exp
+    """
+    key = (prim, generator, c_exp)
+    if key not in _gf_tables:
+        field_charac = 2**c_exp - 1
+        gf_exp = np.zeros(field_charac * 2, dtype=np.int64)
+        gf_log = np.zeros(field_charac + 1, dtype=np.int64)
+
+        x = 1
+        for i in range(field_charac):
+            gf_exp[i] = x
+            gf_log[x] = i
+            # Multiplikation mit dem Generator (carry-less) modulo prim
+            product, a, b = 0, x, generator
+            while b:
+                if b & 1:
+                    product ^= a
+                b >>= 1
+                a <<= 1
+                if a & (field_charac + 1):
+                    a ^= prim
+            x = product
+        gf_exp[field_charac:] = gf_exp[:field_charac]
+
+        gf_log.setflags(write=False)
+        gf_exp.setflags(write=False)
+        _gf_tables[key] = (gf_log, gf_exp)
+
+    return _gf_tables[key]
+
+
+def rs_syndromes_batch(codewords, nsym: int, fcr: int = 0, generator: int = 2, prim: int = 0x11d, c_exp: int = 8):
+    """
+    Calculates the RS syndromes of many codewords of the same length at once in GF(2^c_exp). The result matches
+    reedsolo.rs_calc_syndromes without the leading zero.
+
+    Args:
+        codewords: 2-D array with one codeword (message + RS symbols) per row
+        nsym: Number of RS symbols
+        fcr: first consecutive root
+        generator: generator of the Galois field
+        prim: primitive polynomial of the Galois field
+        c_exp: exponent which defines the size of the Galois field
+
+    Returns:
+        Array (number of codewords, nsym) with the syndromes (uint8 for GF(2^8), int64 for larger fields)
+    """
+    gf_log, gf_exp = gf_log_exp_tables(prim, generator, c_exp)
+    field_charac = 2**c_exp - 1
+    codewords = np.atleast_2d(np.asarray(codewords, dtype=np.uint8 if c_exp <= 8 else np.int64))
+    length = codewords.shape[1]
+
+    # S_j = sum_k c_k * (generator^(fcr+j))^(length-1-k), Summe ist XOR
+    nonzero = codewords != 0
+    log_codewords = gf_log[codewords]
+    degrees = np.arange(length - 1, -1, -1, dtype=np.int64)
+    generator_log = int(gf_log[generator])
+
+    syndromes = np.zeros((codewords.shape[0], nsym), dtype=codewords.dtype)
+    for j in range(nsym):
+        exponents = (log_codewords + (generator_log * (j + fcr) * degrees) % field_charac) % field_charac
+        terms = np.where(nonzero, gf_exp[exponents], 0)
+        syndromes[:, j] = np.bitwise_xor.reduce(terms, axis=1)
+
+    return syndromes
+
+
+def classify_rs_candidates(byte_segments, nsym: int, fcr: int = 0, generator: int = 2, prim: int = 0x11d, c_exp: int = 8):
+    """
+    Pre-checks RS codewords by their syndromes before the full decode. Codewords with zero syndromes are already
+    correct, codewords that can't be corrected for sure are marked as hopeless and everything else has to be
+    decoded by reedsolo. A codeword can only be marked as hopeless if nsym < 4: with one correctable error the
+    syndromes have to form a geometric series whose ratio points to a position inside the codeword.
+
+    Args:
+        byte_segments: List of uint8 arrays / bytearrays (RS codewords), the lengths may differ. For c_exp > 8 lists
+                       or arrays of the symbols.
+        nsym: Number of RS symbols
+        fcr: first consecutive root
+        generator: generator of the Galois field
+        prim: primitive polynomial of the Galois field
+        c_exp: exponent which defines the size of the Galois field (must be the one of the RSCodec)
+
+    Returns:
+        int8 array with RS_SYNDROME_ZERO, RS_SYNDROME_CORRECTABLE or RS_SYNDROME_HOPELESS per codeword
+    """
+    gf_log, _ = gf_log_exp_tables(prim, generator, c_exp)
+    field_charac = 2**c_exp - 1
+    classes = np.full(len(byte_segments), RS_SYNDROME_CORRECTABLE, dtype=np.int8)
+
+    length_groups = {}
+    for position, segment in enumerate(byte_segments):
+        length_groups.setdefault(len(segment), []).append(position)
+
+    for length, positions in length_groups.items():
+        # reedsolo teilt längere Nachrichten in Blöcke auf, diese werden komplett dekodiert
+        if nsym <= 0 or length <= nsym or length > field_charac:
+            continue
+
+        if c_exp <= 8:
+            codewords = np.array([np.frombuffer(bytes(byte_segments[position]), dtype=np.uint8) for position in positions])
+        else:
+            codewords = np.array([np.asarray(list(byte_segments[position]), dtype=np.int64) for position in positions])
+        syndromes = rs_syndromes_batch(codewords, nsym, fcr, generator, prim, c_exp)
+        group_classes = np.full(len(positions), RS_SYNDROME_CORRECTABLE, dtype=np.int8)
+
+        error_free = ~syndromes.any(axis=1)
+        group_classes[error_free] = RS_SYNDROME_ZERO
+
+        if nsym < 2:
+            group_classes[~error_free] = RS_SYNDROME_HOPELESS
+
+        elif nsym < 4:
+            # Ein einzelner Fehler e an Position X ergibt S_j = e * X^(fcr+j): alle Syndrome ungleich 0, gleiches Verhältnis X
+            all_nonzero = syndromes.all(axis=1)
+            log_syndromes = gf_log[syndromes]
+            ratio_log = (log_syndromes[:, 1] - log_syndromes[:, 0]) % field_charac
+            single_error = all_nonzero & (ratio_log < length)
+            if nsym == 3:
+                single_error &= (log_syndromes[:, 2] - log_syndromes[:, 1]) % field_charac == ratio_log
+            group_classes[~error_free & ~single_error] = RS_SYNDROME_HOPELESS
+
+        classes[positions] = group_classes
+
+    return classes
+
+
+def rs_decode_prechecked(rs_coder, byte_segments, classes=None):
+    """
+    RS decodes a list of codewords with the syndrome pre-check of classify_rs_candidates. Error free codewords are not
+    decoded, hopeless codewords are skipped and only the remaining ones are decoded by reedsolo. The pre-check uses the
+    Galois field of rs_coder (c_exp, prim, generator).
+
+    Args:
+        rs_coder: RSCodec used for the codewords
+        byte_segments: List of uint8 arrays / bytearrays (RS codewords)
+        classes: Result of classify_rs_candidates, calculated if not given
+
+    Returns:
+        List with the corrected codeword (message + RS symbols, bytearray) per codeword or None if it couldn't be decoded
+    """
+    if classes is None:
+        classes = classify_rs_candidates(byte_segments, rs_coder.nsym, rs_coder.fcr, rs_coder.generator, rs_coder.prim, rs_coder.c_exp)
+
+    decoded_list = []
+    for segment, rs_class in zip(byte_segments, classes):
+        if rs_class == RS_SYNDROME_ZERO:
+            decoded_list.append(bytearray(segment))
+        elif rs_class == RS_SYNDROME_HOPELESS:
+            decoded_list.append(None)
+        else:
+            try:
+                _, rs_string_decoded, errata_pos = rs_coder.decode(bytearray(segment))
+                decoded_list.append(rs_string_decoded if rs_coder.check(rs_string_decoded) else None)
+            except:
+                decoded_list.append(None)
+
+    return decoded_list
+
+
 def dna_to_bits(*args: str):
     """
     Translates strings of DNA (A, C, T, or G) into strings of bits (0 or 1) using a mapping table.
@@ -1164,31 +3227,48 @@ def dna_to_bits(*args: str):
 
 
 def binom_mutations_with_spacer_ignorance(sequence: str, dna_length_without_X: int, substitution_freq: float, insertion_freq: float, deletion_freq: float,
-                                          binom=True):
+                                          binom=True, rng=None):
     """
     A function used to generate random substitutions, insertions, and deletions in a DNA string given the DNA string and the frequency of each event.
     The DNA can contain spacers, which are marked with XXXXX. However, the errors are inserted only in the DNA sequence and not in the spacer sequences,
     so that these can be removed later with split more easily.Also, able to specify whether the event frequencies are the probability of a single
     event (meaning the total number of events follows a binomial distribution), or whether the event frequency is a percent of the length of the sequence.
+    The sequence is mutated as uint8 array with boolean masks (see mutate_base_array), so the runtime is linear in the sequence length.
 
     Args:
-        sequence: DNA sequence string
+        sequence: DNA sequence string or PackedDNA. A PackedDNA is mutated within its segments and returned as PackedDNA.
         dna_length_without_X: Input of the DNA length without the spacer sequences. This is needed to calculate the number of individual errors.
         substitution_freq: decimal between 0 and 1.0
         insertion_freq: decimal between 0 and 1.0
         deletion_freq: decimal between 0 and 1.0
         binom: boolean value specifying whether the total number of events for each event is calculated following a
                binomial distribution or not
+        rng: numpy Generator used for all random decisions. If None, a Generator is seeded from the random module, so random.seed() still
+             makes the mutations reproducible.
 
     Returns:
         DNA or binary sequence string with the number of events given by the event frequencies.
         The locations of the events are determined by a random sample of the list of bases or bits.
     """
+    if rng is None:
+        rng = np.random.default_rng(random.getrandbits(64))
+
+    if isinstance(sequence, PackedDNA):
+        return _mutate_packed_dna(sequence, dna_length_without_X, substitution_freq, insertion_freq, deletion_freq, binom, rng)
+
+    try:
+        base_array = np.frombuffer(sequence.encode("ascii"), dtype=np.uint8)
+    except UnicodeEncodeError:
+        base_array = None
+
     # check language
-    if set(np.unique(list(sequence))).issubset({'G', 'C', 'A', 'T', 'X'}):
-        alphabet = ["A", "C", "T", "G"]
-    elif set(np.unique(list(sequence))).issubset({'0', '1'}):
-        alphabet = ["0", "1"]
+    present = np.zeros(256, dtype=bool)
+    if base_array is not None:
+        present[base_array] = True
+    if base_array is not None and not present[_ascii_codes("GCATX", invert=True)].any():
+        alphabet = "ACTG"
+    elif base_array is not None and not present[_ascii_codes("01", invert=True)].any():
+        alphabet = "01"
     else:
         raise ValueError(
             "Incorrect sequence language. Make sure your sequence only includes '0' or '1' if it is a binary sequence, "
@@ -1196,35 +3276,103 @@ def binom_mutations_with_spacer_ignorance(sequence: str, dna_length_without_X: i
 
     # set number of events
     if binom:
-        num_to_substitute = stats.binom.rvs(dna_length_without_X, substitution_freq)
-        num_to_insert = stats.binom.rvs(dna_length_without_X, insertion_freq)
-        num_to_delete = stats.binom.rvs(dna_length_without_X, deletion_freq)
+        num_to_substitute = rng.binomial(dna_length_without_X, substitution_freq)
+        num_to_insert = rng.binomial(dna_length_without_X, insertion_freq)
+        num_to_delete = rng.binomial(dna_length_without_X, deletion_freq)
     else:
         num_to_substitute = int(dna_length_without_X * substitution_freq)
         num_to_insert = int(dna_length_without_X * insertion_freq)
         num_to_delete = int(dna_length_without_X * deletion_freq)
 
-    # substitutions
-    # substitute = random.sample(range(len(sequence)), k=num_to_substitute)
-    substitute = random.sample([pos for pos, letter in enumerate(sequence) if letter in alphabet], k=num_to_substitute)
-    sequence = [
-        (random.choice([base for base in alphabet if base != (sequence[i])]) if i in substitute else sequence[i]) for i
-        in list(range(len(sequence)))]
-    sequence = ''.join(sequence)
+    mutated = mutate_base_array(base_array, num_to_substitute, num_to_insert, num_to_delete, alphabet, rng)
 
-    # insertions
-    insert = random.sample([pos for pos, letter in enumerate(sequence) if letter in alphabet], k=num_to_insert)
-    sequence = [(sequence[i] + random.choice(alphabet) if i in insert else sequence[i]) for i in
-                list(range(len(sequence)))]
-    sequence = ''.join(sequence)
+    return mutated.tobytes().decode("ascii")
+
+
+def _mutate_packed_dna(sequence, dna_length_without_X: int, substitution_freq: float, insertion_freq: float, deletion_freq: float, binom, rng):
+    """
+    binom_mutations_with_spacer_ignorance for PackedDNA. Only one separator per segment boundary is placed between the segments
+    while mutating, so the same positions are mutated as in the string with spacers and the new segment boundaries are read
+    from the separators afterwards.
+    """
+    if binom:
+        num_to_substitute = rng.binomial(dna_length_without_X, substitution_freq)
+        num_to_insert = rng.binomial(dna_length_without_X, insertion_freq)
+        num_to_delete = rng.binomial(dna_length_without_X, deletion_freq)
+    else:
+        num_to_substitute = int(dna_length_without_X * substitution_freq)
+        num_to_insert = int(dna_length_without_X * insertion_freq)
+        num_to_delete = int(dna_length_without_X * deletion_freq)
+
+    base_array = np.frombuffer(PACKED_DNA_BASES.encode("ascii"), dtype=np.uint8)[sequence.codes()]
+    base_array = np.insert(base_array, sequence.segment_offsets[1:-1], ord("X"))
+
+    mutated = mutate_base_array(base_array, num_to_substitute, num_to_insert, num_to_delete, "ACTG", rng)
+
+    separators = np.flatnonzero(mutated == ord("X"))
+    segment_lengths = np.diff(np.concatenate([[-1], separators, [len(mutated)]])) - 1
+    codes = _bases_to_codes(mutated[mutated != ord("X")])
+
+    return PackedDNA.from_codes(codes, segment_lengths)
 
-    # deletions
-    delete = random.sample([pos for pos, letter in enumerate(sequence) if letter in alphabet], k=num_to_delete)
-    sequence = [sequence[i] for i in list(range(len(sequence))) if i not in delete]
-    sequence = ''.join(sequence)
 
-    return sequence
+def _ascii_codes(characters, invert=False):
+    """
+    Boolean lookup table over all 256 byte values which is True for the given characters (or for all other values if invert is True).
+    """
+    table = np.zeros(256, dtype=bool)
+    table[np.frombuffer(characters.encode("ascii"), dtype=np.uint8)] = True
+    return ~table if invert else table
+
 
+def mutate_base_array(base_array, num_to_substitute: int, num_to_insert: int, num_to_delete: int, alphabet="ACTG", rng=None):
+    """
+    Introduces a fixed number of substitutions, insertions and deletions into a uint8 array of ASCII characters. Only positions holding a
+    character of the alphabet are mutated, all other characters (e.g. the spacer X) are left untouched. As in the original list based
+    version, the substitutions are done first, then the insertions (a random base behind a random position) and last the deletions, each
+    drawn without replacement from the positions of the current sequence.
+
+    Args:
+        base_array: uint8 array with the ASCII codes of the sequence
+        num_to_substitute: Number of substitutions
+        num_to_insert: Number of insertions
+        num_to_delete: Number of deletions
+        alphabet: Characters that can be mutated and inserted
+        rng: numpy Generator used for all random decisions
+
+    Returns:
+        New uint8 array with the mutated sequence
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+
+    alphabet_codes = np.frombuffer(alphabet.encode("ascii"), dtype=np.uint8)
+    alphabet_index = np.full(256, -1, dtype=np.int64)
+    alphabet_index[alphabet_codes] = np.arange(len(alphabet_codes))
+    sequence = np.array(base_array, dtype=np.uint8)
+
+    # substitutions: jede gewählte Base wird durch eine der anderen Basen ersetzt
+    positions = np.flatnonzero(alphabet_index[sequence] >= 0)
+    substitute = rng.choice(positions, size=num_to_substitute, replace=False)
+    shift = rng.integers(1, len(alphabet_codes), size=num_to_substitute)
+    sequence[substitute] = alphabet_codes[(alphabet_index[sequence[substitute]] + shift) % len(alphabet_codes)]
+
+    # insertions: neue Base hinter der gewählten Position
+    positions = np.flatnonzero(alphabet_index[sequence] >= 0)
+    insert = np.zeros(len(sequence), dtype=bool)
+    insert[rng.choice(positions, size=num_to_insert, replace=False)] = True
+    new_positions = np.arange(len(sequence)) + np.cumsum(insert) - insert
+    inserted = np.empty(len(sequence) + num_to_insert, dtype=np.uint8)
+    inserted[new_positions] = sequence
+    inserted[new_positions[insert] + 1] = alphabet_codes[rng.integers(0, len(alphabet_codes), size=num_to_insert)]
+    sequence = inserted
+
+    # deletions
+    positions = np.flatnonzero(alphabet_index[sequence] >= 0)
+    keep = np.ones(len(sequence), dtype=bool)
+    keep[rng.choice(positions, size=num_to_delete, replace=False)] = False
+
+    return sequence[keep]
 
 
 def single_substitution_correction(segment, error_two_mere_position):
@@ -1273,23 +3421,131 @@ def score_pairs_fast(pairs: list, as_percent=True):
         ex: score_pairs([("kitten", "sitting", "kitten and sitting"), ("Sunday", "Saturday", "Sunday and Saturday")])
         returns  [('kitten and sitting', 0.5714285714285714), ('Sunday and Saturday', 0.625)]
     """
-    similarity_scores = []
-    names = []
 
-    for pair in pairs:
+    return score_pairs_batch(pairs, as_percent)
+
+
+def edit_distance(s1: str, s2: str, error_type=None, max_distance=None):
+    """
+    Edit distance of two strings for score_pairs_batch.
+    :param s1: First string.
+    :param s2: Second string.
+    :param error_type: With "subs" and equal lengths the Hamming distance is returned (only substitutions, no alignment).
+    :param max_distance: Optional bound. The calculation stops early once the distance exceeds the bound and
+    max_distance + 1 is returned.
+    :return: Distance
+    """
+
+    if len(s1) == 0 or len(s2) == 0:
+        distance = max(len(s1), len(s2))
+    elif error_type == "subs" and len(s1) == len(s2):
+        distance = Levenshtein.hamming(s1, s2)
+    else:
+        return Levenshtein.distance(s1, s2, score_cutoff=max_distance)
+
+    return distance if max_distance is None else min(distance, max_distance + 1)
+
+
+def score_pairs_batch(pairs: list, as_percent=True, workers=None, error_type=None, max_distance=None):
+    """
+    Calculates the edit distances of many pairs at once like score_pairs_fast. The Levenshtein C extension releases the
+    GIL, so the pairs are distributed over a thread pool.
+
+    Args:
+        pairs: List of (string1, string2, name) tuples like in score_pairs_fast.
+        as_percent: If True the similarity 1 - distance / length of the longer string is returned, otherwise the distance.
+        workers: Number of threads. None or 1 calculates the pairs serially, 0 uses one thread per CPU core.
+        error_type: With "subs" pairs of equal length are compared with the Hamming distance (fast path for
+                    substitution only errors). Other values use the Levenshtein distance.
+        max_distance: Optional bound for the distance (banded calculation). Pairs with a larger distance get the
+                      distance max_distance + 1, so their similarity is a lower bound.
+
+    Returns:
+        A list of (name, score) tuples in the order of the pairs.
+    """
+
+    def score(pair):
         s1 = str(pair[0])
         s2 = str(pair[1])
-        name = str(pair[2])
+        distance = edit_distance(s1, s2, error_type, max_distance)
+        if as_percent:
+            return str(pair[2]), 1 - distance / max(len(s1), len(s2))
+        return str(pair[2]), distance
 
-        if len(s1) == 0 or len(s2) == 0:
-            edit_dist = max(len(s1), len(s2))
-        else:
-            edit_dist = Levenshtein.distance(s1, s2)
+    if workers is None or workers == 1 or len(pairs) <= 1:
+        return [score(pair) for pair in pairs]
 
-        if as_percent:
-            similarity_scores.append(1 - edit_dist / max(len(s1), len(s2)))
-        else:
-            similarity_scores.append(edit_dist)
-        names.append(name)
+    with ThreadPoolExecutor(max_workers=workers if workers > 0 else os.cpu_count()) as executor:
+        return list(executor.map(score, pairs))
+
+
+def segment_error_counts(original_segments, mutated_segments):
+    """
+    Counts the substitutions, insertions and deletions of every segment. The segments are compared one by one at their
+    known boundaries (spacers), so the cost only grows with the number of segments times the squared segment length
+    and not with the squared length of the whole strand.
+
+    Args:
+        original_segments: Original segments as list of strings or PackedDNA.
+        mutated_segments: Mutated segments in the same order (same number of segments).
+
+    Returns:
+        int64 array with the shape (number of segments, 3) and the columns substitutions, insertions, deletions of an
+        optimal alignment of each segment pair.
+    """
+
+    # gepackte Segmente bleiben Views, nur veränderte Segmente werden für Levenshtein in Strings übersetzt
+    original_segments = list(original_segments.segments()) if isinstance(original_segments, PackedDNA) else list(original_segments)
+    mutated_segments = list(mutated_segments.segments()) if isinstance(mutated_segments, PackedDNA) else list(mutated_segments)
+    if len(original_segments) != len(mutated_segments):
+        raise ValueError(f"The number of segments differs ({len(original_segments)} != {len(mutated_segments)}). Please enter segments with the "
+                         f"same boundaries.")
+
+    operation_columns = {"replace": 0, "insert": 1, "delete": 2}
+    counts = np.zeros((len(original_segments), 3), dtype=np.int64)
+    for i, (original, mutated) in enumerate(zip(original_segments, mutated_segments)):
+        if original == mutated:
+            continue
+        original, mutated = str(original), str(mutated)
+        if len(original) == len(mutated):
+            # nur Substitutionen, wenn keine Alignierung mit Indels kürzer ist
+            hamming = Levenshtein.hamming(original, mutated)
+            if Levenshtein.distance(original, mutated, score_cutoff=hamming) == hamming:
+                counts[i, 0] = hamming
+                continue
+        for operation, _, _ in Levenshtein.editops(original, mutated):
+            counts[i, operation_columns[operation]] += 1
+
+    return counts
+
+
+def score_segments(original_segments, mutated_segments, name: str, as_percent=True, spacer_length=6):
+    """
+    Segment by segment version of score_pairs_fast for the DNA with spacers. The distance is the sum of the segment
+    distances of segment_error_counts. It is the same as the distance of the whole strands as long as an optimal
+    alignment keeps the spacers aligned (the mutations ignore the spacers), otherwise it is an upper bound.
+
+    Args:
+        original_segments: Original segments as list of strings or PackedDNA.
+        mutated_segments: Mutated segments in the same order.
+        name: Name of the pair.
+        as_percent: If True the similarity 1 - distance / length of the longer strand (with spacers) is returned.
+        spacer_length: Length of the spacer between two segments, used for the strand length.
+
+    Returns:
+        (name, score) like score_pairs_fast and the per segment counts of segment_error_counts.
+    """
+
+    counts = segment_error_counts(original_segments, mutated_segments)
+    distance = int(counts.sum())
+    if not as_percent:
+        return (name, distance), counts
+
+    original_length = len(original_segments) if isinstance(original_segments, PackedDNA) else sum(len(segment) for segment in original_segments)
+    # jedes Segment: Länge Original + Insertionen - Deletionen
+    mutated_length = original_length + int(counts[:, 1].sum()) - int(counts[:, 2].sum())
+    spacers = spacer_length * (len(counts) - 1) if len(counts) else 0
+    total_length = max(original_length, mutated_length) + spacers
+    score = 1 - distance / total_length if total_length else 1.0
 
-    return list(zip(names, similarity_scores))
+    return (name, score), counts
@@ -9,7 +9,8 @@ import logging
 def encoding_picture(seed: int, num_bitlen: int, segment_len: int, rs_symbols_percent: float, correction_mode: str,  compression_mode: bool,
                      logging_filepath: str, logging_filename: str, logging_num_elements=100, logging_num_segments=10, rs_codec_value=32, min_codec_value=4,
                      min_segment_length=25, picture_path="Logo_long__binary_.png", picture_type="binary",
-                     random_mask=True, show_image=True, verbose=True, do_xor=False):
+                     random_mask=True, show_image=True, verbose=True, do_xor=False, packed=False, mask_mode="legacy",
+                     xor_mode="legacy"):
     """
     This function encodes 1-bit images with the variants RS, RS_Spacer and DMR. The inserted RS symbols are calculated as a percentage of the total length of
     the section to be encoded. In addition, a logging file will be generated so that the individual steps of the encoding can be checked later.
@@ -30,9 +31,12 @@ def encoding_picture(seed: int, num_bitlen: int, segment_len: int, rs_symbols_pe
         random_mask: Defines whether a random masked should be used to encode the picture.
         show_image: Determines whether the image should be displayed before translated.
         verbose: Sets how detailed the logging file should be recorded. True: very detailed. False: Warnings only
+        packed: If True the encoded DNA segments are returned as functions.PackedDNA (2 bits per base, segment boundaries instead of spacers).
+        mask_mode: Mode of the random mask keystream (see functions.MASK_MODES). legacy gives the masks of earlier versions.
+        xor_mode: Mode of the xor keystream if do_xor is set (see functions.XorKeystream).
 
     Returns:
-        Returns a list with the encoded DNA segments and a list with the binary translations.
+        Returns a list with the encoded DNA segments (or PackedDNA) and a list with the binary translations.
     """
 
     import math
@@ -62,8 +66,8 @@ def encoding_picture(seed: int, num_bitlen: int, segment_len: int, rs_symbols_pe
 
     # Daten einlesen
     if picture_type == "binary":
-        picture = func.read_1bit_image(ROOT_DIR + picture_path, show_image)
-        picture_str = "".join(str(item) for item in picture)
+        picture = func.read_1bit_image_array(im, show_image)   # bereits eingelesenes Bild verwenden
+        picture_str = func.bit_array_to_string(picture[0:logging_num_elements])
         logging.debug('Raw binary image (first %s elements out of %s):\n%s'
                       % (logging_num_elements, len(picture), "\n".join([picture_str[i:i + w] for i in range(0, logging_num_elements, w)])))
 
@@ -78,27 +82,23 @@ def encoding_picture(seed: int, num_bitlen: int, segment_len: int, rs_symbols_pe
                       % (logging_num_elements, len(compressed_data), compressed_data[0:logging_num_elements]))
 
     if do_xor:
-        random.seed(seed)
-        xor_bits = list(func.bytes_to_bits(8, compressed_data)[0])
-        xor_string = [random.randint(0, 1) for x in range(len(xor_bits))]
-        xor = [int(xor_bits[item]) ^ xor_string[item] for item in range(len(xor_bits))]
-        xor_bytes = func.bits_to_bytes(8, "".join(str(item) for item in xor))[0]
-        compressed_data = xor_bytes
-        random.seed()
-        logging.debug("Generated Xor string (first %s values out of %s):\n%s"
-                      % (logging_num_elements, len(xor_string), np.array(xor_string[0:logging_num_elements])))
+        xored_data = func.xor_whitening(compressed_data, seed, xor_mode)
+        xor_string = np.bitwise_xor(xored_data[0:logging_num_elements], np.asarray(compressed_data[0:logging_num_elements], dtype=np.uint8))
+        compressed_data = xored_data
+        logging.debug("Generated Xor bytes (first %s values out of %s):\n%s"
+                      % (logging_num_elements, len(xored_data), xor_string))
         logging.debug("Picture xor generated xor string (first %s values out of %s):\n%s"
                       % (logging_num_elements, len(compressed_data), np.array(compressed_data[0:logging_num_elements])))
 
     # Bitlen bei größeren Galois Feld anpassen
     if num_bitlen != 8:
-        compressed_data = func.bits_to_bytes(num_bitlen, func.bytes_to_bits(8, list(compressed_data))[0])[0]
+        compressed_data = func.bit_array_to_values(func.values_to_bit_array(compressed_data, 8), num_bitlen)
         logging.debug('Data converted to %s bit integers (first %s elements out of %s):\n%s' % (
                        num_bitlen, logging_num_elements, len(compressed_data), np.array(compressed_data[0:logging_num_elements])))
 
     # random mask
     if random_mask:
-        compressed_data = func.random_mask(compressed_data, seed, num_bitlen)
+        compressed_data = func.random_mask(compressed_data, seed, num_bitlen, mask_mode)
         logging.debug('Masked data (first %s elements out of %s):\n%s'
                       % (logging_num_elements, len(compressed_data), np.array(compressed_data[0:logging_num_elements])))
     else:
@@ -212,11 +212,14 @@ def encoding_picture(seed: int, num_bitlen: int, segment_len: int, rs_symbols_pe
                       % (logging_num_segments, len(binary_segment_list), sum(len(item) for item in binary_segment_list),
                          np.array(binary_segment_list[0:logging_num_segments])))
 
-        dmr_message_list = [func.translate_binary_to_dmr_singular(binary_segment, segment_indice) for segment_indice, binary_segment in
-                            enumerate(binary_segment_list)]
+        # Übersetzung aller Segmente als Batch, gepackt direkt aus den 2-mere Codes ohne DNA Strings
+        dmr_message_list = func.translate_byte_segments_to_dmr(rsm_segment_list, packed=packed)
+        if packed:
+            dmr_length, dmr_preview = len(dmr_message_list), dmr_message_list.segment_range(0, logging_num_segments).to_strings()
+        else:
+            dmr_length, dmr_preview = sum(len(item) for item in dmr_message_list), dmr_message_list[0:logging_num_segments]
         logging.debug("Input DNA segments (first %s segments out of %s. Total of %s elements.):\n%s"
-                      % (logging_num_segments, len(dmr_message_list), sum(len(item) for item in dmr_message_list),
-                         np.array(dmr_message_list[0:logging_num_segments])))
+                      % (logging_num_segments, len(rsm_segment_list), dmr_length, np.array(dmr_preview)))
 
         rs_message_list = dmr_message_list
 
@@ -226,12 +229,172 @@ def encoding_picture(seed: int, num_bitlen: int, segment_len: int, rs_symbols_pe
     for handler in logger.handlers:
         logger.removeHandler(handler)  # Vorhandene Handler entfernen
 
+    if packed and not isinstance(rs_message_list, func.PackedDNA):
+        rs_message_list = func.PackedDNA.from_segments(rs_message_list)
+
     return rs_message_list, binary_segment_list
 
 
+def encoding_picture_stream(seed: int, picture_source, rs_codec_value=32, min_codec_value=4, min_segment_length=25, random_mask=True, do_xor=False,
+                            tile_rows=256, threshold=None, verbose=True, mask_mode="legacy", xor_mode="legacy"):
+    """
+    Generator version of encoding_picture for the DMR mode without compression. The image is read in tiles of image rows, packed, masked, RS encoded
+    and translated segment by segment, and every DNA segment is yielded as soon as it is complete. For a numpy.memmap, a binary PGM file or an
+    iterable of tiles only the current tile and one segment are held in memory, so large scans can be written directly to a file with
+    write_dna_stream. Other image files (e.g. PNG) are decoded completely first (see functions.load_image_tiles_source). The yielded segments are
+    the same as the DMR segments of encoding_picture with num_bitlen=8 and compression_mode=False.
+
+    Args:
+        seed: Start seed for the random mask.
+        picture_source: File path, image array / numpy.memmap or iterable of image tiles (see functions.iter_image_tiles).
+        rs_codec_value: Input the codec value for the DMR_RS_Coder.
+        min_codec_value: Input the minimal codec value for the DMR_RS_Coder.
+        min_segment_length: Input the minimal segment length for the DMR_RS_Coder.
+        random_mask: Defines whether a random masked should be used to encode the picture.
+        do_xor: Defines whether the bits should be xored with a random bit string before masking (like encoding_picture).
+        tile_rows: Number of image rows that are read at once.
+        threshold: Fixed black and white threshold for tile iterables. None uses the Otsu threshold (two passes over the image).
+        verbose: Sets whether the segment parameters should be logged.
+        mask_mode: Mode of the random mask keystream (see functions.MASK_MODES). legacy gives the masks of earlier versions.
+        xor_mode: Mode of the xor keystream if do_xor is set (see functions.XorKeystream).
+
+    Yields:
+        DNA segments in segment order
+    """
+
+    import numpy as np
+    import functions as func
+    import dmr_rs_coder as codec
+
+    dmr_rsm_coder_main = codec.DMR_RS_Coder(rs_codec_value=rs_codec_value, min_codec_value=min_codec_value, min_segment_length=min_segment_length)
+    rs_symbol_size, payload_size = dmr_rsm_coder_main.recalculate_codec()
+    rs_coder = func.get_rs_codec(rs_symbol_size)
+    if verbose:
+        logging.info("STREAM ENCODING: segments with " + str((rs_symbol_size + payload_size) * 8) + " length.")
+
+    # Eigene Keystreams mit demselben Seed wie in encoding_picture, sie laufen über alle Segmente weiter
+    xor_keystream = func.XorKeystream(seed, xor_mode)
+    mask_keystream = func.MaskKeystream(seed, 8, mask_mode)
+
+    def encode_payload(payload):
+        nonlocal segment_index
+        # Maske wie func.random_mask
+        if random_mask:
+            payload = ((payload.astype(np.int64) + mask_keystream.take(len(payload))) % 256).astype(np.uint8)
+        dna = func.translate_byte_segments_to_dmr([rs_coder.encode(bytearray(payload))], [segment_index])[0]
+        segment_index += 1
+        return dna
+
+    def pack_bits(bits):
+        # 8 Bits pro Byte, danach XOR wie in encoding_picture
+        packed_bytes = np.packbits(bits)
+        if do_xor:
+            packed_bytes = func.xor_whitening(packed_bytes, xor_keystream)
+        return packed_bytes
+
+    segment_index = 0
+    leftover_bits = np.zeros(0, dtype=np.uint8)     # Bits, die noch kein volles Byte ergeben
+    payload = np.zeros(0, dtype=np.uint8)           # Bytes, die noch kein volles Segment ergeben
+
+    for tile in func.iter_1bit_image_tiles(picture_source, tile_rows, threshold):
+        bits = np.concatenate((leftover_bits, tile.ravel()))
+        full_bytes = len(bits) - len(bits) % 8
+        leftover_bits = bits[full_bytes:]
+        payload = np.concatenate((payload, pack_bits(bits[:full_bytes])))
+
+        full_segments = len(payload) - len(payload) % payload_size
+        for start in range(0, full_segments, payload_size):
+            yield encode_payload(payload[start:start + payload_size])
+        payload = payload[full_segments:]
+
+    # Restliche Bits wie bei np.packbits mit Nullen zu einem Byte auffüllen, danach das letzte kürzere Segment
+    if len(leftover_bits):
+        padded_bits = np.concatenate((leftover_bits, np.zeros(8 - len(leftover_bits), dtype=np.uint8)))
+        payload = np.concatenate((payload, pack_bits(padded_bits)))
+    for start in range(0, len(payload), payload_size):
+        yield encode_payload(payload[start:start + payload_size])
+
+
+def write_dna_stream(dna_segments, fp, spacer="XXXXXX"):
+    """
+    Writes DNA segments from a generator (e.g. encoding_picture_stream) to a file one after another, separated by the spacer.
+
+    Args:
+        dna_segments: Iterable of DNA segments.
+        fp: File path or open text file.
+        spacer: Sequence written between two segments.
+
+    Returns:
+        Number of written segments and number of written bases without spacers.
+    """
+
+    if isinstance(fp, str):
+        with open(fp, "w") as outfile:
+            return write_dna_stream(dna_segments, outfile, spacer)
+
+    segment_count = 0
+    base_count = 0
+    for segment in dna_segments:
+        if segment_count:
+            fp.write(spacer)
+        fp.write(segment)
+        segment_count += 1
+        base_count += len(segment)
+
+    return segment_count, base_count
+
+
+def read_dna_stream(fp, spacer="XXXXXX", header_lines=0, chunk_size=65536):
+    """
+    Reads DNA segments from a file one after another without loading the file completely (counterpart of write_dna_stream). The segments are
+    separated by the spacer, line breaks are ignored. Lines starting with ">" (FASTA headers) also end a segment. Empty segments are skipped like
+    after splitting at the spacer.
+
+    Args:
+        fp: File path or open text file.
+        spacer: Sequence between two segments.
+        header_lines: Number of lines at the beginning of the file that are skipped (e.g. 2 for the fasta files written by run.py).
+        chunk_size: Number of characters that are read at once.
+
+    Yields:
+        DNA segments in file order
+    """
+
+    if isinstance(fp, str):
+        with open(fp, "r") as infile:
+            yield from read_dna_stream(infile, spacer, header_lines, chunk_size)
+        return
+
+    for _ in range(header_lines):
+        fp.readline()
+
+    buffer = ""
+    while True:
+        line = fp.readline(chunk_size)
+        if line.startswith(">") or line == "":
+            # FASTA Header oder Dateiende beenden das aktuelle Segment
+            for segment in buffer.split(spacer):
+                if segment != "":
+                    yield segment
+            buffer = ""
+            if line == "":
+                break
+            while line and not line.endswith("\n"):   # Rest einer langen Headerzeile überspringen
+                line = fp.readline(chunk_size)
+            continue
+
+        buffer += line.strip()
+        segments = buffer.split(spacer)
+        buffer = segments.pop()    # letztes Stück kann noch weitergehen oder einen Teil des Spacers enthalten
+        for segment in segments:
+            if segment != "":
+                yield segment
+
+
 def encoding_picture_segmented_packbits(seed: int, num_bitlen: int, segment_len: int, rs_symbols_percent: float, correction_mode: str, logging_filepath: str,
                                         logging_filename: str, logging_num_elements=100, logging_num_segments=10,
-                                        picture_path="Logo_long__binary_.png", picture_type="binary", show_image=True, verbose=True):
+                                        picture_path="Logo_long__binary_.png", picture_type="binary", show_image=True, verbose=True, packed=False,
+                                        mask_mode="legacy"):
     """
     This function encodes 1-bit images of the RS and DMR segmented packbit variant. Here, the image is read in and the strand of pixels is divided into segments
     of a certain size. These segments are then further encoded. The advantage of this is that the size of each segment is known, so that shifts due to packbit
@@ -253,9 +416,11 @@ def encoding_picture_segmented_packbits(seed: int, num_bitlen: int, segment_len:
         mapping_table: Choose between the mapping_table two_bit and no_random when not using DMR.
         show_image: Determines whether the image should be displayed before translating.
         verbose: Sets how detailed the logging file should be recorded. True: very detailed. False: Warnings only
+        packed: If True the encoded DNA segments are returned as functions.PackedDNA (2 bits per base, segment boundaries instead of spacers).
+        mask_mode: Mode of the random mask keystream (see functions.MASK_MODES). legacy gives the masks of earlier versions.
 
     Returns:
-        Returns a list with the encoded DNA segments and a list with the binary translations.
+        Returns a list with the encoded DNA segments (or PackedDNA) and a list with the binary translations.
     """
     import math
     import packbits
@@ -284,8 +449,8 @@ def encoding_picture_segmented_packbits(seed: int, num_bitlen: int, segment_len:
 
     # Daten einlesen
     if picture_type == "binary":
-        picture = func.read_1bit_image(ROOT_DIR + picture_path, show_image)
-        picture_str = "".join(str(item) for item in picture)
+        picture = func.read_1bit_image_array(im, show_image)   # bereits eingelesenes Bild verwenden
+        picture_str = func.bit_array_to_string(picture[0:logging_num_elements])
         logging.debug('Raw binary image (first %s elements out of %s):\n%s'
                       % (logging_num_elements, len(picture), "\n".join([picture_str[i:i + w] for i in range(0, logging_num_elements, w)])))
 
@@ -304,7 +469,7 @@ def encoding_picture_segmented_packbits(seed: int, num_bitlen: int, segment_len:
 
 
     # Zufallsmaske hinzufügen
-    masked = [func.random_mask(segment, seed + i, num_bitlen) for i, segment in enumerate(compressed_data)]
+    masked = [func.random_mask(segment, seed + i, num_bitlen, mask_mode) for i, segment in enumerate(compressed_data)]
     len_masked_data = sum(len(mask) for mask in masked)
     logging.debug('Masked data (first %s segments out of %s. Total of %s elements.):\n%s'
                   % (logging_num_segments, len(masked), len_masked_data, masked[0:logging_num_segments]))
@@ -340,7 +505,6 @@ def encoding_picture_segmented_packbits(seed: int, num_bitlen: int, segment_len:
 
     elif correction_mode == "DMR_segmented_packbits":
         import dmr_rs_coder as codec
-        from reedsolo import RSCodec
 
 
         logging.info('TRANSLATING SEQUENCE USING DMR-RS')
@@ -364,10 +528,14 @@ def encoding_picture_segmented_packbits(seed: int, num_bitlen: int, segment_len:
                          binary_segment_list[0:logging_num_segments]))
 
 
-        message_list = [func.translate_binary_to_dmr_singular(binary_segment, segment_indice) for segment_indice, binary_segment in
-                        enumerate(binary_segment_list)]
+        # Übersetzung aller Segmente als Batch, gepackt direkt aus den 2-mere Codes ohne DNA Strings
+        message_list = func.translate_byte_segments_to_dmr(encoded, packed=packed)
+        if packed:
+            dna_length, dna_preview = len(message_list), message_list.segment_range(0, logging_num_segments).to_strings()
+        else:
+            dna_length, dna_preview = sum(len(item) for item in message_list), message_list[0:logging_num_segments]
         logging.debug("Input DNA segments (first %s segments out of %s. Total of %s elements.):\n%s"
-                      % (logging_num_segments, len(message_list), sum(len(item) for item in message_list), np.array(message_list[0:logging_num_segments])))
+                      % (logging_num_segments, len(encoded), dna_length, np.array(dna_preview)))
 
 
     logging.info("Encoding finished")
@@ -377,6 +545,9 @@ def encoding_picture_segmented_packbits(seed: int, num_bitlen: int, segment_len:
     for handler in logger.handlers:
         logger.removeHandler(handler)  # Vorhandene Handler entfernen
 
+    if packed and not isinstance(message_list, func.PackedDNA):
+        message_list = func.PackedDNA.from_segments(message_list)
+
     return message_list, binary_segment_list
 
 
@@ -386,7 +557,8 @@ def encoding_picture_segmented_packbits(seed: int, num_bitlen: int, segment_len:
 def picture_decode(dna_seq: [], seed: int, bitlen: int, rs_symbols_percent: float, segment_size: int, correction_mode: str, compression: bool,
                    picture_width: int, picture_height: int, save_filepath: str, save_filename: str, logging_filepath: str, logging_filename: str,
                    logging_num_elements=100, logging_num_segments=10, rs_codec_value=32, min_codec_value=4, min_segment_length=25,
-                   picture_mode="binary", random_mask=True, verbose=True, do_xor=False, correction=True):
+                   picture_mode="binary", random_mask=True, verbose=True, do_xor=False, correction=True, correction_workers=None,
+                   mask_mode="legacy", xor_mode="legacy"):
     """
     This function can be used to decode DNA sequences that were previously encoded using the encoding method: No, No_with_spacer, RS, RS_spacer or DMR in the
     picture_encode function. The inserted RS symbols are calculated as a percentage of the total length of the section to be encoded.
@@ -394,6 +566,7 @@ def picture_decode(dna_seq: [], seed: int, bitlen: int, rs_symbols_percent: floa
 
     Args:
         dna_seq: Input a list of dna sequences. The spacer need to be removed before decoding. Input the list of dna_sequences after spacer removal.
+                 A functions.PackedDNA can be used as well, its segments are decoded (empty segments are skipped like after spacer removal).
         seed: Start seed of the random mask.
         bitlen: Number of bits for byte translation.
         rs_symbols_percent: Percent of RS symbols from total fragment length. Ex: RS(255/223/32) 255 = 100%, 32 = 12.55% --> 0.1255 Input
@@ -411,6 +584,9 @@ def picture_decode(dna_seq: [], seed: int, bitlen: int, rs_symbols_percent: floa
         picture_mode: Defines what image type the selected image belongs to. Currently only binary images are supported.
         random_mask: Defines whether the random masked should be used to decode.
         verbose: Sets how detailed the logging file should be recorded. True: very detailed. False: Warnings only
+        correction_workers: DMR only. Number of worker processes for the DMR correction of the erroneous segments. None: serial correction
+        mask_mode: Mode of the random mask keystream that was used for encoding (see functions.MASK_MODES).
+        xor_mode: Mode of the xor keystream that was used for encoding (see functions.XorKeystream).
 
     Returns:
         Returns the corrected bit sequence and the picture. Furthermore, they are saved with the logging file in the specified path.
@@ -420,7 +596,13 @@ def picture_decode(dna_seq: [], seed: int, bitlen: int, rs_symbols_percent: floa
     import packbits
     import numpy as np
     import functions as func
-    from reedsolo import RSCodec
+
+    # Gepackte DNA: Segmente anhand der gespeicherten Segmentgrenzen statt durch Split am Spacer. Im DMR Modus bleibt die DNA gepackt
+    # und wird über die 2-mere Codes übersetzt, die anderen Modi arbeiten mit Strings
+    if isinstance(dna_seq, func.PackedDNA):
+        dna_seq = dna_seq.drop_empty_segments()
+        if correction_mode != "DMR":
+            dna_seq = dna_seq.to_strings()
 
     # Logging File
     logging.basicConfig(
@@ -510,7 +692,7 @@ def picture_decode(dna_seq: [], seed: int, bitlen: int, rs_symbols_percent: floa
         rs_symbols = math.ceil(rs_symbols_percent * len(data_bytes))  # Anzahl rs zeichen vom Gesamtsegment --> hier jetzt Gesamtsegment
         if correction:
             # remove reed solomon codes
-            rs_coder = RSCodec(rs_symbols, c_exp=bitlen)
+            rs_coder = func.get_rs_codec(rs_symbols, c_exp=bitlen)
             try:
                 binary_masked = rs_coder.decode(data_bytes)[0]
                 logging.debug("Byte sequence without RS Codes (first %s elements out of %s):\n%s" % (logging_num_elements,
@@ -554,7 +736,7 @@ def picture_decode(dna_seq: [], seed: int, bitlen: int, rs_symbols_percent: floa
         decoded_list = []
         rs_symbols = math.ceil(rs_symbols_percent * (segment_size / 8))  # Anzahl rs zeichen  # segmentsize als DNA Segment angegeben --> Byte benötigt / 8
         if correction:
-            rs_coder = RSCodec(rs_symbols)
+            rs_coder = func.get_rs_codec(rs_symbols)
             for bytes_obj in bytes_list:
                 try:
                     decoded_list.append(list(rs_coder.decode(bytes_obj)[0]))
@@ -594,14 +776,20 @@ def picture_decode(dna_seq: [], seed: int, bitlen: int, rs_symbols_percent: floa
 
         logging.info('DECODING PICTURE WITH MODE DMR')
         import dmr_rs_coder as codec
-        from reedsolo import RSCodec
 
         if correction:
             dmr_rsm_coder_main = codec.DMR_RS_Coder(rs_codec_value=rs_codec_value, min_codec_value=min_codec_value, min_segment_length=min_segment_length)
             new_codec_size, payload_size = dmr_rsm_coder_main.recalculate_codec()
             errornous_segments, decodable_segments = dmr_rsm_coder_main.initial_scan_correction(dna_seq)
-            errornous_segments_2, decodable_segments_2 = dmr_rsm_coder_main.after_scan_correction_try_Jess(errornous_segments)
+            # Erwartete Segmentlängen für die Indel-Korrektur, das letzte Segment ist kürzer (ohne Kompression aus der Bildgröße bekannt)
+            data_size = None if compression else math.ceil(picture_width * picture_height / 8)
+            segment_number = dna_seq.num_segments if isinstance(dna_seq, func.PackedDNA) else len(dna_seq)
+            segment_lengths = {count: codec.expected_segment_length(count, new_codec_size, payload_size, data_size, segment_number)
+                               for _, count in errornous_segments}
+            errornous_segments_2, decodable_segments_2 = dmr_rsm_coder_main.after_scan_correction_try_Jess(errornous_segments, workers=correction_workers,
+                                                                                                          segment_lengths=segment_lengths)
             logging.debug("%s segment(s) decoded in initial scan. %s segment(s) decoded in after scan" % (len(decodable_segments), len(decodable_segments_2)))
+            logging.debug("Correction memo: %s" % func.correction_memo_stats())
 
             if len(errornous_segments_2) != 0:
                 logging.error("%s segment(s) cannot be decoded by DMR:\n%s" % (len(errornous_segments_2), errornous_segments_2))
@@ -619,25 +807,31 @@ def picture_decode(dna_seq: [], seed: int, bitlen: int, rs_symbols_percent: floa
             # Listen müssen sortiert werden damit die richtige Reihenfolge wieder da ist!
             all_segments.sort(key=lambda x: x[1])
 
-            bits_list = [func.enhanced_translate_dna_to_binary_singular(*segment) for segment in all_segments]  # equal to line 98
-            logging.debug("Recovered bit sequences (first %s segments out of %s):\n%s" % (logging_num_segments, len(bits_list), bits_list[0:logging_num_segments]))
+            # Segmente, die vollständig ins DMR Schema passen und die richtige Länge haben, direkt als Batch in Bytes übersetzen
+            segment_bases = (new_codec_size + payload_size) * 8
+            byte_segments, validation_checks = func.translate_dna_segments_to_bytes([segment[0] for segment in all_segments],
+                                                                                    [segment[1] for segment in all_segments])
+            bytes_list = []
+            for number, segment in enumerate(all_segments):
+                if validation_checks[number] and len(segment[0]) == segment_bases:
+                    bytes_list.append(byte_segments[number].tolist())
+                    continue
+
+                # restliche Segmente mit der erweiterten Übersetzung
+                item = func.enhanced_translate_dna_to_binary_singular(str(segment[0]), segment[1])
 
-            # Teilweise waren die Einträge in der Bits List zu kurz oder zu lang → hiermit passt es
-            for number, item in enumerate(bits_list):
+                # Teilweise waren die Einträge in der Bits List zu kurz oder zu lang → hiermit passt es
                 if len(item) > (new_codec_size + payload_size) * 8:
                     logging.error("Segment size inaccurate. %s bases too many." % abs(len(item) - (new_codec_size + payload_size) * 8))
-                    bits_list[number] = item[0: (new_codec_size + payload_size) * 8]
+                    item = item[0: (new_codec_size + payload_size) * 8]
 
-                while len(item) < (new_codec_size + payload_size) * 8:
+                if len(item) < (new_codec_size + payload_size) * 8:
                     logging.error("Segment size inaccurate. %s bases too few." % abs(len(item) - (new_codec_size + payload_size) * 8))
-                    item += str(random.randint(0, 1))
-                    bits_list[number] = item
-
                     while len(item) < (new_codec_size + payload_size) * 8:
                         item += str(random.randint(0, 1))
-                        bits_list[number] = item
 
-            bytes_list = func.bits_to_bytes(8, *bits_list)
+                bytes_list.append(func.bits_to_bytes(8, item)[0])
+
             logging.debug("Recovered byte sequences (first %s segments out of %s):\n%s"
                           % (logging_num_segments, len(bytes_list), np.array(bytes_list[0:logging_num_segments])))
 
@@ -645,7 +839,7 @@ def picture_decode(dna_seq: [], seed: int, bitlen: int, rs_symbols_percent: floa
             decoded_list = []
             for bytes_obj in bytes_list:
                 try:
-                    rs_coder = RSCodec(new_codec_size)
+                    rs_coder = func.get_rs_codec(new_codec_size)
                     decoded_list.append(list(rs_coder.decode(bytes_obj)[0]))
                 except:
                     forced = func.rs_force_uncorrect(new_codec_size, bitlen, bytes_obj)[0]
@@ -667,9 +861,9 @@ def picture_decode(dna_seq: [], seed: int, bitlen: int, rs_symbols_percent: floa
 
         else:   # keine Korrektur mit DMR
             bits_list = []
-            for index, segment in enumerate(dna_seq):
+            for index, segment in enumerate(dna_seq.segments() if isinstance(dna_seq, func.PackedDNA) else dna_seq):
                 try:
-                    translated = func.enhanced_translate_dna_to_binary_singular(segment, index)
+                    translated = func.enhanced_translate_dna_to_binary_singular(str(segment), index)
                     bits_list.append(translated)
                 except:
                     bits_list.append("0")
@@ -697,7 +891,7 @@ def picture_decode(dna_seq: [], seed: int, bitlen: int, rs_symbols_percent: floa
                       % (logging_num_elements, len(binary_masked), np.array(binary_masked[0:logging_num_elements])))
 
     if random_mask:
-        unmasked = func.remove_mask(binary_masked, seed, bitlen)
+        unmasked = func.remove_mask(binary_masked, seed, bitlen, mask_mode)
         logging.debug("Unmasked list (first %s bytes out of %s):\n%s" % (logging_num_elements, len(unmasked), np.array(unmasked[0:logging_num_elements])))
     else:
         unmasked = binary_masked
@@ -708,22 +902,18 @@ def picture_decode(dna_seq: [], seed: int, bitlen: int, rs_symbols_percent: floa
     # for data in to decode ende --> Abschluss
     logging.info("CONVERTING BYTES BACK TO PICTURE AND WRITING REFERENCE FILE")
     if bitlen != 8:
-        unmasked = func.bits_to_bytes(8, func.bytes_to_bits(bitlen, list(unmasked))[0])[0]
+        unmasked = func.bit_array_to_values(func.values_to_bit_array(unmasked, bitlen), 8)
         logging.debug('Data converted to 8 bit integers (first %s elements out of %s):\n%s'
                       % (logging_num_elements, len(unmasked), np.array(unmasked[0:logging_num_elements])))
 
     if do_xor:
-        random.seed(seed)
-        xor_bits = list(func.bytes_to_bits(8, unmasked)[0])
-        xor_string = [random.randint(0, 1) for x in range(len(xor_bits))]
-        xor = [int(xor_bits[item]) ^ xor_string[item] for item in range(len(xor_bits))]
-        xor_bytes = func.bits_to_bytes(8, "".join(str(item) for item in xor))[0]
-        unmasked = xor_bytes
-        random.seed()
-        logging.debug("Generated Xor string (first %s values out of %s):\n%s"
-                      % (logging_num_elements, len(xor_string), np.array(xor_string[0:logging_num_elements])))
+        xored_data = func.xor_whitening(unmasked, seed, xor_mode)
+        xor_string = np.bitwise_xor(xored_data[0:logging_num_elements], np.asarray(unmasked[0:logging_num_elements], dtype=np.uint8))
+        unmasked = xored_data
+        logging.debug("Generated Xor bytes (first %s values out of %s):\n%s"
+                      % (logging_num_elements, len(xored_data), xor_string))
         logging.debug("Unpacked binary data xor generated xor string (first %s values out of %s):\n%s"
-                      % (logging_num_elements, len(xor), np.array(xor[0:logging_num_elements])))
+                      % (logging_num_elements, len(unmasked), unmasked[0:logging_num_elements]))
 
     if picture_mode == "binary":
         if compression:
@@ -736,8 +926,8 @@ def picture_decode(dna_seq: [], seed: int, bitlen: int, rs_symbols_percent: floa
         else:
             decompressed_data = np.array(unmasked, dtype="uint8")
 
-        unpacked_data = list(np.unpackbits(decompressed_data))
-        unpacked_str = "".join(str(item) for item in unpacked_data)
+        unpacked_data = np.unpackbits(decompressed_data)
+        unpacked_str = func.bit_array_to_string(unpacked_data[0:logging_num_elements])
         logging.debug("Unpacked binary data (first %s values out of %s):\n%s"
                       % (logging_num_elements, len(unpacked_data),
                          "\n".join([unpacked_str[i:i + picture_width] for i in range(0, logging_num_elements, picture_width)])))
@@ -757,10 +947,141 @@ def picture_decode(dna_seq: [], seed: int, bitlen: int, rs_symbols_percent: floa
     return bitseq, output   # Binärfile, Picture
 
 
+def picture_decode_stream(dna_segments, seed: int, picture_width: int, picture_height: int, rs_codec_value=32, min_codec_value=4,
+                          min_segment_length=25, random_mask=True, do_xor=False, workers=None, reorder_window=16, verbose=False,
+                          mask_mode="legacy", xor_mode="legacy"):
+    """
+    Generator version of picture_decode for the DMR mode without compression. The segments are taken from an iterator (e.g. read_dna_stream or a
+    generator), corrected and RS decoded one by one, and the image rows are yielded as soon as their bytes are decoded. With workers the segments
+    are corrected in a process pool; the decoded segments are put back in order with a reorder buffer keyed by the segment index, which holds at
+    most reorder_window segments. The rows can be written with functions.write_1bit_image_stream.
+
+    Args:
+        dna_segments: Iterable of DNA segments (segment index = position) or of (segment index, DNA segment) tuples.
+        seed: Start seed of the random mask.
+        picture_width: Defines the width of the picture.
+        picture_height: Defines the height of the picture.
+        rs_codec_value: Input the codec value for the DMR_RS_Coder.
+        min_codec_value: Input the minimal codec value for the DMR_RS_Coder.
+        min_segment_length: Input the minimal segment length for the DMR_RS_Coder.
+        random_mask: Defines whether the random masked should be used to decode.
+        do_xor: Defines whether the bits were xored with a random bit string while encoding.
+        workers: Number of worker processes for the segment decoding. None or 1 decodes the segments serially, 0 uses all CPU cores.
+        reorder_window: Maximum number of segments that are decoded ahead or wait in the reorder buffer. A segment index that is still missing
+                        when the buffer is full is treated as lost and replaced by random bytes. Input that is out of order by more than
+                        reorder_window segments therefore loses data: a segment that arrives after its index was given up is dropped.
+        verbose: Determine if all results of the DMR correction should be displayed.
+        mask_mode: Mode of the random mask keystream that was used for encoding (see functions.MASK_MODES).
+        xor_mode: Mode of the xor keystream that was used for encoding (see functions.XorKeystream).
+
+    Yields:
+        Image rows as uint8 arrays with picture_width values of 0 and 1 (at most picture_height rows)
+    """
+
+    import math
+    import numpy as np
+    import functions as func
+    import dmr_rs_coder as codec
+    from concurrent.futures import ProcessPoolExecutor
+
+    dmr_rsm_coder_main = codec.DMR_RS_Coder(rs_codec_value=rs_codec_value, min_codec_value=min_codec_value, min_segment_length=min_segment_length)
+    new_codec_size, payload_size = dmr_rsm_coder_main.recalculate_codec()
+    data_size = math.ceil(picture_width * picture_height / 8)     # gepacktes Bild, bestimmt die Länge des letzten Segments
+
+    # Eigene Keystreams mit demselben Seed wie in picture_decode
+    mask_keystream = func.MaskKeystream(seed, 8, mask_mode)
+    xor_keystream = func.XorKeystream(seed, xor_mode)
+    # Der Counter-Modus erlaubt das Entfernen der Maske pro Segment unabhängig von der Reihenfolge (direkt im Worker)
+    segment_mask = (seed, mask_mode) if random_mask and mask_mode == "counter" else None
+
+    executor = None
+    if workers is not None and workers != 1:
+        executor = ProcessPoolExecutor(max_workers=workers if workers > 0 else os.cpu_count())
+
+    reorder_buffer = {}     # Segmentindex --> Bytes oder Future
+    given_up = set()        # Segmentindizes, die bei vollem Puffer durch Zufallsbytes ersetzt wurden
+    next_index = 0
+    rows_written = 0
+    row_bits = np.zeros(0, dtype=np.uint8)   # Bits, die noch keine volle Bildzeile ergeben
+
+    def take_payload(wait):
+        # Nächstes Segment in Reihenfolge aus dem Puffer holen, None wenn es noch nicht fertig ist
+        nonlocal next_index
+        entry = reorder_buffer.get(next_index)
+        if entry is None:
+            if not wait:
+                return None
+            logging.error("Segment %s is missing and is replaced by random bytes." % next_index)
+            given_up.add(next_index)
+            payload = [random.randint(0, 255) for _ in range(payload_size)]
+        else:
+            if not isinstance(entry, list):
+                if not wait and not entry.done():
+                    return None
+                entry = entry.result()
+            payload = entry
+            del reorder_buffer[next_index]
+        next_index += 1
+        return payload
+
+    def payload_to_rows(payload):
+        nonlocal rows_written, row_bits
+        if random_mask and segment_mask is None:
+            payload = (np.array(payload, dtype=np.int64) - mask_keystream.take(len(payload))) % 256
+        payload = np.array(payload, dtype=np.uint8)
+        if do_xor:
+            payload = func.xor_whitening(payload, xor_keystream)
+        bits = np.unpackbits(payload)
+
+        row_bits = np.concatenate((row_bits, bits))
+        rows = []
+        while len(row_bits) >= picture_width and rows_written < picture_height:
+            rows.append(row_bits[:picture_width])
+            row_bits = row_bits[picture_width:]
+            rows_written += 1
+        return rows
+
+    try:
+        position = 0
+        for item in dna_segments:
+            index, segment = item if isinstance(item, tuple) else (position, item)
+            position += 1
+            if index in given_up:
+                logging.error("Segment %s arrived after it was given up (reorder_window too small), it is dropped." % index)
+                given_up.discard(index)
+                continue
+            if index < next_index or index in reorder_buffer:
+                logging.error("Segment %s was read twice, only the first one is used." % index)
+                continue
+
+            job = (segment, index, new_codec_size, payload_size, verbose, segment_mask,
+                   codec.expected_segment_length(index, new_codec_size, payload_size, data_size))
+            reorder_buffer[index] = executor.submit(codec._decode_segment_job, job) if executor else codec._decode_segment_job(job)
+
+            # fertige Segmente in Reihenfolge ausgeben, bei vollem Puffer auf das nächste warten
+            while reorder_buffer:
+                payload = take_payload(wait=len(reorder_buffer) >= reorder_window)
+                if payload is None:
+                    break
+                yield from payload_to_rows(payload)
+            if rows_written == picture_height:
+                return
+
+        while reorder_buffer and rows_written < picture_height:
+            yield from payload_to_rows(take_payload(wait=True))
+
+        if len(row_bits) and rows_written < picture_height:
+            yield row_bits    # letzte unvollständige Zeile, wird beim Schreiben aufgefüllt
+
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+
 def picture_decode_segmented_packbits(dna_seq: [], seed: int, bitlen: int, rs_symbols_percent: float, segment_size: int, correction_mode: str,
                                       compression: bool, picture_width: int, picture_height: int, save_filepath: str, save_filename: str, logging_filepath: str,
                                       logging_filename: str, logging_num_elements=100, logging_num_segments=10, picture_mode="binary", correction=True,
-                                      verbose=True):
+                                      verbose=True, correction_workers=None, mask_mode="legacy"):
     """
     This function can be used to decode DNA sequences that were previously encoded using the encoding method: RS_segmented_packbits and DMR_segmented_packbits
     in the picture_encode function. The inserted RS symbols are calculated as a percentage of the total length of the section to be encoded.
@@ -768,6 +1089,7 @@ def picture_decode_segmented_packbits(dna_seq: [], seed: int, bitlen: int, rs_sy
 
     Args:
         dna_seq: Input a list of dna sequences. The spacer need to be removed before decoding. Input the list of dna_sequences after spacer removal.
+                 A functions.PackedDNA can be used as well, its segments are decoded (empty segments are skipped like after spacer removal).
         seed: Start seed of the random mask.
         bitlen: Number of bits for byte translation.
         rs_symbols_percent: Percent of RS symbols from total fragment length. Ex: RS(255/223/32) 255 = 100%, 32 = 12.55% --> 0.1255 Input
@@ -784,6 +1106,8 @@ def picture_decode_segmented_packbits(dna_seq: [], seed: int, bitlen: int, rs_sy
         logging_num_segments: Defines the number of segments which should be written in the logfile.
         picture_mode: Defines what image type the selected image belongs to. Currently only binary images are supported.
         verbose: Sets how detailed the logging file should be recorded. True: very detailed. False: Warnings only
+        correction_workers: DMR only. Number of worker processes for the DMR correction of the erroneous segments. None: serial correction
+        mask_mode: Mode of the random mask keystream that was used for encoding (see functions.MASK_MODES).
 
     Returns:
         Returns the corrected bit sequence and the picture. Furthermore, they are saved with the logging file in the specified path.
@@ -795,7 +1119,11 @@ def picture_decode_segmented_packbits(dna_seq: [], seed: int, bitlen: int, rs_sy
     import packbits
     import numpy as np
     import functions as func
-    from reedsolo import RSCodec
+
+    # Gepackte DNA: Segmente anhand der gespeicherten Segmentgrenzen statt durch Split am Spacer, die Segmente bleiben gepackt (Views)
+    # und werden erst bei der Übersetzung einzeln in Strings umgewandelt
+    if isinstance(dna_seq, func.PackedDNA):
+        dna_seq = list(dna_seq.drop_empty_segments().segments())
 
     # Logging File
     logging.basicConfig(
@@ -819,14 +1147,14 @@ def picture_decode_segmented_packbits(dna_seq: [], seed: int, bitlen: int, rs_sy
     # Länge berechnen und ausgeben mit Hinweis + Spacer
     dna_length = sum(len(item) for item in dna_seq)
     logging.debug("Original DNA sequence: (%s, first %s segments out of %s):\n%s"
-                  % (dna_length, logging_num_segments, len(dna_seq)-1, dna_seq[0:logging_num_segments]))
+                  % (dna_length, logging_num_segments, len(dna_seq)-1, [str(item) for item in dna_seq[0:logging_num_segments]]))
 
 
     if correction_mode == "RS_segmented_packbits":
         logging.info('DECODING PICTURE WITH MODE RS-SEGMENTED-PACKBITS')
 
         # DNA to bits
-        bits_list = [func.dna_to_bits(segment)[0] for segment in dna_seq]
+        bits_list = [func.dna_to_bits(str(segment))[0] for segment in dna_seq]
         logging.debug("Recovered bit sequence (first %s segments out of %s):\n%s" % (logging_num_segments, len(bits_list), bits_list[0:logging_num_segments]))
 
 
@@ -856,7 +1184,7 @@ def picture_decode_segmented_packbits(dna_seq: [], seed: int, bitlen: int, rs_sy
                         decoded_list.append(decodable_segments)
                         counter[2] += 1
                     else:
-                        errornous_segments_2, decodable_segments_2 = dmr_rsm_coder_main.after_scan_correction_try_Jess(errornous_segments)
+                        errornous_segments_2, decodable_segments_2 = dmr_rsm_coder_main.after_scan_correction_try_Jess(errornous_segments, workers=correction_workers)
 
                         if len(decodable_segments_2) == 1:
                             decoded_list.append(decodable_segments_2)
@@ -866,7 +1194,7 @@ def picture_decode_segmented_packbits(dna_seq: [], seed: int, bitlen: int, rs_sy
                             not_corrected.append(errornous_segments_2[0][0])
                             counter[4] += 1
                 except:
-                    decoded_list.append([(dna_segment, i)])
+                    decoded_list.append([(str(dna_segment), i)])
                     not_corrected.append(errornous_segments_2[0][0])
                     counter[4] += 1
 
@@ -877,7 +1205,7 @@ def picture_decode_segmented_packbits(dna_seq: [], seed: int, bitlen: int, rs_sy
             # Listen müssen sortiert werden damit die richtige Reihenfolge wieder da ist! --> falls except aufgetreten ist!
             decoded_list.sort(key=lambda x: x[1])
 
-            bits_list = [dmr.enhanced_translate_dna_to_binary_singular(*segment) for segment in decoded_list]  # equal to line 98
+            bits_list = [dmr.enhanced_translate_dna_to_binary_singular(str(segment[0]), segment[1]) for segment in decoded_list]  # equal to line 98
             logging.debug("Recovered bit sequences (first %s segments out of %s):\n%s" % (logging_num_segments, len(bits_list), bits_list[0:logging_num_segments]))
 
         else:
@@ -885,7 +1213,7 @@ def picture_decode_segmented_packbits(dna_seq: [], seed: int, bitlen: int, rs_sy
             bits_list = []
             for index, segment in enumerate(decoded_list):
                 try:
-                    translated = dmr.translate_dna_to_binary_singular(segment, index)   # die enhanced funktion korrigiert auch schon!
+                    translated = dmr.translate_dna_to_binary_singular(str(segment), index)   # die enhanced funktion korrigiert auch schon!
                     bits_list.append(translated)
                 except:
                     bits_list.append("00")
@@ -901,7 +1229,7 @@ def picture_decode_segmented_packbits(dna_seq: [], seed: int, bitlen: int, rs_sy
         for bytes_obj in bytes_list:
             rs_symboles = math.ceil(len(bytes_obj) * rs_symbols_percent)
             try:
-                rs_coder = RSCodec(rs_symboles)
+                rs_coder = func.get_rs_codec(rs_symboles)
                 decoded_list.append(list(rs_coder.decode(bytes_obj)[0]))
                 counter[0] += 1
             except:
@@ -924,7 +1252,7 @@ def picture_decode_segmented_packbits(dna_seq: [], seed: int, bitlen: int, rs_sy
 
 
     # Zufallsmaske entfernen
-    binary_list = [func.remove_mask(decoded_list[i], seed + i, bitlen) for i in range(len(decoded_list))]
+    binary_list = [func.remove_mask(decoded_list[i], seed + i, bitlen, mask_mode) for i in range(len(decoded_list))]
     logging.debug("Recovered unmasked list (first %s segments out of %s):\n%s" % (logging_num_segments, len(binary_list), binary_list[0:logging_num_segments]))
 
     # Dekompression
@@ -1,9 +1,11 @@
 import os
 import sys
+import random
 import optparse
-import Levenshtein
+import numpy as np
 import main_functions as do
 import functions as func
+from concurrent.futures import ProcessPoolExecutor
 
 parser = optparse.OptionParser()
 
@@ -16,12 +18,14 @@ parser.add_option("-f", "--error", metavar=" ", dest="error_type", default="subs
 parser.add_option("-r", "--rscodec",  metavar=" ", dest="rs_codec_value", default=32, help="rs_codec_value", type=int)
 parser.add_option("-c", "--mincodec",  metavar=" ", dest="min_codec_value", default=4, help="min_codec_value", type=int)
 parser.add_option("-s", "--minseg",  metavar=" ", dest="min_segment_length", default=25, help="min_segment_length. Input list in format -s X,Y,Z")
+parser.add_option("-w", "--workers",  metavar=" ", dest="workers", default=1, help="Number of worker processes for the trials, 0 = all cores", type=int)
+parser.add_option("-m", "--memo",  metavar=" ", dest="memo_path", default=None, help="JSON file of the correction memo, loaded before and saved after the run", type=str)
 
 if len(sys.argv) > 1:  # Start in the terminal when arguments are entered
     (options, args) = parser.parse_args()
-    options.min_segment_length = [int(segment) for segment in options.min_segment_length.strip('[]').split(',')]    # Convert input to list
+    options.min_segment_length = [int(segment) for segment in str(options.min_segment_length).strip('[]').split(',')]    # Convert input to list
     print("min_segment_length", options.min_segment_length)
-    options.error_rates = [float(segment) for segment in options.error_rates.strip('[]').split(',')]
+    options.error_rates = [float(segment) for segment in str(options.error_rates).strip('[]').split(',')]
 
 
 else:   # If no arguments were passed from the command line, set the arguments here directly in the code
@@ -35,6 +39,8 @@ else:   # If no arguments were passed from the command line, set the arguments h
     options.rs_codec_value = 32
     options.min_codec_value = 1
     options.min_segment_length = [20]    # [5, 10, 15, 20, 25, 30, 35, 40, 45, 50]
+    options.workers = 1
+    options.memo_path = None
 
 
 #####################
@@ -68,8 +74,12 @@ elif options.use_logo == "short":
 #####################
 ##### Encoding ######
 #####################
-for length in options.min_segment_length:
-
+def encode(length):
+    """
+    Encodes the picture for one minimal segment length and writes the original DNA to a fasta file.
+    :param length: Minimal segment length
+    :return: The DNA (functions.PackedDNA), the DNA length without spacer and the number of DNA segments
+    """
     if options.correction == "RS_segmented_packbits" or options.correction == "DMR_segmented_packbits":
         dna_message_list, binary_segment_list = \
             do.encoding_picture_segmented_packbits(seed, bitlen, segment_length, rs_symbols_percent, options.correction,
@@ -77,7 +87,7 @@ for length in options.min_segment_length:
                                                    logging_filename="length_" + str(length) + "_original_dna_encoding.log", logging_num_elements=100,
                                                    logging_num_segments=10,
                                                    rs_codec_value=options.rs_codec_value, min_codec_value=options.min_codec_value, min_segment_length=length,
-                                                   picture_path=picture_path, picture_type="binary", show_image=False, verbose=True)
+                                                   picture_path=picture_path, picture_type="binary", show_image=False, verbose=True, packed=True)
     else:
         dna_message_list, binary_segment_list = do.encoding_picture(seed, bitlen, segment_length, rs_symbols_percent, options.correction, False,
                                                                     logging_filepath=options.out_path + options.correction + "//",
@@ -85,120 +95,201 @@ for length in options.min_segment_length:
                                                                     logging_num_elements=100, logging_num_segments=10,
                                                                     rs_codec_value=options.rs_codec_value, min_codec_value=options.min_codec_value,
                                                                     min_segment_length=length, picture_path=picture_path, picture_type="binary",
-                                                                    random_mask=True, show_image=False, verbose=True, do_xor=False)
+                                                                    random_mask=True, show_image=False, verbose=True, do_xor=False, packed=True)
 
-    # Calculate length and output with hint + spacer
-    dna = "XXXXXX".join(dna_message_list)
-    dna_length = len(dna) - 6 * (len(dna_message_list) - 1)
+    # Gepackte DNA (2 Bit pro Base), die Segmentgrenzen ersetzen die Spacer
+    dna = dna_message_list
+    dna_length = len(dna)
+    dna_text = dna.to_spacer_string("XXXXXX")
 
     with open(options.out_path + "//" + options.correction + "//" + "length_" + str(length) + "_original_dna.fasta", "w") as outfile:
         if options.correction == "RS" or options.correction == "No":
             outfile.write("Länge der erzeugten DNA: " + str(dna_length) + "\n")
         else:
-            outfile.write("Länge der erzeugten DNA: " + str(dna_length) + " + " + str(len(dna_message_list)-1) + " Spacersequenzen.\n")
+            outfile.write("Länge der erzeugten DNA: " + str(dna_length) + " + " + str(dna.num_segments-1) + " Spacersequenzen.\n")
         outfile.write("Ohne Spacer einzubeziehen ergibt sich eine Nettoinformationsdichte von = " + str((picture_width * picture_height)/dna_length) + "\n")
-        outfile.write("\n".join([dna[n:n + 60] for n in range(0, len(dna), 60)]))
+        outfile.write("\n".join([dna_text[n:n + 60] for n in range(0, len(dna_text), 60)]))
+
+    return dna, dna_length, dna.num_segments
+
+
+###################################
+##### Add Errors and Decoding #####
+###################################
+def trial_seed(length, error, trial):
+    """
+    Deterministic seed of one trial. The seed only depends on the start seed and the parameters of the trial, so the results don't depend on
+    the order in which the trials are run or on the number of worker processes.
+    """
+    return int(np.random.SeedSequence([seed, length, int(round(error * 10000)), trial]).generate_state(1)[0])
+
+
+def run_trial(job):
+    """
+    Runs one trial: error simulation, decoding and edit distance calculation. The trial only writes files with the trial number in their name.
+    The texts for the files shared by all trials of an error rate are returned and written in order by the main process.
+    :param job: Tuple (length, error, trial, dna, dna_length, number of DNA segments)
+    :return: Dictionary with the parameters, seed, file texts and edit distances of the trial
+    """
+    length, error, trial, dna, dna_length, segment_number = job
+    job_seed = trial_seed(length, error, trial)
+    random.seed(job_seed)
+    np.random.seed(job_seed)
+    rng = np.random.default_rng(job_seed)  # Generator für die Fehlersimulation
+
+    loop = True
+    while loop:
+
+        try:
+            ############################
+            ##### Error simulation #####
+            ############################
+            print("Adding errors to sequence")
+            dna_mut = func.PackedDNA.from_segments([])
+            if error == 0.00:
+                dna_mut = dna
+            else:
+                if options.error_type == "all":
+                    # dna_mut = err.binom_mutations(dna[0], subs, ins, dels, binom=False)
+                    dna_mut = func.binom_mutations_with_spacer_ignorance(dna, dna_length, error / 3, error / 3, error / 3, binom=False, rng=rng)
+                elif options.error_type == "subs":
+                    dna_mut = func.binom_mutations_with_spacer_ignorance(dna, dna_length, error, 0, 0, binom=False, rng=rng)
+                elif options.error_type == "ins":
+                    dna_mut = func.binom_mutations_with_spacer_ignorance(dna, dna_length, 0, error, 0, binom=False, rng=rng)
+                elif options.error_type == "del":
+                    dna_mut = func.binom_mutations_with_spacer_ignorance(dna, dna_length, 0, 0, error, binom=False, rng=rng)
+
+
+            # Calculate length and output with hint + spacer
+            dna_mut_length = len(dna_mut)
+
+            if options.correction == "RS" or options.correction == "No":
+                mut_text = "Länge der mutierten DNA: " + str(dna_mut_length) + "\n"
+            else:
+                mut_text = "Länge der mutierten DNA: " + str(dna_mut_length) + " + " + str(segment_number - 1) + " Spacersequenzen.\n"
+            # Strings nur für die fasta Datei (leere Abschnitte entfallen wie nach dem Split an X), dekodiert wird die gepackte DNA
+            mut_text += "%s\n" % dna_mut.drop_empty_segments().to_strings()
+
+
+            ####################
+            ##### Decoding #####
+            ####################
+            # Eigene Logdatei pro Trial, damit parallele Trials nicht in dieselbe Datei schreiben
+            logging_filename = "length_" + str(length) + "_" + options.error_type + "_error-rate_" + str(error) + "_trial_" + str(trial) + ".log"
+
+            if options.correction == "RS_segmented_packbits" or options.correction == "DMR_segmented_packbits":
+                bitseq, picture, _, _ = \
+                    do.picture_decode_segmented_packbits(dna_mut, seed, bitlen, rs_symbols_percent, segment_length, options.correction, True,
+                                                         picture_width, picture_height, options.out_path + options.correction + "//",
+                                                         "length_" + str(length) + "_" + options.error_type +
+                                                         "_error-rate_" + str(error) + "_trial_" + str(trial) + "_decoded_picture",
+                                                         options.out_path + options.correction + "//", logging_filename,
+                                                         logging_num_elements=100, logging_num_segments=10, picture_mode="binary",
+                                                         correction=True, verbose=True)
+
+            else:
+                bitseq, picture = do.picture_decode(dna_mut, seed, bitlen, rs_symbols_percent, segment_length, options.correction, False,
+                                                    picture_width, picture_height, options.out_path + options.correction + "//",
+                                                    "length_" + str(length) + "_" + options.error_type + "_error-rate_" + str(error) +
+                                                    "_trial_" + str(trial) + "_decoded_picture", options.out_path + options.correction + "//",
+                                                    logging_filename, logging_num_elements=100, logging_num_segments=10,
+                                                    rs_codec_value=options.rs_codec_value, min_codec_value=options.min_codec_value,
+                                                    min_segment_length=length, picture_mode="binary", random_mask=True, verbose=True, do_xor=False,
+                                                    correction=True)
+
+            loop = False
+        except:
+            loop = True
 
 
-    ###################################
-    ##### Add Errors and Decoding #####
-    ###################################
-    for error in options.error_rates:
-        for trial in range(options.trials):
+    bitseq_text = "Länge der dekodierten Binärsequenz: " + str(len(bitseq)) + "\n"
+    bitseq_text += "\n".join([bitseq[n:n + picture_width] for n in range(0, len(bitseq), picture_width)])
+    bitseq_text += "\n\n"
+
+    ########################
+    ##### Edit distance ####
+    ########################
+    print("Start Edit Distance calculation: assembled Seq")
+    # load ref pictures binary
+    ROOT_DIR = os.path.abspath(os.curdir)
+    pic_ref = func.bit_array_to_string(func.read_1bit_image_array(ROOT_DIR + picture_path, show_image=False))
+    # Das dekodierte Bild liegt noch im Speicher (gleiches Array wie im geschriebenen PNG), es muss nicht neu eingelesen werden
+    pic_dec = func.bit_array_to_string(func.read_1bit_image_array(picture, show_image=False))
+    # calculation: DNA Segment für Segment an den bekannten Segmentgrenzen, Substitutionen/Insertionen/Deletionen pro Segment
+    edit_scores_dna, segment_errors = func.score_segments(dna, dna_mut, "Encoded & mutated DNA:", as_percent=True)
+    edit_scores_bit = func.score_pairs_batch([(pic_ref, pic_dec, "Encoded & decoded picture")])[0] if pic_ref != bitseq else ("Encoded & decoded picture", 1.0)
+
+    return {"length": length, "error": error, "trial": trial, "seed": job_seed, "mut_text": mut_text, "bitseq_text": bitseq_text,
+            "edit_scores_dna": edit_scores_dna, "edit_scores_bit": edit_scores_bit, "segment_errors": segment_errors.sum(axis=0).tolist(),
+            "memo_entries": func.take_correction_memo_journal()}
+
+
+def init_worker(memo_path):
+    """
+    Initializer of the worker processes: loads the correction memo and records the new correction results, which are returned with the trial
+    results (run_trial) and merged into the memo of the main process.
+    :param memo_path: File path of the memo file or None
+    """
+    if memo_path:
+        func.load_correction_memo(memo_path)
+    func.start_correction_memo_journal()
+
+
+def write_results(results):
+    """
+    Writes the results of all trials in the order length, error rate, trial. The files of an error rate are only written by the main process.
+    In addition, all edit distances are collected in one table (sweep_edit_distances.csv).
+    :param results: List of dictionaries returned by run_trial
+    """
+    results = sorted(results, key=lambda result: (options.min_segment_length.index(result["length"]), options.error_rates.index(result["error"]),
+                                                  result["trial"]))
+
+    for result in results:
+        file_prefix = options.out_path + options.correction + "//" + "length_" + str(result["length"]) + "_" + options.error_type + \
+            "_error-rate_" + str(result["error"])
+
+        with open(file_prefix + "_mut_dna.fasta", "a") as outfile:
+            outfile.write(result["mut_text"])
+
+        with open(file_prefix + "_bitseq.fasta", "a") as outfile:
+            outfile.write(result["bitseq_text"])
+
+        # Edit Add distance and name to file
+        with open(file_prefix + "_edit_distances.txt", "a") as file:
+            file.write("\nTrial: " + str(result["trial"]) + ", " + str(result["edit_scores_dna"]) + ", " + str(result["edit_scores_bit"]))
+
+    with open(options.out_path + options.correction + "//" + "sweep_edit_distances.csv", "w") as file:
+        file.write("length,error_type,error_rate,trial,seed,dna_similarity,picture_similarity,substitutions,insertions,deletions\n")
+        for result in results:
+            file.write(",".join(str(value) for value in [result["length"], options.error_type, result["error"], result["trial"], result["seed"],
+                                                         result["edit_scores_dna"][1], result["edit_scores_bit"][1]] + result["segment_errors"]) + "\n")
+
+
+if __name__ == "__main__":
+    jobs = []
+    for length in options.min_segment_length:
+        dna, dna_length, segment_number = encode(length)
+        for error in options.error_rates:
+            for trial in range(options.trials):
+                jobs.append((length, error, trial, dna, dna_length, segment_number))
+
+    # Korrekturergebnisse früherer Läufe laden
+    if options.memo_path:
+        print("correction memo entries loaded:", func.load_correction_memo(options.memo_path))
+
+    # Alle Trials sind unabhängig voneinander und können auf mehrere Prozesse verteilt werden
+    workers = options.workers if options.workers > 0 else os.cpu_count()
+    if workers == 1:
+        results = [run_trial(job) for job in jobs]
+    else:
+        # jeder Prozess hat ein eigenes Memo, die neuen Ergebnisse kommen mit den Trials zurück und werden hier übernommen
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(options.memo_path,)) as executor:
+            results = list(executor.map(run_trial, jobs))
+    for result in results:
+        func.merge_correction_memo(result.pop("memo_entries"))
+    print("correction memo:", func.correction_memo_stats())
 
-            loop = True
-            while loop:
-
-                try:
-                    ############################
-                    ##### Error simulation #####
-                    ############################
-                    print("Adding errors to sequence")
-                    dna_mut = ""
-                    if error == 0.00:
-                        dna_mut = dna
-                    else:
-                        if options.error_type == "all":
-                            # dna_mut = err.binom_mutations(dna[0], subs, ins, dels, binom=False)
-                            dna_mut = func.binom_mutations_with_spacer_ignorance(dna, dna_length, error / 3, error / 3, error / 3, binom=False)
-                        elif options.error_type == "subs":
-                            dna_mut = func.binom_mutations_with_spacer_ignorance(dna, dna_length, error, 0, 0, binom=False)
-                        elif options.error_type == "ins":
-                            dna_mut = func.binom_mutations_with_spacer_ignorance(dna, dna_length, 0, error, 0, binom=False)
-                        elif options.error_type == "del":
-                            dna_mut = func.binom_mutations_with_spacer_ignorance(dna, dna_length, 0, 0, error, binom=False)
-
-
-                    # Split dna_mut by X so that sections can be decoded
-                    dna_mut_list = dna_mut.split("X")
-                    dna_mut_list = [item for item in dna_mut_list if item != ""]
-
-                    # Calculate length and output with hint + spacer
-                    dna_mut_length = sum(len(item) for item in dna_mut_list)
-
-                    with open(options.out_path + options.correction + "//" + "length_" + str(length) + "_" + options.error_type +
-                              "_error-rate_" + str(error) + "_mut_dna.fasta", "a") as outfile:
-                        if options.correction == "RS" or options.correction == "No":
-                            outfile.write("Länge der mutierten DNA: " + str(dna_mut_length) + "\n")
-                        else:
-                            outfile.write("Länge der mutierten DNA: " + str(dna_mut_length) + " + " + str(len(dna_message_list) - 1) + " Spacersequenzen.\n")
-
-                        outfile.write("%s\n" % dna_mut_list)
-
-
-                    ####################
-                    ##### Decoding #####
-                    ####################
-                    if options.correction == "RS_segmented_packbits" or options.correction == "DMR_segmented_packbits":
-                        bitseq, picture, _, _ = \
-                            do.picture_decode_segmented_packbits(dna_mut_list, seed, bitlen, rs_symbols_percent, segment_length, options.correction, True,
-                                                                 picture_width, picture_height, options.out_path + options.correction + "//",
-                                                                 "length_" + str(length) + "_" + options.error_type +
-                                                                 "_error-rate_" + str(error) + "_trial_" + str(trial) + "_decoded_picture",
-                                                                 options.out_path + options.correction + "//",
-                                                                 "length_" + str(length) + "_" + options.error_type + "_error-rate_" + str(error) + ".log",
-                                                                 logging_num_elements=100, logging_num_segments=10, picture_mode="binary",
-                                                                 correction=True, verbose=True)
-
-                    else:
-                        bitseq, picture = do.picture_decode(dna_mut_list, seed, bitlen, rs_symbols_percent, segment_length, options.correction, False,
-                                                            picture_width, picture_height, options.out_path + options.correction + "//",
-                                                            "length_" + str(length) + "_" + options.error_type + "_error-rate_" + str(error) +
-                                                            "_trial_" + str(trial) + "_decoded_picture", options.out_path + options.correction + "//",
-                                                            "length_" + str(length) + "_" + options.error_type + "_error-rate_" + str(error) + ".log",
-                                                            logging_num_elements=100, logging_num_segments=10, rs_codec_value=options.rs_codec_value,
-                                                            min_codec_value=options.min_codec_value, min_segment_length=length,
-                                                            picture_mode="binary", random_mask=True, verbose=True, do_xor=False,
-                                                            correction=True)
-
-                    loop = False
-                except:
-                    loop = True
-
-
-            with open(options.out_path + options.correction + "//" + "length_" + str(length) + "_" + options.error_type +
-                      "_error-rate_" + str(error) + "_bitseq.fasta", "a") as outfile:
-                outfile.write("Länge der dekodierten Binärsequenz: " + str(len(bitseq)) + "\n")
-                outfile.write("\n".join([bitseq[n:n + picture_width] for n in range(0, len(bitseq), picture_width)]))
-                outfile.write("\n\n")
-
-            ########################
-            ##### Edit distance ####
-            ########################
-            print("Start Edit Distance calculation: assembled Seq")
-            # load ref pictures binary
-            ROOT_DIR = os.path.abspath(os.curdir)
-            pic_ref = func.read_1bit_image(ROOT_DIR + picture_path, show_image=False)
-            pic_ref = "".join([str(bit) for bit in pic_ref])
-            pic_dec = func.read_1bit_image(ROOT_DIR + "//" + options.out_path + options.correction + "//" + "length_" + str(length) + "_" +
-                                           options.error_type + "_error-rate_" + str(error) + "_trial_" + str(trial) + "_decoded_picture.png", show_image=False)
-            pic_dec = "".join([str(bit) for bit in pic_dec])
-            # calculation
-            edit_scores_dna = func.score_pairs_fast([(dna, dna_mut, "Encoded & mutated DNA:")], as_percent=True)
-            edit_scores_bit = func.score_pairs_fast([(pic_ref, pic_dec, "Encoded & decoded picture")])[0] if pic_ref != bitseq else ("Encoded & decoded picture", 1.0)
-
-            # Edit Add distance and name to file
-            with open(options.out_path + options.correction + "//" + "length_" + str(length) + "_" + options.error_type
-                      + "_error-rate_" + str(error) + "_edit_distances.txt", "a") as file:
-                file.write("\nTrial: " + str(trial) + ", " + str(edit_scores_dna[0]) + ", " + str(edit_scores_bit))
+    if options.memo_path:
+        func.save_correction_memo(options.memo_path)
 
+    write_results(results)